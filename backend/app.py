@@ -1,83 +1,454 @@
-from flask import Flask, request, jsonify
-from pymongo import MongoClient
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
 from bson.json_util import dumps
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
 from datetime import datetime
-from datetime import time
+from time import perf_counter
 import os
-import re
-from collections import Counter
+import json
+from eventos import CanalEventos, VigilanteCambios, eventos_a_cambios
+from mensajeria import BandejaSalida, EnviadorTwilio, EnviadorFalso
+from contador import AsignadorIds, VersionesCambios
+from estado_conversacion import EstadoMemoria, EstadoMongo
+from duplicados import DeduplicadorMensajes
+from estadisticas import CacheEstadisticas
+from productos import normalizar_productos, iniciar_migracion_productos
+from metricas import (
+    EscuchaComandosMongo, EnviadorMedido, registro_metricas, registrar_peticion, duracion_mongo, fallos_mongo,
+    duracion_generar_id, duracion_whatsapp, mensajes_bot, mensajes_bot_repetidos, conversaciones_bot
+)
+from menu import PLATOS
+from catalogo import CatalogoMenu, leer_platos
+from consultas import (
+    construir_filtro, construir_proyeccion, leer_since, leer_historico, preparar_listado, paginar, fecha_a_dia,
+    LIMITE_MAXIMO
+)
+from serializacion import TAMANO_LOTE, lista_por_partes, inicio_cambios, fin_cambios
+from bot import procesar_mensaje, respuesta_sin_plazas, mensaje_estado, mensaje_cancelacion
+from archivo import ArchivadorPedidos, PurgadorEliminados
+from resumen import ResumenDiario, CAMPOS_PEDIDO, iniciar_resumen
+from plazas import OcupacionReservas, CAMPOS_PLAZAS, plazas_de
+from lotes import leer_ids, leer_cambios, operaciones_actualizacion, operaciones_borrado, marcas_borrado, resultados
 
 app = Flask(__name__)
 
+# Las peticiones que tarden más de este umbral (en ms) se registran en el log
+UMBRAL_PETICION_LENTA = float(os.environ.get("METRICAS_UMBRAL_LENTO_MS", 500)) / 1000
+
+
+# Con MONGO_CLIENT="mongomock://" el backend funciona en local sin servidor MongoDB
+def crear_cliente_mongo(uri):
+    if uri and uri.startswith("mongomock://"):
+        import mongomock
+        return mongomock.MongoClient()
+    return MongoClient(uri, event_listeners=[EscuchaComandosMongo(duracion_mongo, fallos_mongo)])
+
+
 # Declaración de variables de entorno
-client = MongoClient(os.environ.get("MONGO_CLIENT"))
+client = crear_cliente_mongo(os.environ.get("MONGO_CLIENT"))
 db = client[os.environ.get("MONGO_DB")]
 pedidos_collection = db[os.environ.get("MONGO_PEDIDOS_COLLECTION")]
 contador_collection = db[os.environ.get("MONGO_CONTADOR_COLLECTION")]
+eliminados_collection = db[os.environ.get("MONGO_ELIMINADOS_COLLECTION", "pedidos_eliminados")]
+# Pedidos terminados, movidos fuera de la colección de pedidos por el archivador
+archivo_collection = db[os.environ.get("MONGO_ARCHIVO_COLLECTION", "pedidos_archivo")]
+salida_collection = db[os.environ.get("MONGO_SALIDA_COLLECTION", "mensajes_salida")]
+# Menú en uso, versionado en MongoDB; cada proceso comprueba su versión cada MENU_INTERVALO segundos
+catalogo = CatalogoMenu(
+    db[os.environ.get("MONGO_MENU_COLLECTION", "menu")],
+    PLATOS,
+    intervalo=int(os.environ.get("MENU_INTERVALO", 30))
+)
+# Resumen diario de estadísticas, actualizado en cada escritura de pedidos
+resumen_collection = db[os.environ.get("MONGO_RESUMEN_COLLECTION", "estadisticas_diarias")]
+resumen_diario = ResumenDiario(resumen_collection, catalogo.actual)
+# Plazas de las reservas: como mucho CAPACIDAD_FRANJA personas por franja de media hora. Cada
+# proceso tiene la ocupación en memoria y la recarga cada OCUPACION_INTERVALO segundos.
+ocupacion = OcupacionReservas(
+    db[os.environ.get("MONGO_OCUPACION_COLLECTION", "ocupacion_reservas")],
+    pedidos_collection,
+    capacidad=int(os.environ.get("CAPACIDAD_FRANJA", 40)),
+    intervalo=int(os.environ.get("OCUPACION_INTERVALO", 60))
+)
+
+
+# Índices usados por las consultas del panel, las búsquedas por ID y la sincronización
+def crear_indices():
+    try:
+        pedidos_collection.create_index("id", unique=True)
+        pedidos_collection.create_index([("tipo", 1), ("estado", 1)])
+        pedidos_collection.create_index([("fecha", 1), ("hora", 1)])
+        pedidos_collection.create_index("productos.plato_id")
+        pedidos_collection.create_index("version")
+        eliminados_collection.create_index("version")
+    except Exception as e:
+        print("Error al crear índices:", e)
 
-# --- Funciones de validación ---
-
-# Valida que el nombre introducido contenga solo letras y espacios
-def es_nombre_valido(nombre):
-    return bool(re.match(r"^[A-Za-zÁÉÍÓÚáéíóúÑñ\s]+$", nombre))
-
-
-# Valida que la hora introducida esté en el formato HH:MM
-def es_hora_valida(hora):
-    return bool(re.match(r"^\d{2}:\d{2}$", hora))
 
+crear_indices()
 
-# Valida que la fecha introducida esté en el formato DD-MM-AAAA
-def es_fecha_valida(fecha):
-    return bool(re.match(r"^\d{2}-\d{2}-\d{4}$", fecha))
+# Canal de eventos para los paneles suscritos a /api/pedidos/eventos
+canal_eventos = CanalEventos()
+INTERVALO_LATIDO = int(os.environ.get("EVENTOS_INTERVALO_LATIDO", 15))
 
 
-#Valida que la hora introducida esté dentro del rango de apertura del restaurante
-def hora_en_rango(hora):
-    h = datetime.strptime(hora, "%H:%M").time()
-    return (time(13, 0) <= h < time(16, 0)) or (time(20, 0) <= h < time(23, 0))
+# Generar ID numérico persistente usando base de datos en MongoDB colección "contador".
+# Los IDs se reservan por bloques para no hacer un $inc sobre el contador en cada pedido.
+asignador_ids = AsignadorIds(
+    contador_collection,
+    tamano_bloque=int(os.environ.get("ID_TAMANO_BLOQUE", 20))
+)
 
 
-# Generar ID numérico incremental persistente usando base de datos en MongoDB colección "contador"
 def generar_id_numerico():
-    result = contador_collection.find_one_and_update(
-        {"_id": "contador_pedidos"},
-        {"$inc": {"valor": 1}},
-        upsert=True,
-        return_document=True
-    )
-    return result["valor"]
+    with duracion_generar_id.medir():
+        return asignador_ids.siguiente()
+
+
+# Cada escritura sobre los pedidos recibe una versión global creciente.
+# Los clientes sincronizan pidiendo solo los cambios posteriores a su cursor, que es siempre
+# una versión confirmada (sin escrituras a medias por debajo, ver contador.py).
+versiones = VersionesCambios(
+    contador_collection,
+    db[os.environ.get("MONGO_ESCRITURAS_COLLECTION", "escrituras_en_curso")]
+)
+
+# Los paneles conectados a este proceso se enteran de las escrituras de los demás workers
+# en como mucho EVENTOS_INTERVALO_AVISO segundos (sin esperar al latido)
+vigilante_cambios = VigilanteCambios(
+    canal_eventos,
+    versiones.actual,
+    intervalo=float(os.environ.get("EVENTOS_INTERVALO_AVISO", 1))
+)
+vigilante_cambios.iniciar()
+
+
+# Devuelve los pedidos creados/modificados y los IDs eliminados desde el cursor "since".
+# Con since=0 (o un cursor desconocido) se devuelve la colección completa.
+# Si se indica un filtro, los pedidos modificados que han dejado de cumplirlo se
+# devuelven también como eliminados, para que el cliente los quite de su vista.
+def obtener_cambios(since, filtro=None, proyeccion=None):
+    filtro = filtro or {}
+    cursor, completo, consulta = consulta_cambios(since, filtro)
+    pedidos = list(pedidos_collection.find(consulta, proyeccion or {"_id": 0}))
+    eliminados = [] if completo else eliminados_desde(since, filtro)
+    return {"cursor": cursor, "completo": completo, "pedidos": pedidos, "eliminados": eliminados}
+
+
+# La misma respuesta que obtener_cambios, escrita por partes mientras se leen los pedidos
+# (para el listado con ?since=, que con since=0 es la colección completa)
+def cambios_por_partes(since, filtro=None, proyeccion=None):
+    filtro = filtro or {}
+    cursor, completo, consulta = consulta_cambios(since, filtro)
+    pedidos = pedidos_collection.find(consulta, proyeccion or {"_id": 0}).batch_size(TAMANO_LOTE)
+    yield inicio_cambios(completo)
+    yield from lista_por_partes(pedidos)
+    yield fin_cambios([] if completo else eliminados_desde(since, filtro), cursor)
+
+
+# El cursor de la respuesta es la versión confirmada, leída antes que los pedidos: los que
+# lleguen con una versión mayor se vuelven a enviar en la siguiente consulta, que no pierde
+# ninguno. Un cursor mayor que el contador es de otra base de datos y recibe la colección
+# completa, igual que uno anterior al horizonte de las marcas de borrado (ya se han purgado
+# algunas de las que le faltan).
+def consulta_cambios(since, filtro):
+    actual, horizonte = versiones.leer()
+    cursor = versiones.confirmada(actual)
+    completo = since <= 0 or since > actual or since < horizonte
+    if not completo:
+        cursor = max(cursor, since)
+    consulta = filtro if completo else dict(filtro, version={"$gt": since})
+    return cursor, completo, consulta
+
+
+# IDs eliminados desde "since" y, con filtro, los de los pedidos que han dejado de cumplirlo
+def eliminados_desde(since, filtro):
+    eliminados = [d["id"] for d in eliminados_collection.find({"version": {"$gt": since}}, {"_id": 0, "id": 1})]
+    if filtro:
+        fuera_de_filtro = {"version": {"$gt": since}, "$nor": [filtro]}
+        eliminados += [d["id"] for d in pedidos_collection.find(fuera_de_filtro, {"_id": 0, "id": 1})]
+    return eliminados
+
+
+# El histórico se lista siempre paginado: sin "limite" se devuelve una página de LIMITE_MAXIMO.
+# Una página (como mucho LIMITE_MAXIMO pedidos) se lee entera para calcular el cursor de la
+# siguiente; sin "limite" se devuelve el cursor de MongoDB para escribirlo por partes.
+def listar_pedidos(args, filtro, proyeccion, historico=False):
+    plan = preparar_listado(args, filtro, proyeccion, LIMITE_MAXIMO if historico else 0)
+    coleccion = archivo_collection if historico else pedidos_collection
+    cursor = coleccion.find(plan["consulta"], plan["proyeccion"] or {"_id": 0}).sort(plan["orden"])
+    if plan["limite"]:
+        return paginar(list(cursor.limit(plan["limite"] + 1)), plan)
+    return cursor.batch_size(TAMANO_LOTE), None
+
+
+# Copia del pedido sin el _id de MongoDB, apta para serializar con JSON
+def sin_id(pedido):
+    return {k: v for k, v in pedido.items() if k != "_id"}
+
+
+# Con WHATSAPP_ENVIADOR=falso los mensajes se guardan en memoria en lugar de enviarse a Twilio
+def crear_enviador():
+    if os.environ.get("WHATSAPP_ENVIADOR") == "falso":
+        return EnviadorMedido(EnviadorFalso(), duracion_whatsapp)
+    return EnviadorMedido(EnviadorTwilio(os.environ.get("TWILIO_SID"), os.environ.get("TWILIO_AUTH_TOKEN")),
+                          duracion_whatsapp)
+
+
+bandeja_salida = BandejaSalida(
+    salida_collection,
+    crear_enviador(),
+    trabajadores=int(os.environ.get("WHATSAPP_TRABAJADORES", 2)),
+    ventana_fusion=int(os.environ.get("WHATSAPP_VENTANA_FUSION", 5)),
+    plazo_envio=int(os.environ.get("WHATSAPP_PLAZO_ENVIO", 300))
+)
+bandeja_salida.iniciar()
+
+
+# Encola el mensaje en la bandeja de salida y vuelve enseguida; el envío lo hacen los hilos
+# de la bandeja. Los mensajes con la misma clave pendientes de envío se sustituyen por el último.
+def enviar_mensaje_whatsapp(telefono, mensaje, clave=None):
+    try:
+        bandeja_salida.encolar(telefono, mensaje, clave)
+    except Exception as e:
+        print("Error al encolar mensaje:", e)
 
 
-def enviar_mensaje_whatsapp(telefono, mensaje):
+def enviar_mensajes_whatsapp(mensajes):
     try:
-        account_sid = os.environ.get("TWILIO_SID")
-        auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-        client = Client(account_sid, auth_token)
-        msg = client.messages.create(
-            from_="whatsapp:+14155238886",
-            to=f"whatsapp:{telefono}",
-            body=mensaje
-        )
-        print("Mensaje enviado:", msg.sid)
+        bandeja_salida.encolar_varios(mensajes)
     except Exception as e:
-        print("Error al enviar mensaje:", e)
+        print("Error al encolar mensajes:", e)
+
+
+# Validador HTTP de las respuestas del listado: la versión global de cambios. Mientras no
+# cambie, la misma URL devuelve el mismo contenido y basta con responder 304.
+# La versión se lee antes de consultar los pedidos, así el ETag nunca es más nuevo que los datos.
+# Solo hay ETag cuando la versión está confirmada (ninguna escritura en curso por debajo): con
+# una escritura a medias el contenido aún puede cambiar sin que cambie la versión.
+def etag_pedidos():
+    actual = versiones.actual()
+    if versiones.confirmada(actual) < actual:
+        return None
+    return f"pedidos-{actual}"
+
+
+def respuesta_con_etag(cuerpo, etag, cabeceras=None):
+    respuesta = app.make_response((cuerpo, 200, cabeceras or {}))
+    if etag:
+        respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+# Listado JSON escrito por partes ("partes" es un generador de bytes): la respuesta empieza
+# a enviarse con el primer lote de pedidos
+def respuesta_por_partes(partes, etag, cabeceras=None):
+    respuesta = Response(stream_with_context(partes), mimetype="application/json", headers=cabeceras or {})
+    if etag:
+        respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+def no_modificado(etag):
+    respuesta = Response(status=304)
+    respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+# --- Medición de las peticiones ---
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = perf_counter()
+
+
+# La duración se toma al cerrar la respuesta: los listados se escriben por partes después
+# de salir de la vista, y hasta entonces no se ha leído ni enviado ningún pedido. Los eventos
+# (text/event-stream) se miden solo hasta enviar las cabeceras: la conexión sigue abierta
+# mientras el panel escucha, y su duración no es la de una petición lenta
+@app.after_request
+def registrar_medicion(respuesta):
+    inicio = g.pop("inicio_peticion", None)
+    if inicio is not None:
+        # Se etiqueta con la plantilla de la ruta (/api/pedidos/<int:id_pedido>), no con la URL
+        ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+        metodo, url, estado = request.method, request.full_path.rstrip("?"), respuesta.status_code
+        registrar = lambda: registrar_peticion(metodo, ruta, url, estado, perf_counter() - inicio, UMBRAL_PETICION_LENTA)
+        if respuesta.mimetype == "text/event-stream":
+            registrar()
+        else:
+            respuesta.call_on_close(registrar)
+    return respuesta
+
+
+@app.route("/metrics", methods=["GET"])
+def metricas():
+    return Response(registro_metricas.exportar(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/api/pedidos", methods=["GET"])
 def obtener_pedidos():
-    pedidos = list(pedidos_collection.find())
-    return dumps(pedidos), 200
+    etag = etag_pedidos()
+    if etag and request.if_none_match.contains(etag):
+        return no_modificado(etag)
+    # Sin parámetros se mantiene el listado completo original (sin el _id de MongoDB)
+    if not request.args:
+        pedidos = pedidos_collection.find({}, {"_id": 0}).batch_size(TAMANO_LOTE)
+        return respuesta_por_partes(lista_por_partes(pedidos), etag)
+    try:
+        filtro = construir_filtro(request.args)
+        proyeccion = construir_proyeccion(request.args)
+        historico = leer_historico(request.args)
+        since = leer_since(request.args)
+        if since is not None:
+            return respuesta_por_partes(cambios_por_partes(since, filtro, proyeccion), etag)
+        if historico is not None:
+            filtro = dict(filtro, **historico)
+        pedidos, siguiente = listar_pedidos(request.args, filtro, proyeccion, historico is not None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # El cursor de la página siguiente va en una cabecera para que el cuerpo siga siendo la lista
+    cabeceras = {"X-Siguiente-Pagina": siguiente} if siguiente else {}
+    return respuesta_por_partes(lista_por_partes(pedidos), etag, cabeceras)
+
+
+# Los nombres de los platos son los del menú en uso
+def estadisticas_resumen(desde, hasta):
+    return resumen_diario.leer(desde, hasta)
+
+
+# Las estadísticas en caché y su ETag van por la versión confirmada, no por el contador:
+# cada escritura actualiza el resumen diario dentro de su versiones.escritura(), así que
+# una versión confirmada ya está sumada en el resumen. Con el contador, una consulta entre
+# el $inc y la escritura del resumen guardaría las estadísticas anteriores con la versión nueva.
+cache_estadisticas = CacheEstadisticas(estadisticas_resumen, versiones.confirmada)
+
+
+# Estadísticas agregadas en el servidor (reservas vs pedidos, unidades por plato y
+# pedidos por franja horaria), opcionalmente entre las fechas "desde" y "hasta".
+# Como el listado, lleva como ETag la versión de cambios para poder consultarse con If-None-Match.
+@app.route("/api/estadisticas", methods=["GET"])
+def obtener_estadisticas():
+    try:
+        desde = fecha_a_dia(request.args.get("desde"))
+        hasta = fecha_a_dia(request.args.get("hasta"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    version = versiones.confirmada()
+    etag = f"estadisticas-{version}"
+    if request.if_none_match.contains(etag):
+        return no_modificado(etag)
+    return respuesta_con_etag(jsonify(cache_estadisticas.obtener(desde, hasta, version)), etag)
+
+
+# Menú en uso: {"version": 3, "platos": [{"id": "1", "nombre": "..."}, ...]}. El ETag es la
+# versión del menú, así que los paneles lo revalidan con If-None-Match y un 304 sin cuerpo.
+@app.route("/api/menu", methods=["GET"])
+def obtener_menu():
+    menu = catalogo.actual()
+    if request.if_none_match.contains(menu.etag):
+        return no_modificado(menu.etag)
+    return respuesta_con_etag(menu.json, menu.etag, {"Content-Type": "application/json"})
+
+
+# Sustituye el menú completo y crea una nueva versión. Los pedidos guardan el plato_id, así
+# que no conviene reutilizar el id de un plato retirado para otro distinto.
+@app.route("/api/menu", methods=["PUT"])
+def actualizar_menu():
+    try:
+        platos = leer_platos(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    menu = catalogo.guardar(platos)
+    # Nueva versión de cambios para que las estadísticas en caché se recalculen con los nombres nuevos
+    versiones.siguiente()
+    return respuesta_con_etag(menu.json, menu.etag, {"Content-Type": "application/json"})
+
+
+def formatear_evento_sse(cambios):
+    return f"id: {cambios['cursor']}\nevent: cambios\ndata: {json.dumps(cambios)}\n\n"
+
+
+# Flujo Server-Sent Events con los cambios de pedidos. Al conectar (o reconectar con
+# Last-Event-ID / ?since=) se envían primero los cambios pendientes desde ese cursor.
+# Los cambios de otros procesos del backend se consultan en la base de datos cuando avisa
+# vigilante_cambios, y en cualquier caso si no llega ningún evento local durante
+# INTERVALO_LATIDO segundos. Los eventos locales también se descartan, y se consulta la
+# base de datos, si dejan huecos tras el cursor.
+# Admite los mismos filtros y proyección que el listado; en ese caso cada evento local
+# solo sirve de aviso y los cambios se consultan filtrados en la base de datos.
+@app.route("/api/pedidos/eventos", methods=["GET"])
+def eventos_pedidos():
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("since", 0))
+    except ValueError:
+        return jsonify({"error": "El cursor debe ser un número entero"}), 400
+    try:
+        filtro = construir_filtro(request.args)
+        proyeccion = construir_proyeccion(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generar():
+        cursor = since
+        secuencia = canal_eventos.secuencia_actual()
+        yield "retry: 3000\n\n"
+        cambios = obtener_cambios(cursor, filtro, proyeccion)
+        cursor = cambios["cursor"]
+        yield formatear_evento_sse(cambios)
+        while True:
+            secuencia, eventos = canal_eventos.esperar(secuencia, INTERVALO_LATIDO)
+            cambios = None
+            if eventos and not filtro and not proyeccion:
+                cambios = eventos_a_cambios(eventos, cursor)
+            if cambios is None:
+                cambios = obtener_cambios(cursor, filtro, proyeccion)
+            if not cambios["pedidos"] and not cambios["eliminados"] and not cambios["completo"]:
+                cursor = cambios["cursor"]
+                yield ": latido\n\n"
+                continue
+            cursor = cambios["cursor"]
+            yield formatear_evento_sse(cambios)
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Respuesta a una reserva que no cabe en su franja, con las horas libres más cercanas del día
+def sin_plazas(pedido):
+    return jsonify({
+        "error": f"No quedan plazas para {pedido.get('personas')} personas el {pedido.get('fecha')} a las {pedido.get('hora')}",
+        "sugerencias": ocupacion.sugerencias(pedido.get("fecha"), pedido.get("personas"), pedido.get("hora"))
+    }), 409
 
 
 @app.route("/api/pedidos", methods=["POST"])
 def crear_pedido():
     data = request.get_json()
+    # Las plazas se ocupan antes de guardar la reserva, con una escritura condicional
+    if not ocupacion.reservar(data):
+        return sin_plazas(data)
     data["id"] = generar_id_numerico()
     data["timestamp"] = datetime.now().isoformat()
-    pedidos_collection.insert_one(data)
+    if "productos" in data:
+        data["productos"] = normalizar_productos(data["productos"], catalogo.actual().platos_por_nombre)
+    try:
+        with versiones.escritura() as version:
+            data["version"] = version
+            pedidos_collection.insert_one(data)
+            resumen_diario.registrar(despues=data)
+    except Exception:
+        ocupacion.liberar(data)
+        raise
+    data = sin_id(data)
+    canal_eventos.publicar_pedido(data)
     return jsonify({"mensaje": "Pedido creado", "pedido": data}), 201
 
 
@@ -87,23 +458,44 @@ def actualizar_pedido(id_pedido):
     datos["timestamp"] = datetime.now().isoformat()
     if "_id" in datos:
         del datos["_id"]
-    resultado = pedidos_collection.find_one_and_update(
-        {"id": id_pedido},
-        {"$set": datos},
-        return_document=True
-    )
-    if resultado:
+    # Los clientes antiguos aún pueden mandar los productos como texto "Nombre (xN)"
+    if "productos" in datos:
+        datos["productos"] = normalizar_productos(datos["productos"], catalogo.actual().platos_por_nombre)
+    # Si cambian las plazas de una reserva, se ocupan las nuevas antes de guardar el cambio, y
+    # el cambio solo se guarda si la reserva sigue como se ha leído (si no, se deshace)
+    filtro = {"id": id_pedido}
+    actual = nuevo = None
+    if any(campo in datos for campo in CAMPOS_PLAZAS):
+        actual = pedidos_collection.find_one(filtro, {"_id": 0, **{campo: 1 for campo in CAMPOS_PLAZAS}})
+        nuevo = dict(actual or {}, **datos)
+        if actual is None or plazas_de(actual) == plazas_de(nuevo):
+            actual = None
+        elif not ocupacion.cambiar(actual, nuevo):
+            return sin_plazas(nuevo)
+        else:
+            filtro.update({campo: actual.get(campo) for campo in CAMPOS_PLAZAS})
+    # Se lee el pedido de antes del cambio para actualizar el resumen diario
+    with versiones.escritura() as version:
+        datos["version"] = version
+        anterior = pedidos_collection.find_one_and_update(
+            filtro,
+            {"$set": datos},
+            return_document=ReturnDocument.BEFORE
+        )
+        if anterior:
+            resumen_diario.registrar(anterior, dict(anterior, **datos))
+    if actual is not None and anterior is None:
+        ocupacion.cambiar(nuevo, actual, forzar=True)
+        if pedidos_collection.find_one({"id": id_pedido}, {"_id": 1}):
+            return jsonify({"error": "La reserva ha cambiado mientras se editaba; vuelve a intentarlo"}), 409
+    if anterior:
+        resultado = dict(anterior, **datos)
+        canal_eventos.publicar_pedido(sin_id(resultado))
         # Enviar mensaje si se actualizó el estado
         if "estado" in datos and "telefono" in resultado:
-            nombre = resultado.get("nombre", "")
-            mensaje = {
-                "pendiente": f"🕒 Hola {nombre}, tu pedido ha sido recibido. ¡Estamos preparando todo para ti!\n\n– Trattoria Luna 🍝",
-                "en_preparacion": f"👨‍🍳 {nombre}, estamos cocinando tu pedido. ¡Ya casi está listo!\n\n– Trattoria Luna 🍝",
-                "preparado": f"✅ ¡{nombre}, tu pedido ya está listo para recoger! 🍽️\n\n– Trattoria Luna 🍝",
-                "entregado": f"🚚 Pedido entregado, {nombre}. ¡Gracias por elegirnos! 😄\n\n– Trattoria Luna 🍝"
-            }.get(datos["estado"], None)
+            mensaje = mensaje_estado(resultado.get("nombre", ""), datos["estado"])
             if mensaje:
-                enviar_mensaje_whatsapp(resultado["telefono"], mensaje)
+                enviar_mensaje_whatsapp(resultado["telefono"], mensaje, clave=f"pedido:{id_pedido}")
         return app.response_class(
             response=dumps({"mensaje": "Pedido actualizado", "pedido": resultado}),
             status=200,
@@ -117,179 +509,223 @@ def eliminar_pedido(id_pedido):
     pedido = pedidos_collection.find_one({"id": id_pedido})
     if pedido:
         telefono = pedido.get("telefono")
-        tipo = pedido.get("tipo")
-        mensaje = "🛑 Tu reserva ha sido cancelada." if tipo == "reserva" else "🛑 Tu pedido ha sido cancelado."
         if telefono:
-            enviar_mensaje_whatsapp(telefono, mensaje)
-        pedidos_collection.delete_one({"id": id_pedido})
+            enviar_mensaje_whatsapp(telefono, mensaje_cancelacion(pedido.get("tipo")), clave=f"pedido:{id_pedido}")
+        if pedidos_collection.delete_one({"id": id_pedido}).deleted_count:
+            resumen_diario.registrar(antes=pedido)
+            ocupacion.liberar(pedido)
+        # Marca de borrado para que los clientes sincronizados eliminen su copia local
+        with versiones.escritura() as version:
+            eliminados_collection.insert_one({
+                "id": id_pedido,
+                "version": version,
+                "timestamp": datetime.now().isoformat()
+            })
+        canal_eventos.publicar_eliminado(id_pedido, version)
         return jsonify({"mensaje": "Pedido eliminado"}), 200
     return jsonify({"error": "Pedido no encontrado"}), 404
 
 
-# Variables globales para el estado del usuario
-estado_usuario = {}
+# Cambia los mismos campos (p. ej. {"estado": "entregado"}) en varios pedidos con una sola
+# escritura. Cada pedido lleva su propia versión; los que ya no existen se indican en la respuesta.
+@app.route("/api/pedidos/bulk", methods=["PATCH"])
+def actualizar_pedidos():
+    datos = request.get_json(silent=True)
+    try:
+        ids = leer_ids(datos)
+        cambios = leer_cambios(datos, catalogo.actual().platos_por_nombre)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    anteriores = {p["id"]: p for p in pedidos_collection.find({"id": {"$in": ids}}, dict(CAMPOS_PEDIDO, id=1))}
+    # Las plazas de cada reserva se comprueban al cambiarla con PUT, de una en una
+    if any(campo in cambios for campo in CAMPOS_PLAZAS) and (
+            cambios.get("tipo") == "reserva" or any(p.get("tipo") == "reserva" for p in anteriores.values())):
+        return jsonify({"error": "La fecha, la hora y las personas de una reserva se cambian de una en una"}), 400
+    encontrados = list(anteriores)
+    actualizados = []
+    if encontrados:
+        with versiones.escritura(len(encontrados)) as version:
+            operaciones, versiones_lote = operaciones_actualizacion(
+                encontrados, cambios, version, datetime.now().isoformat())
+            try:
+                pedidos_collection.bulk_write(operaciones, ordered=True)
+            except BulkWriteError as e:
+                print("Error en la actualización en lote:", e.details.get("writeErrors"))
+            # Solo cuentan como actualizados los pedidos que tienen la versión de este lote
+            actualizados = [p for p in pedidos_collection.find({"id": {"$in": encontrados}}, {"_id": 0})
+                            if p.get("version") == versiones_lote[p["id"]]]
+            resumen_diario.registrar_varios([(anteriores[p["id"]], p) for p in actualizados])
+        for pedido in actualizados:
+            canal_eventos.publicar_pedido(pedido)
+        if "estado" in cambios:
+            avisos = [(p["telefono"], mensaje_estado(p.get("nombre", ""), cambios["estado"]), f"pedido:{p['id']}")
+                      for p in actualizados if "telefono" in p]
+            enviar_mensajes_whatsapp([a for a in avisos if a[1]])
+    return jsonify({
+        "mensaje": f"{len(actualizados)} pedidos actualizados",
+        "resultados": resultados(ids, {p["id"] for p in actualizados}, "actualizado")
+    }), 200
+
+
+@app.route("/api/pedidos/bulk", methods=["DELETE"])
+def eliminar_pedidos():
+    datos = request.get_json(silent=True)
+    try:
+        ids = leer_ids(datos)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    pedidos = list(pedidos_collection.find({"id": {"$in": ids}}, dict(CAMPOS_PEDIDO, id=1, telefono=1, personas=1)))
+    eliminados = []
+    if pedidos:
+        try:
+            pedidos_collection.bulk_write(operaciones_borrado([p["id"] for p in pedidos]), ordered=False)
+        except BulkWriteError as e:
+            print("Error en el borrado en lote:", e.details.get("writeErrors"))
+        restantes = {p["id"] for p in pedidos_collection.find({"id": {"$in": [p["id"] for p in pedidos]}}, {"id": 1})}
+        eliminados = [p for p in pedidos if p["id"] not in restantes]
+    if eliminados:
+        with versiones.escritura(len(eliminados)) as version:
+            marcas = marcas_borrado([p["id"] for p in eliminados], version, datetime.now().isoformat())
+            eliminados_collection.insert_many(marcas)
+            resumen_diario.registrar_varios([(p, None) for p in eliminados])
+        for pedido in eliminados:
+            ocupacion.liberar(pedido)
+        for marca in marcas:
+            canal_eventos.publicar_eliminado(marca["id"], marca["version"])
+        enviar_mensajes_whatsapp([(p["telefono"], mensaje_cancelacion(p.get("tipo")), f"pedido:{p['id']}")
+                                  for p in eliminados if p.get("telefono")])
+    return jsonify({
+        "mensaje": f"{len(eliminados)} pedidos eliminados",
+        "resultados": resultados(ids, {p["id"] for p in eliminados}, "eliminado")
+    }), 200
+
+
+# Estado de las conversaciones del bot. En memoria sirve para un solo proceso; con
+# ESTADO_CONVERSACION=mongo se comparte entre varios procesos del backend.
+def crear_almacen_estado():
+    ttl = int(os.environ.get("CONVERSACION_TTL", 1800))
+    if os.environ.get("ESTADO_CONVERSACION") == "mongo":
+        coleccion = db[os.environ.get("MONGO_CONVERSACIONES_COLLECTION", "conversaciones")]
+        return EstadoMongo(coleccion, ttl=ttl)
+    return EstadoMemoria(capacidad=int(os.environ.get("CONVERSACION_CAPACIDAD", 1000)), ttl=ttl)
+
+
+estado_usuario = crear_almacen_estado()
+
+
+# Respuestas ya dadas en /bot por MessageSid, para los reintentos de Twilio. Con
+# ESTADO_CONVERSACION=mongo se comparten entre procesos, igual que las conversaciones.
+def crear_deduplicador():
+    coleccion = None
+    if os.environ.get("ESTADO_CONVERSACION") == "mongo":
+        coleccion = db[os.environ.get("MONGO_MENSAJES_BOT_COLLECTION", "mensajes_bot")]
+    return DeduplicadorMensajes(
+        capacidad=int(os.environ.get("BOT_DUPLICADOS_CAPACIDAD", 5000)),
+        ttl=int(os.environ.get("BOT_DUPLICADOS_TTL", 3600)),
+        coleccion=coleccion
+    )
+
 
-# Lista de platos del menú
-PLATOS = {
-    "1": "Spaghetti alla Carbonara",
-    "2": "Pasta al Pomodoro",
-    "3": "Fettuccine Alfredo",
-    "4": "Penne al Pesto con Pollo",
-    "5": "Pizza Margherita",
-    "6": "Pizza Prosciutto e Funghi",
-    "7": "Lasagna Tradicional",
-    "8": "Risotto ai Frutti di Mare",
-    "9": "Ensalada Caprese",
-    "10": "Saltimbocca alla Romana"
-}
-LISTADO_PRODUCTOS = "\n".join([f"{n}. {nombre}" for n, nombre in PLATOS.items()])
+mensajes_recibidos = crear_deduplicador()
 
 
+# Un reintento de Twilio (mismo MessageSid) recibe el TwiML de la primera entrega sin
+# volver a pasar por el bot: no se crean pedidos duplicados
 @app.route('/bot', methods=['POST'])
 def bot():
-    from_numero = request.form.get("From", "").replace("whatsapp:", "")
-    mensaje = request.form.get("Body", "").strip().lower()
+    sid = request.form.get("MessageSid")
+    if sid:
+        repetida = mensajes_recibidos.reservar(sid)
+        if repetida is not None:
+            mensajes_bot_repetidos.incrementar()
+            return repetida
+    try:
+        respuesta = atender_mensaje_bot(request.form)
+    except Exception:
+        if sid:
+            mensajes_recibidos.liberar(sid)
+        raise
+    if sid:
+        mensajes_recibidos.completar(sid, respuesta)
+    return respuesta
+
+
+def atender_mensaje_bot(formulario):
+    from_numero = formulario.get("From", "").replace("whatsapp:", "")
+    mensaje = formulario.get("Body", "").strip().lower()
     respuesta = MessagingResponse()
-    msg = respuesta.message()
-
-    if from_numero not in estado_usuario:
-        estado_usuario[from_numero] = {"fase": "esperando_tipo"}
-
-    usuario = estado_usuario[from_numero]
-
-    if "hola" in mensaje or "buenos días" in mensaje or "buenas tardes" in mensaje or "buenas noches" in mensaje:
-        msg.body("👋 ¡Hola! Ha contactado con la Trattoria Luna." +
-                 "\nEstamos encantados de atenderle." +
-                 "\nNuestro horario de apertura es: 13:00 a 16:00 y de 20:00 a 23:00" +
-                 "\n\n¿Desea hacer una *reserva* o un *pedido para llevar*?")
-        return str(respuesta)
-
-    if "menu" in mensaje or "menú" in mensaje:
-        msg.body("🇮🇹 Menú del Día – escriba *pedido* o *reserva* para comenzar:\n\n" + LISTADO_PRODUCTOS)
-        return str(respuesta)
-
-    # Inicializar el estado del usuario si no existe
-    if "fase" not in usuario:
-        usuario["fase"] = "esperando_tipo"
-
-    # Esperando el tipo de reserva o pedido para llevar
-    if usuario["fase"] == "esperando_tipo":
-        if "reserva" in mensaje:
-            usuario["tipo"] = "reserva"
-        elif "llevar" in mensaje or "pedido" in mensaje:
-            usuario["tipo"] = "pedido_para_llevar"
-        else:
-            msg.body("¿Desea hacer una *reserva* o un *pedido para llevar*?")
-            return str(respuesta)
-        usuario["fase"] = "esperando_nombre"
-        msg.body("✏️ Por favor, escriba *solamente su nombre completo*, (Ej: Juan Pérez).")
-
-    elif usuario["fase"] == "esperando_nombre":
-        if not es_nombre_valido(mensaje):
-            msg.body("❌ El nombre no debe contener números ni caracteres especiales. Ejemplo: Juan Pérez")
-            return str(respuesta)
-        usuario["nombre"] = mensaje.title()
-        if usuario["tipo"] == "reserva":
-            usuario["fase"] = "esperando_personas"
-            msg.body("👥 ¿Para cuántas personas es la reserva?")
-        else:
-            usuario["fase"] = "esperando_hora"
-            msg.body(
-                "🕒 ¿A qué hora deseas recoger tu pedido? (Ej: 14:00) \n\nNuestro horario es de 13:00 a 16:00 y de 20:00 a 23:00")
 
-    elif usuario["fase"] == "esperando_personas":
-        try:
-            usuario["personas"] = int(mensaje)
-            usuario["fase"] = "esperando_fecha"
-            msg.body("📅 ¿Para qué fecha deseas reservar? (Ej: 01-01-2025)")
-        except ValueError:
-            msg.body("❌ Por favor, escribe solo el número de personas. (Ej: 3)")
-
-
-    elif usuario["fase"] == "esperando_fecha":
-        if not es_fecha_valida(mensaje):
-            msg.body("❌ La fecha debe tener el formato DD-MM-AAAA. Ejemplo: 01-01-2025")
-            return str(respuesta)
-        fecha_ingresada = datetime.strptime(mensaje, "%d-%m-%Y").date()
-        if fecha_ingresada < datetime.now().date():
-            msg.body("❌ La fecha no puede ser anterior a hoy. Por favor, ingresa una fecha válida.")
-            return str(respuesta)
-        usuario["fecha"] = mensaje
-        usuario["fase"] = "esperando_hora"
-        msg.body("🕒 ¿A qué hora deseas reservar mesa? (Ej: 14:00)")
-
-    elif usuario["fase"] == "esperando_hora":
-        if not es_hora_valida(mensaje):
-            msg.body("❌ La hora debe tener el formato HH:MM. Ejemplo: 14:00")
-            return str(respuesta)
-        if usuario.get("fecha") == datetime.now().strftime("%d-%m-%Y"):
-            hora_ingresada = datetime.strptime(mensaje, "%H:%M").time()
-            if hora_ingresada <= datetime.now().time():
-                msg.body("❌ La hora debe ser posterior a la actual.")
-                return str(respuesta)
-        if not hora_en_rango(mensaje):
-            msg.body("❌ Solo aceptamos reservas/pedidos entre 13:00-16:00 y 20:00-23:00.")
-            return str(respuesta)
-        usuario["hora"] = mensaje
-
-        #Si es una reserva, la guardamos ya en la base de datos ya que no requiere productos
-        if usuario["tipo"] == "reserva":
-            payload = {
-                "id": generar_id_numerico(),
-                "telefono": from_numero,
-                "tipo": usuario["tipo"],
-                "nombre": usuario["nombre"],
-                "fecha": usuario["fecha"],
-                "personas": usuario["personas"],
-                "hora": usuario["hora"],
-                "productos": [],
-                "timestamp": datetime.now().isoformat()
-            }
-            pedidos_collection.insert_one(payload)
-            msg.body(
-                f"✅ ¡Reserva confirmada!\n\n"
-                f"📌 Nombre: {usuario['nombre']}\n"
-                f"📅 Fecha: {usuario['fecha']}\n"
-                f"👥 Personas: {usuario['personas']}\n"
-                f"🕒 Hora: {usuario['hora']}"
-            )
-            del estado_usuario[from_numero]
-        else:
-            usuario["fase"] = "esperando_productos"
-            msg.body(
-                "📝 Escriba los *números* de los productos que desea, separados por comas.\n"
-                "*Ej: 1, 2, 2, 5*\n\n" + LISTADO_PRODUCTOS
-            )
-
-    elif usuario["fase"] == "esperando_productos":
-        numeros = [n.strip() for n in mensaje.split(",")]
-        cantidades = Counter(numeros)
-        productos = [f"{PLATOS.get(n)} (x{cant})" for n, cant in cantidades.items() if PLATOS.get(n)]
-        usuario["productos"] = productos
-        payload = {
-            "id": generar_id_numerico(),
-            "telefono": from_numero,
-            "tipo": usuario["tipo"],
-            "nombre": usuario["nombre"],
-            "hora": usuario["hora"],
-            "productos": usuario["productos"],
-            "timestamp": datetime.now().isoformat(),
-            "estado": "pendiente"
-        }
-        pedidos_collection.insert_one(payload)
-        msg.body(
-            f"✅ ¡Pedido para llevar confirmado!\n\n"
-            f"📌 Nombre: {usuario['nombre']}\n"
-            f"🕒 Hora de recogida: {usuario['hora']}\n"
-            f"🍽️ Productos:\n- " + "\n- ".join(usuario["productos"])
-        )
-        del estado_usuario[from_numero]
+    usuario = estado_usuario.obtener(from_numero) or {"fase": "esperando_tipo"}
+    mensajes_bot.incrementar(fase=usuario.get("fase", "esperando_tipo"))
 
-    else:
-        msg.body("❓ No entendí tu mensaje. Por favor, escribe 'hola' para comenzar de nuevo.")
-        del estado_usuario[from_numero]
+    estado_anterior = dict(usuario)
+    texto, accion, usuario, pedido = procesar_mensaje(usuario, mensaje, from_numero, menu=catalogo.actual(),
+                                                      plazas=ocupacion)
+
+    # La hora estaba libre en la ocupación en memoria, pero otra reserva puede haber ocupado
+    # antes las últimas plazas: se vuelve a preguntar la hora con las que siguen libres
+    if pedido is not None and not ocupacion.reservar(pedido):
+        texto, usuario = respuesta_sin_plazas(estado_anterior, pedido["hora"], ocupacion)
+        accion, pedido = "guardar", None
+
+    # Reserva o pedido confirmado: se guarda con su ID y versión y se avisa a los paneles
+    if pedido is not None:
+        try:
+            pedido = {"id": generar_id_numerico(), **pedido}
+            with versiones.escritura() as version:
+                pedido["version"] = version
+                pedidos_collection.insert_one(pedido)
+                resumen_diario.registrar(despues=pedido)
+        except Exception:
+            # Igual que en crear_pedido: si no se guarda, se liberan las plazas ocupadas
+            ocupacion.liberar(pedido)
+            raise
+        canal_eventos.publicar_pedido(sin_id(pedido))
+        conversaciones_bot.incrementar(tipo=pedido["tipo"])
+
+    respuesta.message().body(texto)
+
+    # Las conversaciones terminadas se borran; el resto se guarda con la fase actualizada
+    if accion == "eliminar":
+        estado_usuario.eliminar(from_numero)
+    elif accion == "guardar":
+        estado_usuario.guardar(from_numero, usuario)
     return str(respuesta)
 
 
+# Convierte en segundo plano los pedidos antiguos con productos en texto
+iniciar_migracion_productos(pedidos_collection, catalogo.actual().platos_por_nombre, versiones)
+
+# Mueve cada ARCHIVO_INTERVALO segundos los pedidos terminados a la colección de archivo
+# (0 lo desactiva). Los entregados esperan ARCHIVO_ESPERA segundos por si se corrige el estado.
+archivador = ArchivadorPedidos(
+    pedidos_collection,
+    archivo_collection,
+    eliminados_collection,
+    versiones,
+    canal_eventos.publicar_eliminado,
+    intervalo=int(os.environ.get("ARCHIVO_INTERVALO", 600)),
+    espera=int(os.environ.get("ARCHIVO_ESPERA", 3600))
+)
+archivador.iniciar()
+
+# Borra cada ELIMINADOS_INTERVALO segundos las marcas de borrado de hace más de
+# ELIMINADOS_RETENCION días; los paneles con un cursor anterior reciben la lista completa
+purgador_eliminados = PurgadorEliminados(
+    eliminados_collection,
+    versiones,
+    retencion=int(os.environ.get("ELIMINADOS_RETENCION", 7)) * 24 * 3600,
+    intervalo=int(os.environ.get("ELIMINADOS_INTERVALO", 3600))
+)
+purgador_eliminados.iniciar()
+
+# Carga la ocupación de las reservas (calculándola la primera vez desde las reservas guardadas)
+# y la recarga cada OCUPACION_INTERVALO segundos con las reservas de los demás procesos
+ocupacion.iniciar()
+
+# Construye el resumen diario si aún no existe (primer arranque con pedidos ya guardados)
+iniciar_resumen(resumen_diario, [pedidos_collection, archivo_collection])
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), threaded=True)
@@ -0,0 +1,204 @@
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import DeleteOne
+from pymongo.errors import BulkWriteError
+
+from lotes import marcas_borrado
+
+# Archivo de pedidos terminados. La colección de pedidos solo guarda los pedidos vivos; los
+# pedidos para llevar entregados y las reservas de días pasados se mueven a una colección de
+# archivo particionada por día: cada pedido archivado lleva el campo "dia" (AAAA-MM-DD) y la
+# colección tiene un índice por día, así las consultas del histórico por rango de días solo
+# leen esos días. El histórico se consulta con GET /api/pedidos?historico=1.
+
+
+# Día AAAA-MM-DD de una fecha DD-MM-AAAA (None si no es válida)
+def dia_de_fecha(fecha):
+    try:
+        return datetime.strptime(fecha, "%d-%m-%Y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+# Día del pedido, igual que en las estadísticas: su "fecha" y, si no tiene, el del timestamp
+def dia_pedido(pedido):
+    return dia_de_fecha(pedido.get("fecha")) or str(pedido.get("timestamp", ""))[:10]
+
+
+# Si el pedido ya se puede archivar: pedido para llevar entregado hace más de "espera"
+# segundos (por si se corrige el estado) o reserva de un día anterior a hoy
+def esta_terminado(pedido, ahora, espera):
+    if pedido.get("tipo") == "pedido_para_llevar":
+        limite = (ahora - timedelta(seconds=espera)).isoformat()
+        return pedido.get("estado") == "entregado" and str(pedido.get("timestamp", "")) < limite
+    if pedido.get("tipo") == "reserva":
+        dia = dia_de_fecha(pedido.get("fecha"))
+        return bool(dia) and dia < ahora.strftime("%Y-%m-%d")
+    return False
+
+
+# Copia del pedido tal como se guarda en el archivo
+def copia_archivada(pedido, ahora):
+    return dict(pedido, dia=dia_pedido(pedido), archivado=ahora.isoformat())
+
+
+# Mueve al archivo por lotes los pedidos terminados. Cada lote se copia al archivo y solo
+# después se borra de la colección de pedidos, y el borrado es condicional a la versión
+# copiada: si el pedido cambia mientras tanto (p. ej. vuelve a "preparado") se queda en la
+# colección de pedidos y su copia se descarta. Los pedidos archivados dejan una marca de
+# borrado (con "archivado") para que los paneles sincronizados los quiten de su lista.
+# Si se interrumpe a medias, la siguiente pasada reemplaza las copias que ya estaban.
+class ArchivadorPedidos:
+    def __init__(self, pedidos, archivo, eliminados, versiones, publicar_eliminado=None,
+                 intervalo=600, espera=3600, lote=500):
+        self.pedidos = pedidos
+        self.archivo = archivo
+        self.eliminados = eliminados
+        self.versiones = versiones
+        self.publicar_eliminado = publicar_eliminado
+        self.intervalo = intervalo
+        self.espera = espera
+        self.lote = lote
+        self.detenido = threading.Event()
+        self.hilo = None
+        self.crear_indices()
+
+    def crear_indices(self):
+        try:
+            self.archivo.create_index("id", unique=True)
+            self.archivo.create_index([("dia", 1), ("hora", 1)])
+        except Exception as e:
+            print("Error al crear índices del archivo:", e)
+
+    # IDs de pedidos terminados (esta_terminado). La fecha de las reservas es DD-MM-AAAA y
+    # no se puede comparar en la consulta; se comprueba aquí, solo con los campos necesarios.
+    def candidatos(self, ahora):
+        limite = (ahora - timedelta(seconds=self.espera)).isoformat()
+        ids = [p["id"] for p in self.pedidos.find(
+            {"tipo": "pedido_para_llevar", "estado": "entregado", "timestamp": {"$lt": limite}},
+            {"_id": 0, "id": 1}
+        ).limit(self.lote)]
+        for reserva in self.pedidos.find({"tipo": "reserva"}, {"_id": 0, "id": 1, "tipo": 1, "fecha": 1}):
+            if len(ids) >= self.lote:
+                break
+            if esta_terminado(reserva, ahora, self.espera):
+                ids.append(reserva["id"])
+        return ids
+
+    def copiar(self, pedidos, ahora):
+        copias = [copia_archivada(p, ahora) for p in pedidos]
+        try:
+            self.archivo.insert_many(copias, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                copia = copias[error["index"]]
+                copia.pop("_id", None)
+                self.archivo.replace_one({"id": copia["id"]}, copia)
+
+    # Archiva los pedidos con esos IDs y devuelve los IDs archivados
+    def archivar(self, ids, ahora=None):
+        ahora = ahora or datetime.now()
+        pedidos = list(self.pedidos.find({"id": {"$in": ids}}, {"_id": 0}))
+        if not pedidos:
+            return []
+        self.copiar(pedidos, ahora)
+        try:
+            self.pedidos.bulk_write(
+                [DeleteOne({"id": p["id"], "version": p.get("version")}) for p in pedidos], ordered=False)
+        except BulkWriteError as e:
+            print("Error al archivar pedidos:", e.details.get("writeErrors"))
+        restantes = {p["id"] for p in self.pedidos.find({"id": {"$in": [p["id"] for p in pedidos]}}, {"id": 1})}
+        if restantes:
+            self.archivo.delete_many({"id": {"$in": list(restantes)}})
+        archivados = [p["id"] for p in pedidos if p["id"] not in restantes]
+        if archivados:
+            with self.versiones.escritura(len(archivados)) as version:
+                marcas = marcas_borrado(archivados, version, ahora.isoformat())
+                for marca in marcas:
+                    marca["archivado"] = True
+                self.eliminados.insert_many(marcas)
+            if self.publicar_eliminado:
+                for marca in marcas:
+                    self.publicar_eliminado(marca["id"], marca["version"])
+        return archivados
+
+    # Una pasada completa; devuelve el número de pedidos archivados
+    def ejecutar(self, ahora=None):
+        ahora = ahora or datetime.now()
+        total = 0
+        while not self.detenido.is_set():
+            ids = self.candidatos(ahora)
+            if not ids:
+                break
+            archivados = self.archivar(ids, ahora)
+            total += len(archivados)
+            # Si no se ha podido archivar ninguno (cambian a la vez) se reintenta en la próxima pasada
+            if not archivados:
+                break
+        return total
+
+    def trabajar(self):
+        while not self.detenido.is_set():
+            try:
+                archivados = self.ejecutar()
+                if archivados:
+                    print("Pedidos archivados:", archivados)
+            except Exception as e:
+                print("Error al archivar pedidos:", e)
+            self.detenido.wait(self.intervalo)
+
+    # Con intervalo 0 no se archiva en segundo plano (solo llamando a ejecutar)
+    def iniciar(self):
+        if self.intervalo <= 0:
+            return
+        self.hilo = threading.Thread(target=self.trabajar, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.detenido.set()
+
+
+# Las marcas de borrado (de la API y del archivador) solo sirven a los paneles que aún no
+# las han visto. Se borran las de hace más de "retencion" segundos, y antes se sube el
+# horizonte del contador de cambios hasta la versión de la última que se borra: una consulta
+# ?since= anterior al horizonte recibe la colección completa en lugar de unos cambios a los
+# que les faltarían bajas.
+class PurgadorEliminados:
+    def __init__(self, eliminados, versiones, retencion=7 * 24 * 3600, intervalo=3600):
+        self.eliminados = eliminados
+        self.versiones = versiones
+        self.retencion = retencion
+        self.intervalo = intervalo
+        self.detenido = threading.Event()
+        self.hilo = None
+
+    # Devuelve el número de marcas borradas
+    def purgar(self, ahora=None):
+        limite = ((ahora or datetime.now()) - timedelta(seconds=self.retencion)).isoformat()
+        ultima = self.eliminados.find_one({"timestamp": {"$lt": limite}}, sort=[("version", -1)])
+        if ultima is None:
+            return 0
+        self.versiones.subir_horizonte(ultima["version"])
+        return self.eliminados.delete_many({"version": {"$lte": ultima["version"]}}).deleted_count
+
+    def trabajar(self):
+        while not self.detenido.is_set():
+            try:
+                purgadas = self.purgar()
+                if purgadas:
+                    print("Marcas de borrado purgadas:", purgadas)
+            except Exception as e:
+                print("Error al purgar marcas de borrado:", e)
+            self.detenido.wait(self.intervalo)
+
+    def iniciar(self):
+        if self.intervalo <= 0:
+            return
+        self.hilo = threading.Thread(target=self.trabajar, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.detenido.set()
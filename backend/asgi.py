@@ -0,0 +1,583 @@
+import asyncio
+import os
+from datetime import datetime
+from time import perf_counter
+
+from bson.json_util import dumps
+from pymongo import AsyncMongoClient, MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+from quart import Quart, request, jsonify, Response, g
+from twilio.twiml.messaging_response import MessagingResponse
+
+from bot import procesar_mensaje, respuesta_sin_plazas, mensaje_estado, mensaje_cancelacion
+from consultas import (
+    construir_filtro, construir_proyeccion, leer_since, leer_historico, preparar_listado, paginar, LIMITE_MAXIMO
+)
+from contador import AsignadorIdsAsync, VersionesCambiosAsync
+from duplicados import DeduplicadorMensajes
+from estado_conversacion import EstadoMemoriaAsync, EstadoMongoAsync
+from lotes import leer_ids, leer_cambios, operaciones_actualizacion, operaciones_borrado, marcas_borrado, resultados
+from mensajeria import BandejaSalida, EnviadorTwilio, EnviadorFalso
+from catalogo import CatalogoMenu, leer_platos
+from menu import PLATOS
+from metricas import (
+    EscuchaComandosMongo, EnviadorMedido, registro_metricas, registrar_peticion, duracion_mongo, fallos_mongo,
+    duracion_generar_id, duracion_whatsapp, mensajes_bot, mensajes_bot_repetidos, conversaciones_bot
+)
+from plazas import OcupacionReservas, CAMPOS_PLAZAS, plazas_de
+from productos import normalizar_productos
+from serializacion import TAMANO_LOTE, a_json, lista_por_partes_async, inicio_cambios, fin_cambios
+from resumen import CAMPOS_PEDIDO, diferencia, operaciones_resumen
+
+# Servidor ASGI alternativo a app.py, con el driver asíncrono de pymongo. Atiende las rutas
+# de pedidos (GET/POST/PUT/DELETE /api/pedidos, PATCH/DELETE /api/pedidos/bulk), /api/menu y /bot con
+# las mismas respuestas que app.py: validación, consultas, operaciones en lote y conversación
+# del bot están en consultas.py, lotes.py, bot.py y productos.py.
+# Es solo para benchmarks, no un modo de producción: no tiene el flujo de eventos
+# (/api/pedidos/eventos) con el que se sincronizan los paneles, ni las estadísticas
+# (/api/estadisticas), ni el archivador, ni la purga de las marcas de borrado; todo eso sigue
+# solo en app.py, que es lo que se despliega (render.yaml).
+# Las escrituras de pedidos sí actualizan el resumen diario de estadísticas (resumen.py) y
+# las plazas ocupadas por las reservas (plazas.py).
+#
+# Los mensajes de WhatsApp se encolan en la misma bandeja de salida que app.py y los envían
+# hilos de este proceso, así que ninguna petición espera a Twilio.
+#
+# Uso (benchmarks): SERVIDOR=asgi gunicorn -c gunicorn.conf.py   (o bien: uvicorn asgi:app --workers 4)
+app = Quart(__name__)
+
+UMBRAL_PETICION_LENTA = float(os.environ.get("METRICAS_UMBRAL_LENTO_MS", 500)) / 1000
+
+
+def crear_cliente_mongo(uri):
+    if uri and uri.startswith("mongomock://"):
+        raise RuntimeError("asgi.py necesita un servidor MongoDB; mongomock solo funciona con app.py")
+    return AsyncMongoClient(uri, event_listeners=[EscuchaComandosMongo(duracion_mongo, fallos_mongo)])
+
+
+client = crear_cliente_mongo(os.environ.get("MONGO_CLIENT"))
+db = client[os.environ.get("MONGO_DB")]
+pedidos_collection = db[os.environ.get("MONGO_PEDIDOS_COLLECTION")]
+contador_collection = db[os.environ.get("MONGO_CONTADOR_COLLECTION")]
+eliminados_collection = db[os.environ.get("MONGO_ELIMINADOS_COLLECTION", "pedidos_eliminados")]
+archivo_collection = db[os.environ.get("MONGO_ARCHIVO_COLLECTION", "pedidos_archivo")]
+resumen_collection = db[os.environ.get("MONGO_RESUMEN_COLLECTION", "estadisticas_diarias")]
+
+# Igual que ResumenDiario.registrar_varios en app.py, con el menú en uso. Como allí, se llama
+# dentro de versiones.escritura(): una versión confirmada ya está sumada en el resumen.
+async def registrar_resumen(pares):
+    operaciones = operaciones_resumen(diferencia(pares, (await menu_actual()).platos_por_nombre))
+    if not operaciones:
+        return
+    try:
+        await resumen_collection.bulk_write(operaciones, ordered=False)
+    except Exception as e:
+        print("Error al actualizar el resumen diario:", e)
+
+
+asignador_ids = AsignadorIdsAsync(
+    contador_collection,
+    tamano_bloque=int(os.environ.get("ID_TAMANO_BLOQUE", 20))
+)
+
+
+async def generar_id_numerico():
+    with duracion_generar_id.medir():
+        return await asignador_ids.siguiente()
+
+
+# Igual que en app.py: las escrituras se apuntan como en curso y el cursor de los clientes
+# es la versión confirmada (contador.py)
+versiones = VersionesCambiosAsync(
+    contador_collection,
+    db[os.environ.get("MONGO_ESCRITURAS_COLLECTION", "escrituras_en_curso")]
+)
+
+
+# Igual que cambios_por_partes y consulta_cambios en app.py. El cursor se lee antes de
+# empezar la respuesta; el resto se escribe por partes.
+async def cambios_por_partes(since, filtro=None, proyeccion=None):
+    filtro = filtro or {}
+    actual, horizonte = await versiones.leer()
+    cursor = await versiones.confirmada(actual)
+    completo = since <= 0 or since > actual or since < horizonte
+    if not completo:
+        cursor = max(cursor, since)
+    consulta = filtro if completo else dict(filtro, version={"$gt": since})
+    pedidos = pedidos_collection.find(consulta, proyeccion or {"_id": 0}).batch_size(TAMANO_LOTE)
+    yield inicio_cambios(completo)
+    async for trozo in lista_por_partes_async(pedidos):
+        yield trozo
+    eliminados = []
+    if not completo:
+        eliminados = [d["id"] for d in
+                      await eliminados_collection.find({"version": {"$gt": since}}, {"_id": 0, "id": 1}).to_list()]
+        if filtro:
+            fuera_de_filtro = {"version": {"$gt": since}, "$nor": [filtro]}
+            eliminados += [d["id"] for d in
+                           await pedidos_collection.find(fuera_de_filtro, {"_id": 0, "id": 1}).to_list()]
+    yield fin_cambios(eliminados, cursor)
+
+
+def sin_id(pedido):
+    return {k: v for k, v in pedido.items() if k != "_id"}
+
+
+# La bandeja de salida, los mensajes repetidos del bot, el menú y las plazas de las reservas
+# usan el driver síncrono desde hilos (los suyos propios o los de asyncio.to_thread)
+db_sincrona = MongoClient(os.environ.get("MONGO_CLIENT"))[os.environ.get("MONGO_DB")]
+
+
+def crear_enviador():
+    if os.environ.get("WHATSAPP_ENVIADOR") == "falso":
+        return EnviadorMedido(EnviadorFalso(), duracion_whatsapp)
+    return EnviadorMedido(EnviadorTwilio(os.environ.get("TWILIO_SID"), os.environ.get("TWILIO_AUTH_TOKEN")),
+                          duracion_whatsapp)
+
+
+bandeja_salida = BandejaSalida(
+    db_sincrona[os.environ.get("MONGO_SALIDA_COLLECTION", "mensajes_salida")],
+    crear_enviador(),
+    trabajadores=int(os.environ.get("WHATSAPP_TRABAJADORES", 2)),
+    ventana_fusion=int(os.environ.get("WHATSAPP_VENTANA_FUSION", 5)),
+    plazo_envio=int(os.environ.get("WHATSAPP_PLAZO_ENVIO", 300))
+)
+
+
+def encolar_mensaje(telefono, mensaje, clave=None):
+    try:
+        bandeja_salida.encolar(telefono, mensaje, clave)
+    except Exception as e:
+        print("Error al encolar mensaje:", e)
+
+
+def encolar_mensajes(mensajes):
+    try:
+        bandeja_salida.encolar_varios(mensajes)
+    except Exception as e:
+        print("Error al encolar mensajes:", e)
+
+
+# Encolar es una escritura corta con el driver síncrono; se hace en un hilo aparte
+async def enviar_mensaje_whatsapp(telefono, mensaje, clave=None):
+    await asyncio.to_thread(encolar_mensaje, telefono, mensaje, clave)
+
+
+async def enviar_mensajes_whatsapp(mensajes):
+    await asyncio.to_thread(encolar_mensajes, mensajes)
+
+
+def crear_almacen_estado():
+    ttl = int(os.environ.get("CONVERSACION_TTL", 1800))
+    if os.environ.get("ESTADO_CONVERSACION") == "mongo":
+        coleccion = db[os.environ.get("MONGO_CONVERSACIONES_COLLECTION", "conversaciones")]
+        return EstadoMongoAsync(coleccion, ttl=ttl)
+    return EstadoMemoriaAsync(capacidad=int(os.environ.get("CONVERSACION_CAPACIDAD", 1000)), ttl=ttl)
+
+
+estado_usuario = crear_almacen_estado()
+
+
+# Igual que en app.py. Las llamadas, que pueden esperar a otra entrega, se hacen en un hilo aparte.
+def crear_deduplicador():
+    coleccion = None
+    if os.environ.get("ESTADO_CONVERSACION") == "mongo":
+        coleccion = db_sincrona[os.environ.get("MONGO_MENSAJES_BOT_COLLECTION", "mensajes_bot")]
+    return DeduplicadorMensajes(
+        capacidad=int(os.environ.get("BOT_DUPLICADOS_CAPACIDAD", 5000)),
+        ttl=int(os.environ.get("BOT_DUPLICADOS_TTL", 3600)),
+        coleccion=coleccion
+    )
+
+
+mensajes_recibidos = crear_deduplicador()
+
+catalogo = CatalogoMenu(
+    db_sincrona[os.environ.get("MONGO_MENU_COLLECTION", "menu")],
+    PLATOS,
+    intervalo=int(os.environ.get("MENU_INTERVALO", 30))
+)
+
+
+# Menú en uso; la comprobación de su versión (como mucho cada MENU_INTERVALO segundos)
+# se hace en un hilo aparte
+async def menu_actual():
+    return await asyncio.to_thread(catalogo.actual)
+
+
+# Igual que en app.py: las escrituras condicionales de las plazas se hacen en un hilo aparte;
+# las consultas del bot (libres, sugerencias) son de la copia en memoria
+ocupacion = OcupacionReservas(
+    db_sincrona[os.environ.get("MONGO_OCUPACION_COLLECTION", "ocupacion_reservas")],
+    db_sincrona[os.environ.get("MONGO_PEDIDOS_COLLECTION")],
+    capacidad=int(os.environ.get("CAPACIDAD_FRANJA", 40)),
+    intervalo=int(os.environ.get("OCUPACION_INTERVALO", 60))
+)
+
+
+def sin_plazas(pedido):
+    return jsonify({
+        "error": f"No quedan plazas para {pedido.get('personas')} personas el {pedido.get('fecha')} a las {pedido.get('hora')}",
+        "sugerencias": ocupacion.sugerencias(pedido.get("fecha"), pedido.get("personas"), pedido.get("hora"))
+    }), 409
+
+
+@app.before_serving
+async def iniciar():
+    try:
+        await pedidos_collection.create_index("id", unique=True)
+        await pedidos_collection.create_index([("tipo", 1), ("estado", 1)])
+        await pedidos_collection.create_index([("fecha", 1), ("hora", 1)])
+        await pedidos_collection.create_index("productos.plato_id")
+        await pedidos_collection.create_index("version")
+        await eliminados_collection.create_index("version")
+    except Exception as e:
+        print("Error al crear índices:", e)
+    await versiones.crear_indices()
+    if isinstance(estado_usuario, EstadoMongoAsync):
+        await estado_usuario.iniciar()
+    await asyncio.to_thread(bandeja_salida.iniciar)
+    ocupacion.iniciar()
+
+
+@app.after_serving
+async def detener():
+    bandeja_salida.detener()
+    ocupacion.detener()
+    await client.close()
+
+
+@app.before_request
+async def iniciar_medicion():
+    g.inicio_peticion = perf_counter()
+
+
+# Igual que en app.py, los listados por partes se miden al terminar de escribirlos
+@app.after_request
+async def registrar_medicion(respuesta):
+    inicio = g.pop("inicio_peticion", None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+        metodo, url, estado = request.method, request.full_path.rstrip("?"), respuesta.status_code
+
+        def registrar():
+            registrar_peticion(metodo, ruta, url, estado, perf_counter() - inicio, UMBRAL_PETICION_LENTA)
+
+        al_cerrar = getattr(respuesta, "al_cerrar", None)
+        if al_cerrar is not None:
+            al_cerrar.append(registrar)
+        else:
+            registrar()
+    return respuesta
+
+
+@app.route("/metrics", methods=["GET"])
+async def metricas():
+    return Response(registro_metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+
+def respuesta_con_etag(cuerpo, etag, cabeceras=None):
+    respuesta = Response(cuerpo, 200, cabeceras or {})
+    if etag:
+        respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+# Las respuestas de Quart no tienen call_on_close: las funciones de "al_cerrar" se llaman
+# cuando se termina (o se interrumpe) de escribir el cuerpo
+def respuesta_por_partes(partes, etag, cabeceras=None):
+    al_cerrar = []
+
+    async def cuerpo():
+        try:
+            async for trozo in partes:
+                yield trozo
+        finally:
+            for funcion in al_cerrar:
+                funcion()
+
+    respuesta = Response(cuerpo(), 200, cabeceras or {}, mimetype="application/json")
+    respuesta.al_cerrar = al_cerrar
+    if etag:
+        respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+def no_modificado(etag):
+    respuesta = Response("", status=304)
+    respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+# Igual que en app.py: sin ETag mientras haya una escritura en curso por debajo de la versión
+async def etag_pedidos():
+    actual = await versiones.actual()
+    if await versiones.confirmada(actual) < actual:
+        return None
+    return f"pedidos-{actual}"
+
+
+@app.route("/api/pedidos", methods=["GET"])
+async def obtener_pedidos():
+    etag = await etag_pedidos()
+    if etag and request.if_none_match.contains(etag):
+        return no_modificado(etag)
+    if not request.args:
+        pedidos = pedidos_collection.find({}, {"_id": 0}).batch_size(TAMANO_LOTE)
+        return respuesta_por_partes(lista_por_partes_async(pedidos), etag)
+    try:
+        filtro = construir_filtro(request.args)
+        proyeccion = construir_proyeccion(request.args)
+        historico = leer_historico(request.args)
+        since = leer_since(request.args)
+        if since is not None:
+            return respuesta_por_partes(cambios_por_partes(since, filtro, proyeccion), etag)
+        if historico is not None:
+            filtro = dict(filtro, **historico)
+        plan = preparar_listado(request.args, filtro, proyeccion, LIMITE_MAXIMO if historico is not None else 0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    coleccion = archivo_collection if historico is not None else pedidos_collection
+    cursor = coleccion.find(plan["consulta"], plan["proyeccion"] or {"_id": 0}).sort(plan["orden"])
+    if not plan["limite"]:
+        return respuesta_por_partes(lista_por_partes_async(cursor.batch_size(TAMANO_LOTE)), etag)
+    pedidos, siguiente = paginar(await cursor.limit(plan["limite"] + 1).to_list(), plan)
+    cabeceras = {"X-Siguiente-Pagina": siguiente} if siguiente else {}
+    # Una página (como mucho LIMITE_MAXIMO pedidos) se escribe de una vez
+    return respuesta_con_etag(a_json(pedidos), etag, dict(cabeceras, **{"Content-Type": "application/json"}))
+
+
+# Igual que obtener_menu y actualizar_menu en app.py
+@app.route("/api/menu", methods=["GET"])
+async def obtener_menu():
+    menu = await menu_actual()
+    if request.if_none_match.contains(menu.etag):
+        return no_modificado(menu.etag)
+    return respuesta_con_etag(menu.json, menu.etag, {"Content-Type": "application/json"})
+
+
+@app.route("/api/menu", methods=["PUT"])
+async def actualizar_menu():
+    try:
+        platos = leer_platos(await request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    menu = await asyncio.to_thread(catalogo.guardar, platos)
+    await versiones.siguiente()
+    return respuesta_con_etag(menu.json, menu.etag, {"Content-Type": "application/json"})
+
+
+@app.route("/api/pedidos", methods=["POST"])
+async def crear_pedido():
+    data = await request.get_json()
+    if not await asyncio.to_thread(ocupacion.reservar, data):
+        return sin_plazas(data)
+    data["id"] = await generar_id_numerico()
+    data["timestamp"] = datetime.now().isoformat()
+    if "productos" in data:
+        data["productos"] = normalizar_productos(data["productos"], (await menu_actual()).platos_por_nombre)
+    try:
+        async with versiones.escritura() as version:
+            data["version"] = version
+            await pedidos_collection.insert_one(data)
+            await registrar_resumen([(None, data)])
+    except Exception:
+        await asyncio.to_thread(ocupacion.liberar, data)
+        raise
+    return jsonify({"mensaje": "Pedido creado", "pedido": sin_id(data)}), 201
+
+
+@app.route("/api/pedidos/<int:id_pedido>", methods=["PUT"])
+async def actualizar_pedido(id_pedido):
+    datos = await request.get_json()
+    datos["timestamp"] = datetime.now().isoformat()
+    if "_id" in datos:
+        del datos["_id"]
+    if "productos" in datos:
+        datos["productos"] = normalizar_productos(datos["productos"], (await menu_actual()).platos_por_nombre)
+    filtro = {"id": id_pedido}
+    actual = nuevo = None
+    if any(campo in datos for campo in CAMPOS_PLAZAS):
+        actual = await pedidos_collection.find_one(filtro, {"_id": 0, **{campo: 1 for campo in CAMPOS_PLAZAS}})
+        nuevo = dict(actual or {}, **datos)
+        if actual is None or plazas_de(actual) == plazas_de(nuevo):
+            actual = None
+        elif not await asyncio.to_thread(ocupacion.cambiar, actual, nuevo):
+            return sin_plazas(nuevo)
+        else:
+            filtro.update({campo: actual.get(campo) for campo in CAMPOS_PLAZAS})
+    async with versiones.escritura() as version:
+        datos["version"] = version
+        anterior = await pedidos_collection.find_one_and_update(
+            filtro,
+            {"$set": datos},
+            return_document=ReturnDocument.BEFORE
+        )
+        if anterior:
+            await registrar_resumen([(anterior, dict(anterior, **datos))])
+    if actual is not None and anterior is None:
+        await asyncio.to_thread(ocupacion.cambiar, nuevo, actual, True)
+        if await pedidos_collection.find_one({"id": id_pedido}, {"_id": 1}):
+            return jsonify({"error": "La reserva ha cambiado mientras se editaba; vuelve a intentarlo"}), 409
+    if anterior:
+        resultado = dict(anterior, **datos)
+        if "estado" in datos and "telefono" in resultado:
+            mensaje = mensaje_estado(resultado.get("nombre", ""), datos["estado"])
+            if mensaje:
+                await enviar_mensaje_whatsapp(resultado["telefono"], mensaje, clave=f"pedido:{id_pedido}")
+        return Response(
+            dumps({"mensaje": "Pedido actualizado", "pedido": resultado}),
+            status=200,
+            mimetype="application/json"
+        )
+    return jsonify({"error": "Pedido no encontrado"}), 404
+
+
+@app.route("/api/pedidos/<int:id_pedido>", methods=["DELETE"])
+async def eliminar_pedido(id_pedido):
+    pedido = await pedidos_collection.find_one({"id": id_pedido})
+    if pedido:
+        telefono = pedido.get("telefono")
+        if telefono:
+            await enviar_mensaje_whatsapp(telefono, mensaje_cancelacion(pedido.get("tipo")), clave=f"pedido:{id_pedido}")
+        if (await pedidos_collection.delete_one({"id": id_pedido})).deleted_count:
+            await registrar_resumen([(pedido, None)])
+            await asyncio.to_thread(ocupacion.liberar, pedido)
+        async with versiones.escritura() as version:
+            await eliminados_collection.insert_one({
+                "id": id_pedido,
+                "version": version,
+                "timestamp": datetime.now().isoformat()
+            })
+        return jsonify({"mensaje": "Pedido eliminado"}), 200
+    return jsonify({"error": "Pedido no encontrado"}), 404
+
+
+# Igual que actualizar_pedidos y eliminar_pedidos en app.py
+@app.route("/api/pedidos/bulk", methods=["PATCH"])
+async def actualizar_pedidos():
+    datos = await request.get_json(silent=True)
+    try:
+        ids = leer_ids(datos)
+        cambios = leer_cambios(datos, (await menu_actual()).platos_por_nombre)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    anteriores = {p["id"]: p for p in
+                  await pedidos_collection.find({"id": {"$in": ids}}, dict(CAMPOS_PEDIDO, id=1)).to_list()}
+    if any(campo in cambios for campo in CAMPOS_PLAZAS) and (
+            cambios.get("tipo") == "reserva" or any(p.get("tipo") == "reserva" for p in anteriores.values())):
+        return jsonify({"error": "La fecha, la hora y las personas de una reserva se cambian de una en una"}), 400
+    encontrados = list(anteriores)
+    actualizados = []
+    if encontrados:
+        async with versiones.escritura(len(encontrados)) as version:
+            operaciones, versiones_lote = operaciones_actualizacion(
+                encontrados, cambios, version, datetime.now().isoformat())
+            try:
+                await pedidos_collection.bulk_write(operaciones, ordered=True)
+            except BulkWriteError as e:
+                print("Error en la actualización en lote:", e.details.get("writeErrors"))
+            actualizados = [p for p in await pedidos_collection.find({"id": {"$in": encontrados}}, {"_id": 0}).to_list()
+                            if p.get("version") == versiones_lote[p["id"]]]
+            await registrar_resumen([(anteriores[p["id"]], p) for p in actualizados])
+        if "estado" in cambios:
+            avisos = [(p["telefono"], mensaje_estado(p.get("nombre", ""), cambios["estado"]), f"pedido:{p['id']}")
+                      for p in actualizados if "telefono" in p]
+            await enviar_mensajes_whatsapp([a for a in avisos if a[1]])
+    return jsonify({
+        "mensaje": f"{len(actualizados)} pedidos actualizados",
+        "resultados": resultados(ids, {p["id"] for p in actualizados}, "actualizado")
+    }), 200
+
+
+@app.route("/api/pedidos/bulk", methods=["DELETE"])
+async def eliminar_pedidos():
+    datos = await request.get_json(silent=True)
+    try:
+        ids = leer_ids(datos)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    pedidos = await pedidos_collection.find(
+        {"id": {"$in": ids}}, dict(CAMPOS_PEDIDO, id=1, telefono=1, personas=1)).to_list()
+    eliminados = []
+    if pedidos:
+        try:
+            await pedidos_collection.bulk_write(operaciones_borrado([p["id"] for p in pedidos]), ordered=False)
+        except BulkWriteError as e:
+            print("Error en el borrado en lote:", e.details.get("writeErrors"))
+        restantes = {p["id"] for p in await pedidos_collection.find(
+            {"id": {"$in": [p["id"] for p in pedidos]}}, {"id": 1}).to_list()}
+        eliminados = [p for p in pedidos if p["id"] not in restantes]
+    if eliminados:
+        async with versiones.escritura(len(eliminados)) as version:
+            marcas = marcas_borrado([p["id"] for p in eliminados], version, datetime.now().isoformat())
+            await eliminados_collection.insert_many(marcas)
+            await registrar_resumen([(p, None) for p in eliminados])
+        for pedido in eliminados:
+            await asyncio.to_thread(ocupacion.liberar, pedido)
+        await enviar_mensajes_whatsapp([(p["telefono"], mensaje_cancelacion(p.get("tipo")), f"pedido:{p['id']}")
+                                        for p in eliminados if p.get("telefono")])
+    return jsonify({
+        "mensaje": f"{len(eliminados)} pedidos eliminados",
+        "resultados": resultados(ids, {p["id"] for p in eliminados}, "eliminado")
+    }), 200
+
+
+@app.route('/bot', methods=['POST'])
+async def bot():
+    form = await request.form
+    sid = form.get("MessageSid")
+    if sid:
+        repetida = await asyncio.to_thread(mensajes_recibidos.reservar, sid)
+        if repetida is not None:
+            mensajes_bot_repetidos.incrementar()
+            return repetida
+    try:
+        respuesta = await atender_mensaje_bot(form)
+    except Exception:
+        if sid:
+            await asyncio.to_thread(mensajes_recibidos.liberar, sid)
+        raise
+    if sid:
+        await asyncio.to_thread(mensajes_recibidos.completar, sid, respuesta)
+    return respuesta
+
+
+async def atender_mensaje_bot(form):
+    from_numero = form.get("From", "").replace("whatsapp:", "")
+    mensaje = form.get("Body", "").strip().lower()
+    respuesta = MessagingResponse()
+
+    usuario = await estado_usuario.obtener(from_numero) or {"fase": "esperando_tipo"}
+    mensajes_bot.incrementar(fase=usuario.get("fase", "esperando_tipo"))
+
+    estado_anterior = dict(usuario)
+    texto, accion, usuario, pedido = procesar_mensaje(usuario, mensaje, from_numero, menu=await menu_actual(),
+                                                      plazas=ocupacion)
+
+    if pedido is not None and not await asyncio.to_thread(ocupacion.reservar, pedido):
+        texto, usuario = respuesta_sin_plazas(estado_anterior, pedido["hora"], ocupacion)
+        accion, pedido = "guardar", None
+
+    if pedido is not None:
+        try:
+            pedido = {"id": await generar_id_numerico(), **pedido}
+            async with versiones.escritura() as version:
+                pedido["version"] = version
+                await pedidos_collection.insert_one(pedido)
+                await registrar_resumen([(None, pedido)])
+        except Exception:
+            await asyncio.to_thread(ocupacion.liberar, pedido)
+            raise
+        conversaciones_bot.incrementar(tipo=pedido["tipo"])
+
+    respuesta.message().body(texto)
+
+    if accion == "eliminar":
+        await estado_usuario.eliminar(from_numero)
+    elif accion == "guardar":
+        await estado_usuario.guardar(from_numero, usuario)
+    return str(respuesta)
@@ -0,0 +1,76 @@
+# Benchmark de la conversación del bot (bot.py) sin Flask, Twilio ni MongoDB: repite
+# conversaciones completas de reserva y de pedido para llevar, con algunos mensajes no
+# válidos, saludos y consultas del menú, y mide los mensajes procesados por segundo y la
+# latencia por mensaje. El estado de cada conversación se guarda en un dict, como hace
+# EstadoMemoria.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_bot.py
+#   python benchmarks/bench_bot.py --conversaciones 50000
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bot import procesar_mensaje
+
+NOMBRES = ("ana garcia", "luis perez", "marta ruiz", "jorge diaz")
+HORAS = ("13:00", "14:30", "20:00", "21:30", "22:30")
+
+
+# Mensajes de una conversación al azar, con algún error que el bot tiene que rechazar
+def guion(rng, manana):
+    mensajes = ["hola"] if rng.random() < 0.5 else []
+    if rng.random() < 0.2:
+        mensajes.append("menu")
+    if rng.random() < 0.5:
+        mensajes += ["reserva", rng.choice(NOMBRES), "tres" if rng.random() < 0.2 else "", str(rng.randint(1, 8)),
+                     manana, "25:00" if rng.random() < 0.2 else "", rng.choice(HORAS)]
+    else:
+        mensajes += ["pedido", "juan 2" if rng.random() < 0.2 else "", rng.choice(NOMBRES), rng.choice(HORAS),
+                     ", ".join(str(rng.randint(1, 10)) for _ in range(rng.randint(1, 6)))]
+    return [m for m in mensajes if m]
+
+
+def medir(conversaciones, rng):
+    manana = (datetime.now() + timedelta(days=1)).strftime("%d-%m-%Y")
+    guiones = [guion(rng, manana) for _ in range(conversaciones)]
+    tiempos = []
+    confirmados = 0
+    inicio = time.perf_counter()
+    for mensajes in guiones:
+        usuario = {"fase": "esperando_tipo"}
+        for mensaje in mensajes:
+            antes = time.perf_counter()
+            texto, accion, nuevo, pedido = procesar_mensaje(dict(usuario), mensaje, "+34600000000")
+            tiempos.append(time.perf_counter() - antes)
+            if accion == "guardar":
+                usuario = nuevo
+            elif accion == "eliminar":
+                usuario = {"fase": "esperando_tipo"}
+            confirmados += pedido is not None
+    duracion = time.perf_counter() - inicio
+    if confirmados != conversaciones:
+        raise AssertionError(f"Solo se han confirmado {confirmados} de {conversaciones} conversaciones")
+    tiempos.sort()
+    return len(tiempos), duracion, tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensajes por segundo de la conversación del bot")
+    parser.add_argument("--conversaciones", type=int, default=20000, help="Conversaciones completas a procesar")
+    parser.add_argument("--semilla", type=int, default=29, help="Semilla de las conversaciones")
+    args = parser.parse_args()
+
+    mensajes, duracion, tiempos = medir(args.conversaciones, random.Random(args.semilla))
+    p50, p99 = (tiempos[int(len(tiempos) * p)] * 1e6 for p in (0.5, 0.99))
+    print(f"{mensajes} mensajes en {duracion:.2f} s: {mensajes / duracion:.0f} mensajes/s, "
+          f"p50 {p50:.1f} µs, p99 {p99:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
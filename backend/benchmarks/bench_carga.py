@@ -0,0 +1,231 @@
+# Prueba de carga del backend completo (app.py) con el cliente de pruebas de Flask.
+# Reproduce el tráfico real con una semilla fija:
+# - conversaciones completas de /bot, tanto de reservas como de pedidos para llevar;
+# - sondeo del panel (sincronización incremental con If-None-Match, listado filtrado y
+#   estadísticas);
+# - cambios de estado (PUT) y borrados (DELETE) hechos desde el panel.
+# Para cada tamaño de la colección muestra la latencia p50/p95/p99 y el throughput por ruta.
+# Los mensajes de WhatsApp no salen: se usa el enviador falso de la bandeja de salida.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_carga.py                                   # mongomock, 1k y 10k pedidos
+#   python benchmarks/bench_carga.py --mongo mongodb://localhost:27017  # 1k, 100k y 1M pedidos
+#   python benchmarks/bench_carga.py --salida resultados.json          # para comparar entre versiones
+#
+# mongomock no usa índices y copia cada documento en cada consulta, así que con él solo
+# son razonables tamaños pequeños; las cifras comparables entre versiones son las de un
+# mongod local.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+TIPOS_ESTADO = ("pendiente", "en_preparacion", "preparado", "entregado")
+HORAS = ("13:00", "13:30", "14:00", "14:30", "15:00", "15:30", "20:00", "20:30", "21:00", "21:30", "22:00", "22:30")
+NOMBRES = ("Ana Garcia", "Luis Perez", "Marta Ruiz", "Jorge Diaz", "Lucia Romero", "Pablo Navarro")
+
+
+def configurar_entorno(args):
+    os.environ["MONGO_CLIENT"] = args.mongo or "mongomock://"
+    os.environ.setdefault("MONGO_DB", "bench_carga")
+    os.environ.setdefault("MONGO_PEDIDOS_COLLECTION", "pedidos")
+    os.environ.setdefault("MONGO_CONTADOR_COLLECTION", "contador")
+    os.environ["WHATSAPP_ENVIADOR"] = "falso"
+    # Los pedidos terminados se cargan ya archivados; el archivador no corre durante la medida
+    os.environ["ARCHIVO_INTERVALO"] = "0"
+
+
+# Pedido sintético con la forma que guarda el backend. Los días se reparten en el último
+# año, con una parte de los pedidos en el día de hoy (los que ve el panel).
+def pedido_sintetico(rng, id_pedido, hoy):
+    dias = 0 if rng.random() < 0.05 else rng.randint(1, 365)
+    dia = hoy - timedelta(days=dias)
+    tipo = "reserva" if rng.random() < 0.4 else "pedido_para_llevar"
+    pedido = {
+        "id": id_pedido,
+        "telefono": f"+34600{rng.randint(0, 999999):06d}",
+        "tipo": tipo,
+        "nombre": rng.choice(NOMBRES),
+        "fecha": dia.strftime("%d-%m-%Y"),
+        "hora": rng.choice(HORAS),
+        "timestamp": dia.isoformat(),
+        "version": id_pedido
+    }
+    if tipo == "reserva":
+        pedido["personas"] = rng.randint(1, 8)
+        pedido["productos"] = []
+    else:
+        pedido["estado"] = rng.choice(TIPOS_ESTADO) if dias == 0 else "entregado"
+        pedido["productos"] = [
+            {"plato_id": str(n), "cantidad": rng.randint(1, 3)}
+            for n in rng.sample(range(1, 11), rng.randint(1, 4))
+        ]
+    return pedido
+
+
+# Vacía las colecciones, carga "tamano" pedidos y deja contadores y cachés del backend
+# como si esos pedidos se hubieran creado a través de la API. Como en producción, los pedidos
+# terminados están en el archivo y en la colección de pedidos solo quedan los vivos; se cargan
+# directamente tal como los deja el archivador. Devuelve el número de pedidos archivados.
+def preparar_coleccion(app, tamano, rng, lote=10000):
+    from archivo import copia_archivada, esta_terminado
+    from contador import AsignadorIds
+    for coleccion in (app.pedidos_collection, app.contador_collection, app.eliminados_collection,
+                      app.salida_collection, app.archivo_collection, app.resumen_collection):
+        coleccion.delete_many({})
+    hoy = datetime.now()
+    archivados = 0
+    for inicio in range(1, tamano + 1, lote):
+        fin = min(inicio + lote, tamano + 1)
+        pedidos = [pedido_sintetico(rng, i, hoy) for i in range(inicio, fin)]
+        terminados = [copia_archivada(p, hoy) for p in pedidos if esta_terminado(p, hoy, app.archivador.espera)]
+        vivos = [p for p in pedidos if not esta_terminado(p, hoy, app.archivador.espera)]
+        if terminados:
+            app.archivo_collection.insert_many(terminados)
+        if vivos:
+            app.pedidos_collection.insert_many(vivos)
+        archivados += len(terminados)
+    app.contador_collection.insert_many([
+        {"_id": "contador_pedidos", "valor": tamano},
+        {"_id": "contador_cambios", "valor": tamano}
+    ])
+    app.resumen_diario.reconstruir([app.pedidos_collection, app.archivo_collection])
+    app.asignador_ids = AsignadorIds(app.contador_collection, tamano_bloque=app.asignador_ids.tamano_bloque)
+    app.cache_estadisticas.invalidar()
+    return archivados
+
+
+class Medidor:
+    def __init__(self):
+        self.tiempos = {}
+
+    # El cuerpo se lee dentro de la medición: los listados se escriben por partes y el
+    # cliente de pruebas vuelve antes de que se hayan leído los pedidos
+    def medir(self, ruta, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        respuesta = funcion(*args, **kwargs)
+        respuesta.get_data()
+        self.tiempos.setdefault(ruta, []).append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            raise AssertionError(f"{ruta}: respuesta {respuesta.status_code} {respuesta.get_data(as_text=True)[:200]}")
+        return respuesta
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def conversacion(cliente, medidor, telefono, mensajes):
+    for mensaje in mensajes:
+        medidor.medir("POST /bot", cliente.post, "/bot", data={"From": f"whatsapp:{telefono}", "Body": mensaje})
+
+
+# ID al azar entre los pedidos vivos (no archivados) que aún no se han borrado
+def id_existente(rng, estado_panel):
+    while True:
+        id_pedido = rng.choice(estado_panel["vivos"])
+        if id_pedido not in estado_panel["borrados"]:
+            return id_pedido
+
+
+# Una ronda de tráfico: dos conversaciones del bot y lo que hace el panel mientras tanto
+def ronda(cliente, medidor, rng, estado_panel, numero):
+    manana = (datetime.now() + timedelta(days=1)).strftime("%d-%m-%Y")
+    conversacion(cliente, medidor, f"+34611{numero:06d}",
+                 ["reserva", rng.choice(NOMBRES), str(rng.randint(1, 8)), manana, rng.choice(HORAS)])
+    platos = ", ".join(str(rng.randint(1, 10)) for _ in range(rng.randint(1, 5)))
+    conversacion(cliente, medidor, f"+34622{numero:06d}",
+                 ["pedido", rng.choice(NOMBRES), rng.choice(HORAS), platos])
+
+    hoy = datetime.now().strftime("%d-%m-%Y")
+    for _ in range(10):
+        cabeceras = {"If-None-Match": estado_panel["etag"]} if estado_panel["etag"] else {}
+        respuesta = medidor.medir(
+            "GET /api/pedidos?since", cliente.get, "/api/pedidos",
+            query_string={"since": estado_panel["cursor"], "fecha": hoy, "excluir_estado": "entregado"},
+            headers=cabeceras
+        )
+        # Como el panel: el ETag solo se reenvía mientras la URL (el cursor) no cambie
+        if respuesta.status_code == 200:
+            cursor = respuesta.get_json(force=True)["cursor"]
+            estado_panel["etag"] = respuesta.headers.get("ETag") if cursor == estado_panel["cursor"] else None
+            estado_panel["cursor"] = cursor
+    for _ in range(2):
+        medidor.medir("GET /api/pedidos (listado)", cliente.get, "/api/pedidos",
+                      query_string={"fecha": hoy, "orden": "hora", "limite": 50})
+    medidor.medir("GET /api/estadisticas", cliente.get, "/api/estadisticas")
+
+    for _ in range(2):
+        medidor.medir("PUT /api/pedidos/<id>", cliente.put, f"/api/pedidos/{id_existente(rng, estado_panel)}",
+                      json={"estado": rng.choice(TIPOS_ESTADO)})
+    id_borrado = id_existente(rng, estado_panel)
+    estado_panel["borrados"].add(id_borrado)
+    medidor.medir("DELETE /api/pedidos/<id>", cliente.delete, f"/api/pedidos/{id_borrado}")
+
+
+def ejecutar(app, tamano, args):
+    rng = random.Random(args.semilla)
+    inicio = time.perf_counter()
+    archivados = preparar_coleccion(app, tamano, rng)
+    print(f"\n== {tamano} pedidos, {archivados} archivados (cargados en {time.perf_counter() - inicio:.1f} s) ==")
+
+    cliente = app.app.test_client()
+    medidor = Medidor()
+    vivos = sorted(p["id"] for p in app.pedidos_collection.find({}, {"_id": 0, "id": 1}))
+    estado_panel = {"cursor": 0, "etag": None, "vivos": vivos, "borrados": set()}
+    inicio = time.perf_counter()
+    for numero in range(args.rondas):
+        ronda(cliente, medidor, rng, estado_panel, numero)
+    duracion = time.perf_counter() - inicio
+
+    resultados = {}
+    print(f"{'ruta':<30} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'pet/s':>9}")
+    for ruta, tiempos in medidor.tiempos.items():
+        fila = {
+            "n": len(tiempos),
+            "p50": percentil(tiempos, 50) * 1000,
+            "p95": percentil(tiempos, 95) * 1000,
+            "p99": percentil(tiempos, 99) * 1000,
+            "por_segundo": len(tiempos) / sum(tiempos)
+        }
+        resultados[ruta] = fila
+        print(f"{ruta:<30} {fila['n']:>6} {fila['p50']:>9.2f} {fila['p95']:>9.2f} {fila['p99']:>9.2f} {fila['por_segundo']:>9.1f}")
+    total = sum(len(t) for t in medidor.tiempos.values())
+    print(f"{'total':<30} {total:>6} {'':>29} {total / duracion:>9.1f}")
+    return {"rutas": resultados, "peticiones": total, "duracion": duracion}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del backend con tráfico del bot y del panel")
+    parser.add_argument("--mongo", help="URI de un MongoDB local (por defecto mongomock)")
+    parser.add_argument("--tamanos", help="Tamaños de la colección, separados por comas "
+                                          "(por defecto 1000,100000,1000000 con --mongo y 1000,10000 con mongomock)")
+    parser.add_argument("--rondas", type=int, default=50, help="Rondas de tráfico por tamaño")
+    parser.add_argument("--semilla", type=int, default=29, help="Semilla de los datos y del tráfico")
+    parser.add_argument("--salida", help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    configurar_entorno(args)
+    import app
+
+    tamanos = args.tamanos or ("1000,100000,1000000" if args.mongo else "1000,10000")
+    resultados = {}
+    try:
+        for tamano in (int(n) for n in tamanos.split(",")):
+            resultados[tamano] = ejecutar(app, tamano, args)
+    finally:
+        app.bandeja_salida.detener()
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"mongo": args.mongo or "mongomock", "rondas": args.rondas, "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
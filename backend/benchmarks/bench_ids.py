@@ -0,0 +1,170 @@
+# Benchmark de creación de pedidos con N hilos concurrentes:
+# "antes"  -> un $inc sobre el contador por cada pedido (generar_id_numerico original)
+# "despues" -> IDs reservados por bloques con AsignadorIds
+# La segunda tabla mide el alta completa, como en crear_pedido: ID por bloques, versión de
+# cambios con la escritura apuntada como en curso e insert del pedido.
+# "sin marca"   -> solo el $inc de la versión (sin cursor confirmado, como referencia)
+# "por alta"    -> una marca insertada y borrada en cada alta (dos idas y vueltas más)
+# "por proceso" -> VersionesCambios: una marca por proceso, actualizada en segundo plano
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_ids.py                      # mongomock con latencia simulada
+#   python benchmarks/bench_ids.py --mongo mongodb://localhost:27017
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from pymongo import ReturnDocument
+from contador import AsignadorIds, VersionesCambios
+
+
+# Envuelve una colección de mongomock añadiendo la latencia de ida y vuelta de un servidor
+# remoto (p. ej. MongoDB Atlas desde Render). mongomock no es seguro entre hilos, así que
+# la operación en sí se hace bajo un lock, pero la espera de red no.
+class ColeccionConLatencia:
+    lock = threading.Lock()
+
+    def __init__(self, coleccion, latencia):
+        self.coleccion = coleccion
+        self.latencia = latencia
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.coleccion, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def llamada(*args, **kwargs):
+            time.sleep(self.latencia)
+            with self.lock:
+                return atributo(*args, **kwargs)
+        return llamada
+
+
+def crear_colecciones(args):
+    if args.mongo:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo)["bench_ids"]
+        for nombre in ("pedidos", "contador", "escrituras"):
+            db.drop_collection(nombre)
+        return db["pedidos"], db["contador"], db["escrituras"]
+    import mongomock
+    db = mongomock.MongoClient()["bench_ids"]
+    latencia = args.latencia / 1000
+    return tuple(ColeccionConLatencia(db[nombre], latencia) for nombre in ("pedidos", "contador", "escrituras"))
+
+
+def id_por_pedido(contador):
+    def generar():
+        result = contador.find_one_and_update(
+            {"_id": "contador_pedidos"},
+            {"$inc": {"valor": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return result["valor"]
+    return generar
+
+
+# Versión de cambios sin apuntar la escritura en curso
+class VersionesSinMarca(VersionesCambios):
+    @contextmanager
+    def escritura(self, cantidad=1):
+        yield self.siguiente(cantidad)
+
+
+# Una marca por alta, insertada antes de pedir la versión y borrada al terminar
+class VersionesMarcaPorAlta(VersionesCambios):
+    @contextmanager
+    def escritura(self, cantidad=1):
+        marca = self.escrituras.insert_one({"desde": self.vista + 1, "creado": datetime.now()}).inserted_id
+        try:
+            yield self.siguiente(cantidad)
+        finally:
+            self.escrituras.delete_one({"_id": marca})
+
+
+# Alta con un ID de "generar_id" y sin versión
+def alta_sin_version(generar_id, pedidos_collection):
+    def alta():
+        nuevo_id = generar_id()
+        pedidos_collection.insert_one({"id": nuevo_id, "tipo": "pedido_para_llevar"})
+        return nuevo_id
+    return alta
+
+
+# Alta como la de crear_pedido en app.py
+def alta_completa(asignador, versiones, pedidos_collection):
+    def alta():
+        pedido = {"id": asignador.siguiente(), "tipo": "pedido_para_llevar"}
+        with versiones.escritura() as version:
+            pedido["version"] = version
+            pedidos_collection.insert_one(pedido)
+        return pedido["id"]
+    return alta
+
+
+def medir(alta, trabajadores, total):
+    ids = []
+    lock = threading.Lock()
+    por_hilo = total // trabajadores
+
+    def trabajar():
+        propios = []
+        for _ in range(por_hilo):
+            propios.append(alta())
+        with lock:
+            ids.extend(propios)
+
+    hilos = [threading.Thread(target=trabajar) for _ in range(trabajadores)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    if len(ids) != len(set(ids)):
+        raise AssertionError("Se han generado IDs duplicados")
+    return len(ids) / duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de creación de pedidos antes/después del asignador por bloques")
+    parser.add_argument("--mongo", help="URI de un MongoDB real (por defecto mongomock)")
+    parser.add_argument("--latencia", type=float, default=15, help="Latencia simulada por operación en ms (solo mongomock)")
+    parser.add_argument("--trabajadores", default="1,4,16", help="Lista de hilos concurrentes, separados por comas")
+    parser.add_argument("--pedidos", type=int, default=320, help="Pedidos creados en cada medición")
+    parser.add_argument("--bloque", type=int, default=20, help="Tamaño de bloque del asignador")
+    args = parser.parse_args()
+
+    trabajadores = [int(n) for n in args.trabajadores.split(",")]
+    print(f"{'hilos':>6} {'antes (ped/s)':>15} {'después (ped/s)':>17} {'mejora':>8}")
+    for hilos in trabajadores:
+        pedidos, contador, _ = crear_colecciones(args)
+        antes = medir(alta_sin_version(id_por_pedido(contador), pedidos), hilos, args.pedidos)
+        pedidos, contador, _ = crear_colecciones(args)
+        asignador = AsignadorIds(contador, tamano_bloque=args.bloque)
+        despues = medir(alta_sin_version(asignador.siguiente, pedidos), hilos, args.pedidos)
+        print(f"{hilos:>6} {antes:>15.1f} {despues:>17.1f} {despues / antes:>7.2f}x")
+
+    print()
+    print("Alta completa (ped/s)")
+    print(f"{'hilos':>6} {'sin marca':>11} {'por alta':>10} {'por proceso':>13}")
+    for hilos in trabajadores:
+        resultados = []
+        for clase in (VersionesSinMarca, VersionesMarcaPorAlta, VersionesCambios):
+            pedidos, contador, escrituras = crear_colecciones(args)
+            versiones = clase(contador, escrituras)
+            alta = alta_completa(AsignadorIds(contador, tamano_bloque=args.bloque), versiones, pedidos)
+            resultados.append(medir(alta, hilos, args.pedidos))
+        print(f"{hilos:>6} {resultados[0]:>11.1f} {resultados[1]:>10.1f} {resultados[2]:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
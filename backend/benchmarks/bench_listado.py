@@ -0,0 +1,75 @@
+# Benchmark de la serialización del listado de pedidos, sin Flask ni MongoDB: compara la
+# respuesta de una vez (list(cursor) + bson.json_util.dumps, como antes) con la respuesta por
+# partes de serializacion.py, que lee el "cursor" por lotes y escribe cada lote al momento.
+# Para cada tamaño muestra el tiempo hasta el primer trozo, el tiempo total y el pico de
+# memoria (tracemalloc, en una pasada aparte). El cursor se simula con un generador de pedidos
+# sintéticos, como los de bench_carga.py, así que los tiempos incluyen generarlos.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_listado.py
+#   python benchmarks/bench_listado.py --tamanos 1000,10000,100000
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson.json_util import dumps
+
+from bench_carga import pedido_sintetico
+from serializacion import lista_por_partes, orjson
+
+
+def cursor_simulado(tamano, semilla):
+    rng = random.Random(semilla)
+    hoy = datetime.now()
+    return (pedido_sintetico(rng, n, hoy) for n in range(1, tamano + 1))
+
+
+def de_una_vez(pedidos):
+    yield dumps(list(pedidos)).encode()
+
+
+# (segundos hasta el primer trozo, segundos en total, bytes escritos)
+def medir_tiempo(respuesta, pedidos):
+    inicio = time.perf_counter()
+    primero = None
+    escritos = 0
+    for trozo in respuesta(pedidos):
+        if primero is None:
+            primero = time.perf_counter() - inicio
+        escritos += len(trozo)
+    return primero, time.perf_counter() - inicio, escritos
+
+
+# Pico de memoria en MB. tracemalloc ralentiza mucho la serialización, así que se mide aparte.
+def medir_memoria(respuesta, pedidos):
+    tracemalloc.start()
+    for _ in respuesta(pedidos):
+        pass
+    pico = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialización del listado de pedidos: de una vez o por partes")
+    parser.add_argument("--tamanos", default="1000,10000,100000", help="Pedidos del listado, separados por comas")
+    parser.add_argument("--semilla", type=int, default=29, help="Semilla de los pedidos sintéticos")
+    args = parser.parse_args()
+
+    print("Serializador:", "orjson" if orjson is not None else "json")
+    for tamano in (int(n) for n in args.tamanos.split(",")):
+        for nombre, respuesta in (("de una vez", de_una_vez), ("por partes", lista_por_partes)):
+            primero, total, escritos = medir_tiempo(respuesta, cursor_simulado(tamano, args.semilla))
+            pico = medir_memoria(respuesta, cursor_simulado(tamano, args.semilla))
+            print(f"{tamano:>7} pedidos, {nombre:<10}: primer trozo {primero * 1000:8.1f} ms, "
+                  f"total {total * 1000:8.1f} ms, {escritos / 1e6:6.1f} MB escritos, pico {pico:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import re
+from collections import Counter
+from datetime import datetime
+
+from menu import MENU_INICIAL
+from productos import formatear_productos
+from validacion import es_nombre_valido, leer_fecha, leer_hora, hora_en_rango
+
+# Lógica de la conversación del bot de WhatsApp, sin acceso a la base de datos, para que
+# app.py y asgi.py respondan igual. procesar_mensaje devuelve (texto, accion, usuario, pedido):
+# - accion "guardar": guardar "usuario" como nuevo estado de la conversación;
+#   "eliminar": la conversación ha terminado; "mantener": no tocar el estado guardado;
+# - pedido: reserva o pedido confirmado, sin id ni versión (los asigna quien lo guarda).
+#
+# La conversación es una tabla de fases (FASES): cada mensaje se atiende con la fase en la
+# que está el usuario, sin recorrer las demás. Cada fase lee y valida el mensaje, guarda el
+# valor en el estado del usuario y pasa a la siguiente fase, que hace su pregunta. Un flujo
+# nuevo (p. ej. cancelar o modificar un pedido) se añade con sus fases y un comando que lo
+# empiece, sin tocar MotorConversacion.
+#
+# Los platos vienen del menú en uso (un Menu de menu.py); las respuestas con "{listado}" se
+# completan con su listado de platos, montado una sola vez por versión del menú.
+
+SALUDOS = ("hola", "buenos días", "buenas tardes", "buenas noches")
+
+# Respuestas fijas ({listado} es el listado de platos del menú en uso)
+TEXTOS = {
+    "saludo": ("👋 ¡Hola! Ha contactado con la Trattoria Luna." +
+               "\nEstamos encantados de atenderle." +
+               "\nNuestro horario de apertura es: 13:00 a 16:00 y de 20:00 a 23:00" +
+               "\n\n¿Desea hacer una *reserva* o un *pedido para llevar*?"),
+    "menu": "🇮🇹 Menú del Día – escriba *pedido* o *reserva* para comenzar:\n\n{listado}",
+    "pedir_tipo": "¿Desea hacer una *reserva* o un *pedido para llevar*?",
+    "pedir_nombre": "✏️ Por favor, escriba *solamente su nombre completo*, (Ej: Juan Pérez).",
+    "pedir_personas": "👥 ¿Para cuántas personas es la reserva?",
+    "pedir_fecha": "📅 ¿Para qué fecha deseas reservar? (Ej: 01-01-2025)",
+    "pedir_hora_reserva": "🕒 ¿A qué hora deseas reservar mesa? (Ej: 14:00)",
+    "pedir_hora_recogida": ("🕒 ¿A qué hora deseas recoger tu pedido? (Ej: 14:00) \n\n"
+                            "Nuestro horario es de 13:00 a 16:00 y de 20:00 a 23:00"),
+    "pedir_productos": ("📝 Escriba los *números* de los productos que desea, separados por comas.\n"
+                        "*Ej: 1, 2, 2, 5*\n\n{listado}"),
+    "nombre_invalido": "❌ El nombre no debe contener números ni caracteres especiales. Ejemplo: Juan Pérez",
+    "personas_invalidas": "❌ Por favor, escribe solo el número de personas. (Ej: 3)",
+    "fecha_invalida": "❌ La fecha debe tener el formato DD-MM-AAAA. Ejemplo: 01-01-2025",
+    "fecha_pasada": "❌ La fecha no puede ser anterior a hoy. Por favor, ingresa una fecha válida.",
+    "hora_invalida": "❌ La hora debe tener el formato HH:MM. Ejemplo: 14:00",
+    "hora_pasada": "❌ La hora debe ser posterior a la actual.",
+    "hora_fuera_de_horario": "❌ Solo aceptamos reservas/pedidos entre 13:00-16:00 y 20:00-23:00.",
+    "demasiadas_personas": "❌ Como máximo podemos reservar para {capacidad} personas. Para grupos más grandes, llámenos.",
+    "fecha_completa": "😔 No nos quedan mesas para {personas} personas el {fecha}. Por favor, elija otra fecha.",
+    "hora_completa": "😔 No nos quedan mesas para {personas} personas a las {hora}.",
+    "horas_libres": "\n\nHoras con mesa libre ese día: {horas}. ¿A qué hora desea reservar?",
+    "no_entendido": "❓ No entendí tu mensaje. Por favor, escribe 'hola' para comenzar de nuevo."
+}
+
+# Fase "siguiente" que termina la conversación con la confirmación del tipo de pedido
+CONFIRMAR = "confirmar"
+
+
+# El mensaje no vale en esta fase: se responde "texto" y la conversación sigue en la misma fase
+# (o vuelve a "fase", p. ej. a pedir otra fecha si ese día está completo)
+class Rechazo(Exception):
+    def __init__(self, texto, accion="mantener", fase=None):
+        super().__init__(texto)
+        self.texto = texto
+        self.accion = accion
+        self.fase = fase
+
+
+# Lo que necesitan las fases además del mensaje: quién escribe, la hora, el menú en uso y la
+# ocupación de las reservas (un OcupacionReservas de plazas.py; None no limita las plazas)
+class Turno:
+    def __init__(self, telefono, ahora, menu, plazas=None):
+        self.telefono = telefono
+        self.ahora = ahora
+        self.menu = menu
+        self.plazas = plazas
+
+
+# Una fase de la conversación:
+# - leer(mensaje, usuario, turno): valor que se guarda en usuario[campo], o Rechazo;
+# - siguiente: nombre de la fase siguiente o CONFIRMAR;
+# - pregunta: lo que se responde al entrar en la fase.
+# "siguiente" y "pregunta" pueden ser un dict por tipo de pedido (reserva / para llevar).
+class Fase:
+    def __init__(self, leer, campo, siguiente, pregunta=None):
+        self.leer = leer
+        self.campo = campo
+        self.siguiente = siguiente
+        self.pregunta = pregunta
+
+
+def por_tipo(valor, usuario):
+    return valor.get(usuario.get("tipo")) if isinstance(valor, dict) else valor
+
+
+def leer_tipo(mensaje, usuario, turno):
+    if "reserva" in mensaje:
+        return "reserva"
+    if "llevar" in mensaje or "pedido" in mensaje:
+        return "pedido_para_llevar"
+    raise Rechazo(TEXTOS["pedir_tipo"])
+
+
+def leer_nombre(mensaje, usuario, turno):
+    if not es_nombre_valido(mensaje):
+        raise Rechazo(TEXTOS["nombre_invalido"])
+    return mensaje.title()
+
+
+def leer_personas(mensaje, usuario, turno):
+    try:
+        personas = int(mensaje)
+    except ValueError:
+        raise Rechazo(TEXTOS["personas_invalidas"], accion="guardar")
+    if turno.plazas is not None and personas > turno.plazas.capacidad:
+        raise Rechazo(TEXTOS["demasiadas_personas"].format(capacidad=turno.plazas.capacidad))
+    return personas
+
+
+def leer_fecha_reserva(mensaje, usuario, turno):
+    fecha = leer_fecha(mensaje)
+    if fecha is None:
+        raise Rechazo(TEXTOS["fecha_invalida"])
+    if fecha < turno.ahora.date():
+        raise Rechazo(TEXTOS["fecha_pasada"])
+    if turno.plazas is not None and not turno.plazas.sugerencias(mensaje, usuario["personas"], ahora=turno.ahora, cantidad=1):
+        raise Rechazo(TEXTOS["fecha_completa"].format(personas=usuario["personas"], fecha=mensaje))
+    return mensaje
+
+
+# Respuesta a una reserva que no cabe a esa hora, con las horas libres más cercanas del mismo
+# día; si ya no queda ninguna, la conversación vuelve a pedir la fecha
+def rechazo_sin_plazas(usuario, hora, plazas, ahora):
+    texto = TEXTOS["hora_completa"].format(personas=usuario["personas"], hora=hora)
+    horas = plazas.sugerencias(usuario["fecha"], usuario["personas"], hora, ahora)
+    if horas:
+        return Rechazo(texto + TEXTOS["horas_libres"].format(horas=", ".join(horas)))
+    return Rechazo(texto + "\n\n" + TEXTOS["pedir_fecha"], accion="guardar", fase="esperando_fecha")
+
+
+# La reserva confirmada ya no cabe al guardarla (otra reserva ha ocupado antes las últimas
+# plazas): se responde como si la hora estuviera completa. "usuario" es el estado de la
+# conversación antes del mensaje; devuelve (texto, estado que se guarda).
+def respuesta_sin_plazas(usuario, hora, plazas, ahora=None):
+    rechazo = rechazo_sin_plazas(usuario, hora, plazas, ahora or datetime.now())
+    if rechazo.fase is not None:
+        usuario["fase"] = rechazo.fase
+    return rechazo.texto, usuario
+
+
+def leer_hora_pedido(mensaje, usuario, turno):
+    hora = leer_hora(mensaje)
+    if hora is None:
+        raise Rechazo(TEXTOS["hora_invalida"])
+    if usuario.get("fecha") == turno.ahora.strftime("%d-%m-%Y") and hora <= turno.ahora.time():
+        raise Rechazo(TEXTOS["hora_pasada"])
+    if not hora_en_rango(hora):
+        raise Rechazo(TEXTOS["hora_fuera_de_horario"])
+    if usuario.get("tipo") == "reserva" and turno.plazas is not None:
+        libres = turno.plazas.libres(usuario["fecha"], mensaje)
+        if libres is not None and libres < usuario["personas"]:
+            raise rechazo_sin_plazas(usuario, mensaje, turno.plazas, turno.ahora)
+    return mensaje
+
+
+# "1, 2, 2, 5" -> una línea por plato con su cantidad; los números que no están en el menú se ignoran
+def leer_productos(mensaje, usuario, turno):
+    cantidades = Counter(n.strip() for n in mensaje.split(","))
+    return [{"plato_id": n, "cantidad": cantidad} for n, cantidad in cantidades.items() if turno.menu.platos.get(n)]
+
+
+def confirmar_reserva(usuario, turno):
+    pedido = {
+        "telefono": turno.telefono,
+        "tipo": usuario["tipo"],
+        "nombre": usuario["nombre"],
+        "fecha": usuario["fecha"],
+        "personas": usuario["personas"],
+        "hora": usuario["hora"],
+        "productos": [],
+        "timestamp": turno.ahora.isoformat()
+    }
+    texto = (
+        f"✅ ¡Reserva confirmada!\n\n"
+        f"📌 Nombre: {usuario['nombre']}\n"
+        f"📅 Fecha: {usuario['fecha']}\n"
+        f"👥 Personas: {usuario['personas']}\n"
+        f"🕒 Hora: {usuario['hora']}"
+    )
+    return texto, pedido
+
+
+def confirmar_pedido(usuario, turno):
+    pedido = {
+        "telefono": turno.telefono,
+        "tipo": usuario["tipo"],
+        "nombre": usuario["nombre"],
+        "fecha": turno.ahora.strftime("%d-%m-%Y"),
+        "hora": usuario["hora"],
+        "productos": usuario["productos"],
+        "timestamp": turno.ahora.isoformat(),
+        "estado": "pendiente"
+    }
+    texto = (
+        f"✅ ¡Pedido para llevar confirmado!\n\n"
+        f"📌 Nombre: {usuario['nombre']}\n"
+        f"🕒 Hora de recogida: {usuario['hora']}\n"
+        f"🍽️ Productos:\n- " + "\n- ".join(formatear_productos(usuario["productos"], turno.menu.platos))
+    )
+    return texto, pedido
+
+
+FASES = {
+    "esperando_tipo": Fase(leer_tipo, "tipo", "esperando_nombre", TEXTOS["pedir_tipo"]),
+    "esperando_nombre": Fase(
+        leer_nombre, "nombre", {"reserva": "esperando_personas", "pedido_para_llevar": "esperando_hora"},
+        TEXTOS["pedir_nombre"]),
+    "esperando_personas": Fase(leer_personas, "personas", "esperando_fecha", TEXTOS["pedir_personas"]),
+    "esperando_fecha": Fase(leer_fecha_reserva, "fecha", "esperando_hora", TEXTOS["pedir_fecha"]),
+    "esperando_hora": Fase(
+        leer_hora_pedido, "hora", {"reserva": CONFIRMAR, "pedido_para_llevar": "esperando_productos"},
+        {"reserva": TEXTOS["pedir_hora_reserva"], "pedido_para_llevar": TEXTOS["pedir_hora_recogida"]}),
+    "esperando_productos": Fase(leer_productos, "productos", CONFIRMAR, TEXTOS["pedir_productos"])
+}
+
+# Confirmación que cierra la conversación, por tipo de pedido: (usuario, turno) -> (texto, pedido)
+CONFIRMACIONES = {
+    "reserva": confirmar_reserva,
+    "pedido_para_llevar": confirmar_pedido
+}
+
+# Comandos que se atienden en cualquier fase, antes que la fase: (patrón, respuesta, fase).
+# Con fase None solo se responde; con una fase, la conversación empieza de nuevo en ella.
+COMANDOS = (
+    (re.compile("|".join(re.escape(saludo) for saludo in SALUDOS)), TEXTOS["saludo"], None),
+    (re.compile("menu|menú"), TEXTOS["menu"], None)
+)
+
+
+class MotorConversacion:
+    def __init__(self, fases, confirmaciones, comandos=(), inicial="esperando_tipo",
+                 no_entendido=TEXTOS["no_entendido"]):
+        self.fases = fases
+        self.confirmaciones = confirmaciones
+        self.comandos = comandos
+        self.inicial = inicial
+        self.no_entendido = no_entendido
+
+    # "ahora" se puede fijar (pruebas, benchmarks); por defecto, la hora actual
+    def procesar(self, usuario, mensaje, telefono, ahora=None, menu=MENU_INICIAL, plazas=None):
+        for patron, texto, fase in self.comandos:
+            if patron.search(mensaje):
+                if fase is None:
+                    return menu.rellenar(texto), "mantener", usuario, None
+                return menu.rellenar(texto), "guardar", {"fase": fase}, None
+
+        # Inicializar el estado del usuario si no existe
+        if "fase" not in usuario:
+            usuario["fase"] = self.inicial
+        fase = self.fases.get(usuario["fase"])
+        if fase is None:
+            return self.no_entendido, "eliminar", None, None
+
+        turno = Turno(telefono, ahora or datetime.now(), menu, plazas)
+        try:
+            usuario[fase.campo] = fase.leer(mensaje, usuario, turno)
+        except Rechazo as rechazo:
+            if rechazo.fase is not None:
+                usuario["fase"] = rechazo.fase
+            return rechazo.texto, rechazo.accion, usuario, None
+
+        siguiente = por_tipo(fase.siguiente, usuario)
+        if siguiente == CONFIRMAR and usuario.get("tipo") in self.confirmaciones:
+            texto, pedido = self.confirmaciones[usuario["tipo"]](usuario, turno)
+            return texto, "eliminar", None, pedido
+        if siguiente not in self.fases:
+            return self.no_entendido, "eliminar", None, None
+        usuario["fase"] = siguiente
+        return menu.rellenar(por_tipo(self.fases[siguiente].pregunta, usuario)), "guardar", usuario, None
+
+
+motor = MotorConversacion(FASES, CONFIRMACIONES, COMANDOS)
+
+
+def procesar_mensaje(usuario, mensaje, telefono, ahora=None, menu=MENU_INICIAL, plazas=None):
+    return motor.procesar(usuario, mensaje, telefono, ahora, menu, plazas)
+
+
+# Aviso por WhatsApp de un cambio de estado de un pedido para llevar (None si no hay aviso)
+def mensaje_estado(nombre, estado):
+    return {
+        "pendiente": f"🕒 Hola {nombre}, tu pedido ha sido recibido. ¡Estamos preparando todo para ti!\n\n– Trattoria Luna 🍝",
+        "en_preparacion": f"👨‍🍳 {nombre}, estamos cocinando tu pedido. ¡Ya casi está listo!\n\n– Trattoria Luna 🍝",
+        "preparado": f"✅ ¡{nombre}, tu pedido ya está listo para recoger! 🍽️\n\n– Trattoria Luna 🍝",
+        "entregado": f"🚚 Pedido entregado, {nombre}. ¡Gracias por elegirnos! 😄\n\n– Trattoria Luna 🍝"
+    }.get(estado, None)
+
+
+def mensaje_cancelacion(tipo):
+    return "🛑 Tu reserva ha sido cancelada." if tipo == "reserva" else "🛑 Tu pedido ha sido cancelado."
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from menu import Menu
+
+# Catálogo de platos en MongoDB, con número de versión. Es un único documento:
+#   {"_id": "menu", "version": 3, "platos": [{"id": "1", "nombre": "Spaghetti alla Carbonara"}, ...]}
+# Si no existe se crea con los platos de menu.py. Cada proceso guarda en memoria la versión
+# que está usando (un Menu, con el listado de WhatsApp y el JSON de GET /api/menu ya montados)
+# y solo mira la versión en MongoDB cada "intervalo" segundos, así que un cambio del menú
+# llega a todos los procesos sin reiniciarlos.
+
+ID_CATALOGO = "menu"
+MAXIMO_PLATOS = 200
+
+
+def lista_platos(platos):
+    return [{"id": n, "nombre": nombre} for n, nombre in platos.items()]
+
+
+def platos_de(documento):
+    return {p["id"]: p["nombre"] for p in documento.get("platos", [])}
+
+
+# Platos del cuerpo de PUT /api/menu: {"platos": [{"id": "1", "nombre": "..."}, ...]}
+def leer_platos(datos):
+    if not isinstance(datos, dict) or not isinstance(datos.get("platos"), list) or not datos["platos"]:
+        raise ValueError("El campo platos debe ser una lista de platos con id y nombre")
+    if len(datos["platos"]) > MAXIMO_PLATOS:
+        raise ValueError(f"Como máximo puede haber {MAXIMO_PLATOS} platos")
+    platos = {}
+    for plato in datos["platos"]:
+        if not isinstance(plato, dict):
+            raise ValueError("Cada plato debe ser un objeto con id y nombre")
+        plato_id = str(plato.get("id", "")).strip()
+        nombre = plato.get("nombre").strip() if isinstance(plato.get("nombre"), str) else ""
+        if not plato_id or not nombre:
+            raise ValueError("Cada plato debe tener id y nombre")
+        if plato_id in platos:
+            raise ValueError(f"El id {plato_id} está repetido")
+        if nombre in platos.values():
+            raise ValueError(f"El plato {nombre} está repetido")
+        platos[plato_id] = nombre
+    return platos
+
+
+class CatalogoMenu:
+    def __init__(self, coleccion, platos_iniciales, intervalo=30):
+        self.coleccion = coleccion
+        self.intervalo = intervalo
+        self.menu = Menu(platos_iniciales)
+        self.comprobado = 0
+        self.lock = threading.Lock()
+        try:
+            self.coleccion.update_one(
+                {"_id": ID_CATALOGO},
+                {"$setOnInsert": {"version": 1, "platos": lista_platos(platos_iniciales)}},
+                upsert=True
+            )
+            self.recargar()
+        except Exception as e:
+            print("Error al cargar el menú:", e)
+
+    def recargar(self):
+        documento = self.coleccion.find_one({"_id": ID_CATALOGO})
+        if documento and documento.get("version") != self.menu.version:
+            self.menu = Menu(platos_de(documento), documento["version"])
+        self.comprobado = time.monotonic()
+
+    # Menú en uso. Como mucho cada "intervalo" segundos se comprueba (solo la versión) si ha
+    # cambiado en MongoDB; si MongoDB falla se sigue con el que había.
+    def actual(self):
+        if time.monotonic() - self.comprobado < self.intervalo:
+            return self.menu
+        with self.lock:
+            if time.monotonic() - self.comprobado >= self.intervalo:
+                try:
+                    documento = self.coleccion.find_one({"_id": ID_CATALOGO}, {"version": 1})
+                    if documento and documento.get("version") != self.menu.version:
+                        self.recargar()
+                except Exception as e:
+                    print("Error al comprobar el menú:", e)
+                self.comprobado = time.monotonic()
+        return self.menu
+
+    # Sustituye los platos del menú y devuelve la nueva versión
+    def guardar(self, platos):
+        documento = self.coleccion.find_one_and_update(
+            {"_id": ID_CATALOGO},
+            {"$set": {"platos": lista_platos(platos)}, "$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self.lock:
+            self.menu = Menu(platos_de(documento), documento["version"])
+            self.comprobado = time.monotonic()
+        return self.menu
@@ -0,0 +1,148 @@
+import base64
+import json
+from datetime import datetime
+
+from validacion import es_fecha_valida, es_hora_valida
+
+# Parámetros de consulta del listado de pedidos, compartidos por app.py y asgi.py.
+# Aquí solo se construyen filtros, orden y cursores; cada servidor ejecuta la consulta
+# con su propio driver de MongoDB.
+
+CAMPOS_ORDENABLES = ("id", "hora", "timestamp", "version")
+LIMITE_MAXIMO = 500
+
+
+# Cursor "since" de la sincronización incremental (None si no se pide)
+def leer_since(args):
+    since = args.get("since")
+    if since is None:
+        return None
+    if "limite" in args or "despues" in args or "orden" in args:
+        raise ValueError("La sincronización incremental no admite orden ni paginación")
+    try:
+        return int(since)
+    except ValueError:
+        raise ValueError("El parámetro since debe ser un número entero")
+
+
+# Convierte una fecha DD-MM-AAAA de la URL al formato AAAA-MM-DD (el "dia" de los pedidos)
+def fecha_a_dia(fecha):
+    if not fecha:
+        return None
+    if not es_fecha_valida(fecha):
+        raise ValueError("La fecha debe tener el formato DD-MM-AAAA")
+    return datetime.strptime(fecha, "%d-%m-%Y").strftime("%Y-%m-%d")
+
+
+# Consulta del histórico (?historico=1): el listado se hace sobre la colección de pedidos
+# archivados, opcionalmente entre los días "desde" y "hasta" (DD-MM-AAAA, incluidos).
+# Devuelve None si no se pide el histórico y, si se pide, el filtro por días (que usa el índice
+# del archivo).
+def leer_historico(args):
+    if args.get("historico") not in ("1", "true"):
+        return None
+    if "since" in args:
+        raise ValueError("El histórico no admite sincronización incremental")
+    desde = fecha_a_dia(args.get("desde"))
+    hasta = fecha_a_dia(args.get("hasta"))
+    filtro = {}
+    if desde or hasta:
+        filtro["dia"] = {}
+        if desde:
+            filtro["dia"]["$gte"] = desde
+        if hasta:
+            filtro["dia"]["$lte"] = hasta
+    return filtro
+
+
+# Construye el filtro de MongoDB a partir de los parámetros de la URL:
+# tipo, estado, fecha (admiten varios valores separados por comas),
+# excluir_estado y la franja de recogida hora_desde / hora_hasta (HH:MM).
+def construir_filtro(args):
+    filtro = {}
+    for campo in ("tipo", "estado", "fecha"):
+        if args.get(campo):
+            filtro[campo] = {"$in": args.get(campo).split(",")}
+    if args.get("excluir_estado"):
+        filtro.setdefault("estado", {})["$nin"] = args.get("excluir_estado").split(",")
+    if "fecha" in filtro and not all(es_fecha_valida(f) for f in filtro["fecha"]["$in"]):
+        raise ValueError("La fecha debe tener el formato DD-MM-AAAA")
+    hora_desde = args.get("hora_desde")
+    hora_hasta = args.get("hora_hasta")
+    for hora in (hora_desde, hora_hasta):
+        if hora and not es_hora_valida(hora):
+            raise ValueError("La hora debe tener el formato HH:MM")
+    if hora_desde or hora_hasta:
+        filtro["hora"] = {}
+        if hora_desde:
+            filtro["hora"]["$gte"] = hora_desde
+        if hora_hasta:
+            filtro["hora"]["$lt"] = hora_hasta
+    return filtro
+
+
+# Proyección a partir de "campos" (separados por comas). Siempre incluye id y versión.
+def construir_proyeccion(args):
+    if not args.get("campos"):
+        return None
+    proyeccion = {"_id": 0, "id": 1, "version": 1}
+    for campo in args.get("campos").split(","):
+        if campo.strip() and campo.strip() != "_id":
+            proyeccion[campo.strip()] = 1
+    return proyeccion
+
+
+def codificar_cursor_pagina(valor, id_pedido):
+    return base64.urlsafe_b64encode(json.dumps([valor, id_pedido]).encode()).decode()
+
+
+def decodificar_cursor_pagina(token):
+    try:
+        valor, id_pedido = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError("Cursor de página inválido")
+    return valor, id_pedido
+
+# Plan del listado paginado por cursor ("keyset"): ordena por el campo pedido y desempata
+# por id, de modo que cada página continúa justo después del último pedido de la anterior.
+# Sin "limite" se devuelven todos los pedidos, salvo que se indique "limite_por_defecto".
+def preparar_listado(args, filtro, proyeccion, limite_por_defecto=0):
+    orden = args.get("orden", "id")
+    descendente = orden.startswith("-")
+    campo = orden.lstrip("-")
+    if campo not in CAMPOS_ORDENABLES:
+        raise ValueError(f"Solo se puede ordenar por: {', '.join(CAMPOS_ORDENABLES)}")
+    direccion = -1 if descendente else 1
+    comparador = "$lt" if descendente else "$gt"
+
+    try:
+        limite = int(args.get("limite", limite_por_defecto))
+    except ValueError:
+        raise ValueError("El parámetro limite debe ser un número entero")
+    if limite < 0 or limite > LIMITE_MAXIMO:
+        raise ValueError(f"El parámetro limite debe estar entre 1 y {LIMITE_MAXIMO}")
+
+    consulta = dict(filtro)
+    if args.get("despues"):
+        valor, id_pedido = decodificar_cursor_pagina(args.get("despues"))
+        if campo == "id":
+            condicion = {"id": {comparador: id_pedido}}
+        else:
+            condicion = {"$or": [{campo: {comparador: valor}}, {campo: valor, "id": {comparador: id_pedido}}]}
+        consulta = {"$and": [consulta, condicion]} if consulta else condicion
+
+    orden_mongo = [("id", direccion)] if campo == "id" else [(campo, direccion), ("id", direccion)]
+    if proyeccion:
+        proyeccion = dict(proyeccion, **{campo: 1})
+    return {"consulta": consulta, "proyeccion": proyeccion, "orden": orden_mongo, "limite": limite, "campo": campo}
+
+
+# Recorta la página (se piden limite + 1 pedidos) y calcula el cursor de la siguiente
+def paginar(pedidos, plan):
+    limite = plan["limite"]
+    siguiente = None
+    if limite and len(pedidos) > limite:
+        pedidos = pedidos[:limite]
+        ultimo = pedidos[-1]
+        siguiente = codificar_cursor_pagina(ultimo.get(plan["campo"]), ultimo.get("id"))
+    return pedidos, siguiente
@@ -0,0 +1,394 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+# Asigna IDs numéricos reservando bloques en el contador de MongoDB.
+# Cada proceso reserva un rango con un solo $inc y lo reparte desde memoria; cuando
+# quedan pocos IDs reserva el siguiente bloque en segundo plano. Los IDs son únicos
+# entre procesos porque cada bloque sale de un $inc atómico; al reiniciar se pierden
+# los IDs no usados del bloque en curso (pequeños huecos en la numeración).
+class AsignadorIds:
+    def __init__(self, coleccion, clave="contador_pedidos", tamano_bloque=20, umbral_recarga=5):
+        self.coleccion = coleccion
+        self.clave = clave
+        self.tamano_bloque = tamano_bloque
+        self.umbral_recarga = min(umbral_recarga, tamano_bloque)
+        self.lock = threading.Lock()
+        self.siguiente_id = 1
+        self.fin = 0
+        self.reserva = None
+        self.recargando = False
+
+    def reservar_bloque(self):
+        result = self.coleccion.find_one_and_update(
+            {"_id": self.clave},
+            {"$inc": {"valor": self.tamano_bloque}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        fin = result["valor"]
+        return fin - self.tamano_bloque + 1, fin
+
+    def recargar(self):
+        try:
+            bloque = self.reservar_bloque()
+            with self.lock:
+                if self.reserva is None:
+                    self.reserva = bloque
+        except Exception as e:
+            print("Error al reservar bloque de IDs:", e)
+        finally:
+            with self.lock:
+                self.recargando = False
+
+    def siguiente(self):
+        with self.lock:
+            if self.siguiente_id > self.fin:
+                if self.reserva is not None:
+                    self.siguiente_id, self.fin = self.reserva
+                    self.reserva = None
+                else:
+                    # Sin bloque de reserva (primer uso o ráfaga): se pide uno en línea
+                    self.siguiente_id, self.fin = self.reservar_bloque()
+            nuevo_id = self.siguiente_id
+            self.siguiente_id += 1
+            lanzar_recarga = (
+                self.reserva is None and not self.recargando
+                and self.fin - self.siguiente_id + 1 <= self.umbral_recarga
+            )
+            if lanzar_recarga:
+                self.recargando = True
+        if lanzar_recarga:
+            threading.Thread(target=self.recargar, daemon=True).start()
+        return nuevo_id
+
+
+# Versión para asgi.py con el driver asíncrono de pymongo: misma reserva por bloques,
+# pero con asyncio (la recarga anticipada es una tarea del bucle de eventos).
+class AsignadorIdsAsync:
+    def __init__(self, coleccion, clave="contador_pedidos", tamano_bloque=20, umbral_recarga=5):
+        self.coleccion = coleccion
+        self.clave = clave
+        self.tamano_bloque = tamano_bloque
+        self.umbral_recarga = min(umbral_recarga, tamano_bloque)
+        self.lock = asyncio.Lock()
+        self.siguiente_id = 1
+        self.fin = 0
+        self.reserva = None
+        self.recarga = None
+
+    async def reservar_bloque(self):
+        result = await self.coleccion.find_one_and_update(
+            {"_id": self.clave},
+            {"$inc": {"valor": self.tamano_bloque}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        fin = result["valor"]
+        return fin - self.tamano_bloque + 1, fin
+
+    async def recargar(self):
+        try:
+            self.reserva = await self.reservar_bloque()
+        except Exception as e:
+            print("Error al reservar bloque de IDs:", e)
+        finally:
+            self.recarga = None
+
+    async def siguiente(self):
+        async with self.lock:
+            if self.siguiente_id > self.fin:
+                if self.reserva is None and self.recarga is not None:
+                    await self.recarga
+                if self.reserva is not None:
+                    self.siguiente_id, self.fin = self.reserva
+                    self.reserva = None
+                else:
+                    self.siguiente_id, self.fin = await self.reservar_bloque()
+            nuevo_id = self.siguiente_id
+            self.siguiente_id += 1
+            if (self.reserva is None and self.recarga is None
+                    and self.fin - self.siguiente_id + 1 <= self.umbral_recarga):
+                self.recarga = asyncio.ensure_future(self.recargar())
+        return nuevo_id
+
+
+# Menor cota de las escrituras en curso empezadas después de "limite" (None si no hay)
+def cota_en_curso(en_curso, limite):
+    cotas = [desde for desde, creado in en_curso.values() if creado >= limite]
+    return min(cotas) if cotas else None
+
+
+# (desde, creado) de la marca de un proceso con esas escrituras en curso; None si no hay ninguna
+def marca_en_curso(en_curso):
+    if not en_curso:
+        return None
+    return min(desde for desde, _ in en_curso.values()), min(creado for _, creado in en_curso.values())
+
+
+# Versión global de cambios de los pedidos ("contador_cambios") y cursor que se da a los
+# clientes. Una escritura pide su versión antes de guardar el pedido, así que el contador
+# puede ir por delante de lo guardado: si un cliente recibiera el contador como cursor
+# mientras se escribe la versión V, la siguiente consulta con ?since=V no la vería nunca.
+#
+# Por eso cada proceso apunta en la colección "escrituras" una marca con una cota inferior
+# de las versiones que están escribiendo sus hilos ("desde") y la hora de la más antigua
+# ("creado"). El cursor confirmado es el contador leído antes que las marcas, sin llegar a la
+# menor de ellas: todas las versiones hasta él están guardadas o no se van a guardar. Las
+# marcas de hace más de "duracion_maxima" segundos se dan por abandonadas (el proceso se
+# cayó a medias) y un índice TTL las borra.
+#
+# Las escrituras en curso de cada proceso se llevan en memoria. Solo la que empieza sin marca
+# publicada la escribe antes de pedir su versión; las demás ya están cubiertas, porque su cota
+# no es menor que la de la marca. Al terminar no se espera a la base de datos: un hilo sube la
+# cota de la marca o la borra, como mucho cada "intervalo_marca" segundos, así que con carga
+# una sola escritura de la marca sirve para muchos pedidos. El propio proceso calcula su parte
+# del cursor con lo que tiene en memoria, sin ese retraso. La "generacion" de la marca evita
+# que una actualización que llega tarde pise a una marca publicada después.
+class VersionesCambios:
+    def __init__(self, coleccion, escrituras, clave="contador_cambios", duracion_maxima=60, intervalo_marca=0.05):
+        self.coleccion = coleccion
+        self.escrituras = escrituras
+        self.clave = clave
+        self.duracion_maxima = duracion_maxima
+        self.intervalo_marca = intervalo_marca
+        # Último valor del contador visto por este proceso (el contador nunca baja)
+        self.vista = 0
+        # Escrituras en curso de este proceso, {token: (desde, creado)}, y estado de su marca
+        self.proceso = ObjectId()
+        self.en_curso = {}
+        self.publicada = False
+        self.generacion = 0
+        self.lock = threading.Lock()
+        self.aviso = threading.Event()
+        self.hilo = None
+        self.crear_indices()
+
+    def crear_indices(self):
+        try:
+            self.escrituras.create_index("creado", expireAfterSeconds=self.duracion_maxima)
+            self.escrituras.create_index("desde")
+        except Exception as e:
+            print("Error al crear índices de las escrituras en curso:", e)
+
+    def anotar(self, valor):
+        self.vista = max(self.vista, valor)
+        return valor
+
+    # Reserva "cantidad" versiones seguidas y devuelve la última, sin apuntar la escritura.
+    # Solo para cambios que no guardan pedidos (p. ej. el menú, para las estadísticas).
+    def siguiente(self, cantidad=1):
+        result = self.coleccion.find_one_and_update(
+            {"_id": self.clave},
+            {"$inc": {"valor": cantidad}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return self.anotar(result["valor"])
+
+    def actual(self):
+        return self.leer()[0]
+
+    # (contador, horizonte) con una sola lectura. Las marcas de borrado con versión hasta el
+    # horizonte ya se han purgado (PurgadorEliminados en archivo.py).
+    def leer(self):
+        doc = self.coleccion.find_one({"_id": self.clave}) or {}
+        return self.anotar(doc.get("valor", 0)), doc.get("horizonte", 0)
+
+    def subir_horizonte(self, version):
+        self.coleccion.update_one({"_id": self.clave}, {"$max": {"horizonte": version}}, upsert=True)
+
+    # Uso:  with versiones.escritura() as version: <guardar el pedido con esa versión>
+    @contextmanager
+    def escritura(self, cantidad=1):
+        token = object()
+        with self.lock:
+            self.en_curso[token] = (self.vista + 1, datetime.now())
+            publicar = not self.publicada
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self.trabajar, daemon=True)
+                self.hilo.start()
+        try:
+            if publicar:
+                self.publicar()
+            yield self.siguiente(cantidad)
+        finally:
+            with self.lock:
+                del self.en_curso[token]
+            self.aviso.set()
+
+    # Escribe la marca del proceso antes de pedir la versión. Si ya hay una de una generación
+    # posterior (otro hilo la publicó a la vez), esa ya cubre esta escritura.
+    def publicar(self):
+        with self.lock:
+            self.generacion += 1
+            generacion = self.generacion
+            desde, creado = marca_en_curso(self.en_curso)
+        try:
+            self.escrituras.replace_one(
+                {"_id": self.proceso, "generacion": {"$lt": generacion}},
+                {"desde": desde, "creado": creado, "generacion": generacion},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+        with self.lock:
+            if self.generacion == generacion:
+                self.publicada = True
+
+    # Sube la cota de la marca a la de las escrituras que siguen en curso, o la borra si no
+    # queda ninguna. Si falla se vuelve a intentar en la siguiente vuelta.
+    def actualizar_marca(self):
+        with self.lock:
+            if not self.publicada:
+                return
+            generacion = self.generacion
+            marca = marca_en_curso(self.en_curso)
+            if marca is None:
+                self.publicada = False
+        try:
+            if marca is None:
+                self.escrituras.delete_one({"_id": self.proceso, "generacion": generacion})
+            else:
+                self.escrituras.update_one(
+                    {"_id": self.proceso, "generacion": generacion},
+                    {"$set": {"desde": marca[0], "creado": marca[1]}}
+                )
+        except Exception as e:
+            print("Error al actualizar las escrituras en curso:", e)
+            with self.lock:
+                if self.generacion == generacion:
+                    self.publicada = True
+            self.aviso.set()
+
+    def trabajar(self):
+        while True:
+            self.aviso.wait()
+            self.aviso.clear()
+            self.actualizar_marca()
+            time.sleep(self.intervalo_marca)
+
+    # Cursor confirmado. "actual" es el contador, si ya se ha leído (tiene que leerse antes).
+    def confirmada(self, actual=None):
+        if actual is None:
+            actual = self.actual()
+        limite = datetime.now() - timedelta(seconds=self.duracion_maxima)
+        with self.lock:
+            propia = cota_en_curso(self.en_curso, limite)
+        ajena = self.escrituras.find_one(
+            {"_id": {"$ne": self.proceso}, "creado": {"$gte": limite}}, sort=[("desde", 1)])
+        cotas = [cota for cota in (propia, ajena and ajena["desde"]) if cota is not None]
+        return min([actual] + [cota - 1 for cota in cotas])
+
+
+# Versión para asgi.py con el driver asíncrono de pymongo. La marca la actualiza una tarea
+# del bucle de eventos en lugar de un hilo.
+class VersionesCambiosAsync:
+    def __init__(self, coleccion, escrituras, clave="contador_cambios", duracion_maxima=60, intervalo_marca=0.05):
+        self.coleccion = coleccion
+        self.escrituras = escrituras
+        self.clave = clave
+        self.duracion_maxima = duracion_maxima
+        self.intervalo_marca = intervalo_marca
+        self.vista = 0
+        self.proceso = ObjectId()
+        self.en_curso = {}
+        self.publicada = False
+        self.generacion = 0
+        self.tarea = None
+
+    async def crear_indices(self):
+        try:
+            await self.escrituras.create_index("creado", expireAfterSeconds=self.duracion_maxima)
+            await self.escrituras.create_index("desde")
+        except Exception as e:
+            print("Error al crear índices de las escrituras en curso:", e)
+
+    def anotar(self, valor):
+        self.vista = max(self.vista, valor)
+        return valor
+
+    async def siguiente(self, cantidad=1):
+        result = await self.coleccion.find_one_and_update(
+            {"_id": self.clave},
+            {"$inc": {"valor": cantidad}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return self.anotar(result["valor"])
+
+    async def actual(self):
+        return (await self.leer())[0]
+
+    async def leer(self):
+        doc = await self.coleccion.find_one({"_id": self.clave}) or {}
+        return self.anotar(doc.get("valor", 0)), doc.get("horizonte", 0)
+
+    @asynccontextmanager
+    async def escritura(self, cantidad=1):
+        token = object()
+        self.en_curso[token] = (self.vista + 1, datetime.now())
+        try:
+            if not self.publicada:
+                await self.publicar()
+            yield await self.siguiente(cantidad)
+        finally:
+            del self.en_curso[token]
+            if self.tarea is None:
+                self.tarea = asyncio.ensure_future(self.actualizar_despues())
+
+    async def publicar(self):
+        self.generacion += 1
+        generacion = self.generacion
+        desde, creado = marca_en_curso(self.en_curso)
+        try:
+            await self.escrituras.replace_one(
+                {"_id": self.proceso, "generacion": {"$lt": generacion}},
+                {"desde": desde, "creado": creado, "generacion": generacion},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+        if self.generacion == generacion:
+            self.publicada = True
+
+    async def actualizar_despues(self):
+        await asyncio.sleep(self.intervalo_marca)
+        self.tarea = None
+        if not self.publicada:
+            return
+        generacion = self.generacion
+        marca = marca_en_curso(self.en_curso)
+        if marca is None:
+            self.publicada = False
+        try:
+            if marca is None:
+                await self.escrituras.delete_one({"_id": self.proceso, "generacion": generacion})
+            else:
+                await self.escrituras.update_one(
+                    {"_id": self.proceso, "generacion": generacion},
+                    {"$set": {"desde": marca[0], "creado": marca[1]}}
+                )
+        except Exception as e:
+            print("Error al actualizar las escrituras en curso:", e)
+            if self.generacion == generacion:
+                self.publicada = True
+            if self.tarea is None:
+                self.tarea = asyncio.ensure_future(self.actualizar_despues())
+
+    async def confirmada(self, actual=None):
+        if actual is None:
+            actual = await self.actual()
+        limite = datetime.now() - timedelta(seconds=self.duracion_maxima)
+        propia = cota_en_curso(self.en_curso, limite)
+        ajena = await self.escrituras.find_one(
+            {"_id": {"$ne": self.proceso}, "creado": {"$gte": limite}}, sort=[("desde", 1)])
+        cotas = [cota for cota in (propia, ajena and ajena["desde"]) if cota is not None]
+        return min([actual] + [cota - 1 for cota in cotas])
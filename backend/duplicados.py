@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+# Entregas repetidas del webhook /bot. Twilio reintenta el webhook cuando no respondemos a
+# tiempo (p. ej. con la instancia de Render recién despertada), y el reintento trae el mismo
+# MessageSid. La primera entrega de cada MessageSid se atiende normalmente; las repetidas
+# reciben el mismo TwiML que la primera sin pasar otra vez por el bot, así que el último
+# mensaje de una conversación no puede crear dos pedidos.
+#
+# Las respuestas se guardan en memoria, acotadas por número y por tiempo. Con "coleccion"
+# (varios procesos del backend) se comparten además en MongoDB: el primer proceso que inserta
+# el MessageSid lo atiende y los demás esperan su respuesta.
+
+# TwiML sin mensajes: lo que se responde a un reintento si la primera entrega sigue en curso
+# pasado el tiempo de espera (Twilio no vuelve a reintentar y el mensaje no se atiende dos veces)
+RESPUESTA_VACIA = '<?xml version="1.0" encoding="UTF-8"?><Response />'
+
+
+class Entrega:
+    def __init__(self, momento):
+        self.momento = momento
+        self.respuesta = None
+        self.liberada = False
+        self.terminada = threading.Event()
+
+
+# Uso:
+#   repetida = deduplicador.reservar(sid)
+#   if repetida is not None: responder repetida
+#   si no, atender el mensaje y llamar a completar(sid, twiml), o a liberar(sid) si falla
+class DeduplicadorMensajes:
+    def __init__(self, capacidad=5000, ttl=3600, coleccion=None, espera=10):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.coleccion = coleccion
+        self.espera = espera
+        self.entregas = OrderedDict()
+        self.lock = threading.Lock()
+        if coleccion is not None:
+            try:
+                coleccion.create_index("creado", expireAfterSeconds=ttl)
+            except Exception as e:
+                print("Error al crear índice de mensajes recibidos:", e)
+
+    def purgar_caducadas(self, ahora):
+        # Las entregas están ordenadas de la más antigua a la más reciente
+        while self.entregas:
+            sid, entrega = next(iter(self.entregas.items()))
+            if ahora - entrega.momento < self.ttl:
+                break
+            del self.entregas[sid]
+
+    # None si el mensaje es nuevo y lo atiende quien llama; si es una entrega repetida, el
+    # TwiML de la primera (esperando hasta "espera" segundos si aún se está atendiendo)
+    def reservar(self, sid):
+        limite = time.monotonic() + self.espera
+        while True:
+            ahora = time.monotonic()
+            with self.lock:
+                self.purgar_caducadas(ahora)
+                entrega = self.entregas.get(sid)
+                nueva = entrega is None
+                if nueva:
+                    entrega = self.entregas[sid] = Entrega(ahora)
+                    while len(self.entregas) > self.capacidad:
+                        self.entregas.popitem(last=False)
+            if nueva:
+                return self.reservar_compartido(sid, limite)
+            entrega.terminada.wait(max(0, limite - time.monotonic()))
+            if entrega.respuesta is not None:
+                return entrega.respuesta
+            # Si la primera entrega falló, esta la vuelve a intentar
+            if not entrega.liberada:
+                return RESPUESTA_VACIA
+
+    # Con varios procesos, el MessageSid se reserva también en MongoDB. Si MongoDB falla se
+    # atiende el mensaje igualmente: es preferible un posible duplicado a no responder.
+    def reservar_compartido(self, sid, limite):
+        if self.coleccion is None:
+            return None
+        try:
+            while True:
+                try:
+                    self.coleccion.insert_one({"_id": sid, "respuesta": None, "creado": datetime.now()})
+                    return None
+                except DuplicateKeyError:
+                    pass
+                documento = self.coleccion.find_one({"_id": sid})
+                while documento is not None and documento.get("respuesta") is None and time.monotonic() < limite:
+                    time.sleep(0.2)
+                    documento = self.coleccion.find_one({"_id": sid})
+                if documento is None:
+                    # El otro proceso ha liberado el mensaje: se vuelve a intentar reservarlo
+                    continue
+                respuesta = documento.get("respuesta")
+                if respuesta is None:
+                    self.liberar(sid, compartir=False)
+                    return RESPUESTA_VACIA
+                self.completar(sid, respuesta, compartir=False)
+                return respuesta
+        except Exception as e:
+            print("Error al comprobar mensajes repetidos:", e)
+            return None
+
+    def completar(self, sid, respuesta, compartir=True):
+        with self.lock:
+            entrega = self.entregas.get(sid)
+            if entrega is None:
+                entrega = self.entregas[sid] = Entrega(time.monotonic())
+            entrega.respuesta = respuesta
+            entrega.terminada.set()
+        if compartir and self.coleccion is not None:
+            try:
+                self.coleccion.update_one({"_id": sid}, {"$set": {"respuesta": respuesta}}, upsert=True)
+            except Exception as e:
+                print("Error al guardar la respuesta del mensaje:", e)
+
+    # La entrega ha fallado: el siguiente reintento de Twilio se atiende desde el principio
+    def liberar(self, sid, compartir=True):
+        with self.lock:
+            entrega = self.entregas.pop(sid, None)
+        if entrega is not None:
+            entrega.liberada = True
+            entrega.terminada.set()
+        if compartir and self.coleccion is not None:
+            try:
+                self.coleccion.delete_one({"_id": sid, "respuesta": None})
+            except Exception as e:
+                print("Error al liberar el mensaje:", e)
+
+    def __len__(self):
+        return len(self.entregas)
@@ -0,0 +1,46 @@
+import threading
+
+# Franjas horarias de apertura: (etiqueta, hora inicial incluida, hora final excluida)
+FRANJAS = (
+    ("13:00–16:00", "13:00", "16:00"),
+    ("20:00–23:00", "20:00", "23:00")
+)
+
+
+# Caché de estadísticas por rango de fechas. "calcular(desde, hasta)" obtiene las
+# estadísticas (del resumen diario, resumen.py). Cada resultado queda asociado a la versión
+# de cambios de los pedidos; cualquier escritura (de este u otro proceso) cambia esa
+# versión y la siguiente consulta recalcula.
+class CacheEstadisticas:
+    def __init__(self, calcular, obtener_version, capacidad=32):
+        self.calcular = calcular
+        self.obtener_version = obtener_version
+        self.capacidad = capacidad
+        self.version = None
+        self.resultados = {}
+        self.lock = threading.Lock()
+
+    def invalidar(self):
+        with self.lock:
+            self.version = None
+            self.resultados.clear()
+
+    # "version" es la ya leída para el ETag, si la hay
+    def obtener(self, desde=None, hasta=None, version=None):
+        if version is None:
+            version = self.obtener_version()
+        clave = (desde, hasta)
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.resultados.clear()
+            if clave in self.resultados:
+                return self.resultados[clave]
+        resultado = self.calcular(desde, hasta)
+        resultado["version"] = version
+        with self.lock:
+            if version == self.version:
+                if len(self.resultados) >= self.capacidad:
+                    self.resultados.pop(next(iter(self.resultados)))
+                self.resultados[clave] = resultado
+        return resultado
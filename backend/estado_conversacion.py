@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+# Almacenes del estado de las conversaciones del bot de WhatsApp, indexadas por teléfono.
+# Todos exponen la misma interfaz: obtener(numero), guardar(numero, estado) y eliminar(numero).
+
+
+# Estado en memoria del proceso, acotado: como mucho "capacidad" conversaciones (se descarta
+# la usada hace más tiempo) y cada una caduca tras "ttl" segundos sin mensajes.
+class EstadoMemoria:
+    def __init__(self, capacidad=1000, ttl=1800):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.conversaciones = OrderedDict()
+        self.lock = threading.Lock()
+
+    def purgar_caducadas(self, ahora):
+        # Las conversaciones están ordenadas de la menos a la más recientemente usada
+        while self.conversaciones:
+            numero, (actualizado, _) = next(iter(self.conversaciones.items()))
+            if ahora - actualizado < self.ttl:
+                break
+            del self.conversaciones[numero]
+
+    def obtener(self, numero):
+        ahora = time.monotonic()
+        with self.lock:
+            self.purgar_caducadas(ahora)
+            entrada = self.conversaciones.get(numero)
+            if entrada is None:
+                return None
+            self.conversaciones.move_to_end(numero)
+            return dict(entrada[1])
+
+    def guardar(self, numero, estado):
+        ahora = time.monotonic()
+        with self.lock:
+            self.conversaciones[numero] = (ahora, dict(estado))
+            self.conversaciones.move_to_end(numero)
+            self.purgar_caducadas(ahora)
+            while len(self.conversaciones) > self.capacidad:
+                self.conversaciones.popitem(last=False)
+
+    def eliminar(self, numero):
+        with self.lock:
+            self.conversaciones.pop(numero, None)
+
+    def __len__(self):
+        return len(self.conversaciones)
+
+
+# Estado compartido en MongoDB, para poder atender /bot con varios procesos.
+# Un índice TTL borra las conversaciones abandonadas; como MongoDB purga cada minuto,
+# al leer también se ignoran las que ya han caducado.
+class EstadoMongo:
+    def __init__(self, coleccion, ttl=1800):
+        self.coleccion = coleccion
+        self.ttl = ttl
+        try:
+            self.coleccion.create_index("actualizado", expireAfterSeconds=ttl)
+        except Exception as e:
+            print("Error al crear índice de conversaciones:", e)
+
+    def obtener(self, numero):
+        limite = datetime.now() - timedelta(seconds=self.ttl)
+        doc = self.coleccion.find_one({"_id": numero, "actualizado": {"$gte": limite}})
+        return doc["estado"] if doc else None
+
+    def guardar(self, numero, estado):
+        self.coleccion.replace_one(
+            {"_id": numero},
+            {"_id": numero, "estado": estado, "actualizado": datetime.now()},
+            upsert=True
+        )
+
+    def eliminar(self, numero):
+        self.coleccion.delete_one({"_id": numero})
+
+    def __len__(self):
+        return self.coleccion.count_documents({})
+
+
+# Interfaz asíncrona para asgi.py. El estado en memoria no hace E/S, así que basta con
+# exponer los mismos métodos como corrutinas; con varios procesos hay que usar EstadoMongoAsync.
+class EstadoMemoriaAsync(EstadoMemoria):
+    async def obtener(self, numero):
+        return EstadoMemoria.obtener(self, numero)
+
+    async def guardar(self, numero, estado):
+        EstadoMemoria.guardar(self, numero, estado)
+
+    async def eliminar(self, numero):
+        EstadoMemoria.eliminar(self, numero)
+
+
+# EstadoMongo con el driver asíncrono de pymongo. El índice TTL se crea con iniciar().
+class EstadoMongoAsync:
+    def __init__(self, coleccion, ttl=1800):
+        self.coleccion = coleccion
+        self.ttl = ttl
+
+    async def iniciar(self):
+        try:
+            await self.coleccion.create_index("actualizado", expireAfterSeconds=self.ttl)
+        except Exception as e:
+            print("Error al crear índice de conversaciones:", e)
+
+    async def obtener(self, numero):
+        limite = datetime.now() - timedelta(seconds=self.ttl)
+        doc = await self.coleccion.find_one({"_id": numero, "actualizado": {"$gte": limite}})
+        return doc["estado"] if doc else None
+
+    async def guardar(self, numero, estado):
+        await self.coleccion.replace_one(
+            {"_id": numero},
+            {"_id": numero, "estado": estado, "actualizado": datetime.now()},
+            upsert=True
+        )
+
+    async def eliminar(self, numero):
+        await self.coleccion.delete_one({"_id": numero})
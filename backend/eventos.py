@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+
+
+# Canal en memoria con los últimos cambios de pedidos publicados por este proceso.
+# Cada evento lleva una secuencia local (orden de publicación) además de la versión
+# global del pedido, para que un suscriptor no pierda eventos que se publiquen
+# fuera de orden entre hilos.
+class CanalEventos:
+    def __init__(self, capacidad=1000):
+        self.eventos = deque(maxlen=capacidad)
+        self.condicion = threading.Condition()
+        self.secuencia = 0
+        # Mayor versión publicada y suscriptores esperando ahora mismo (para VigilanteCambios)
+        self.ultima_version = 0
+        self.esperando = 0
+
+    def publicar(self, version, pedido=None, eliminado=None):
+        with self.condicion:
+            self.secuencia += 1
+            self.ultima_version = max(self.ultima_version, version)
+            self.eventos.append({
+                "secuencia": self.secuencia,
+                "version": version,
+                "pedido": pedido,
+                "eliminado": eliminado
+            })
+            self.condicion.notify_all()
+
+    def publicar_pedido(self, pedido):
+        self.publicar(pedido.get("version", 0), pedido=pedido)
+
+    def publicar_eliminado(self, id_pedido, version):
+        self.publicar(version, eliminado=id_pedido)
+
+    def secuencia_actual(self):
+        with self.condicion:
+            return self.secuencia
+
+    # Bloquea hasta que haya eventos posteriores a "desde" o venza el tiempo de espera.
+    # Devuelve la nueva secuencia y los eventos pendientes (lista vacía si venció el tiempo).
+    def esperar(self, desde, timeout):
+        with self.condicion:
+            self.esperando += 1
+            try:
+                self.condicion.wait_for(lambda: self.secuencia > desde, timeout)
+            finally:
+                self.esperando -= 1
+            pendientes = [e for e in self.eventos if e["secuencia"] > desde]
+            return self.secuencia, pendientes
+
+    # Despierta a los suscriptores sin ningún evento: consultan la base de datos, igual que
+    # al vencer el tiempo de espera
+    def avisar(self):
+        with self.condicion:
+            self.secuencia += 1
+            self.condicion.notify_all()
+
+
+# Aviso entre procesos. Con varios workers (gunicorn.conf.py) un panel conectado a uno no
+# recibe los eventos que publica otro. Mientras haya suscriptores esperando, un hilo por
+# proceso lee la versión de cambios ("leer_version", una consulta por proceso, no por panel)
+# cada "intervalo" segundos; si ha subido por encima de lo publicado en este proceso, otro
+# ha escrito y se despierta a los suscriptores para que consulten la base de datos.
+class VigilanteCambios:
+    def __init__(self, canal, leer_version, intervalo=1):
+        self.canal = canal
+        self.leer_version = leer_version
+        self.intervalo = intervalo
+        self.vista = 0
+        self.detenido = threading.Event()
+        self.hilo = None
+
+    def comprobar(self):
+        version = self.leer_version()
+        if version > self.vista and version > self.canal.ultima_version:
+            self.canal.avisar()
+        self.vista = max(self.vista, version)
+
+    def trabajar(self):
+        while not self.detenido.is_set():
+            if self.canal.esperando:
+                try:
+                    self.comprobar()
+                except Exception as e:
+                    print("Error al comprobar los cambios de otros procesos:", e)
+            self.detenido.wait(self.intervalo)
+
+    def iniciar(self):
+        self.hilo = threading.Thread(target=self.trabajar, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.detenido.set()
+
+
+# Convierte una lista de eventos al mismo formato que devuelve la sincronización incremental.
+# Solo sirve si las versiones posteriores al cursor siguen a este sin huecos: una versión que
+# falta puede ser una escritura aún en curso, de otro proceso o de un evento que ya ha salido
+# del canal (está lleno), y saltarla la perdería para siempre. En ese caso devuelve None y
+# los cambios se consultan en la base de datos.
+def eventos_a_cambios(eventos, cursor):
+    nuevos = sorted((e for e in eventos if e["version"] > cursor), key=lambda e: e["version"])
+    if any(evento["version"] != cursor + n for n, evento in enumerate(nuevos, 1)):
+        return None
+    pedidos = {}
+    eliminados = []
+    for evento in nuevos:
+        cursor = evento["version"]
+        if evento["pedido"] is not None:
+            pedidos[evento["pedido"]["id"]] = evento["pedido"]
+        if evento["eliminado"] is not None:
+            pedidos.pop(evento["eliminado"], None)
+            eliminados.append(evento["eliminado"])
+    return {"cursor": cursor, "completo": False, "pedidos": list(pedidos.values()), "eliminados": eliminados}
@@ -0,0 +1,27 @@
+import os
+
+# Arranque del backend en producción con varios procesos:
+#   gunicorn -c gunicorn.conf.py
+# Por defecto sirve app.py (Flask) con hilos. Con SERVIDOR=asgi sirve asgi.py con uvicorn,
+# que atiende muchas peticiones concurrentes por proceso sin bloquearse en MongoDB; es solo
+# para benchmarks, no para producción (le faltan rutas de app.py, ver asgi.py).
+# Cada proceso crea sus propios clientes de MongoDB, hilos de la bandeja de salida y
+# métricas, por eso no se usa preload_app.
+# Los eventos de pedidos se publican en memoria en cada proceso: un panel conectado a un
+# worker se entera de lo que escriben los demás por vigilante_cambios (app.py), en como mucho
+# EVENTOS_INTERVALO_AVISO segundos.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+if os.environ.get("SERVIDOR") == "asgi":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_HILOS", 8))
+
+# El flujo de eventos (/api/pedidos/eventos) mantiene la conexión abierta con latidos
+timeout = 120
+graceful_timeout = 30
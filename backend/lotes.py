@@ -0,0 +1,72 @@
+from pymongo import DeleteOne, UpdateMany
+
+from menu import PLATOS_POR_NOMBRE
+from productos import normalizar_productos
+
+# Operaciones sobre varios pedidos a la vez (PATCH y DELETE /api/pedidos/bulk), compartidas
+# por app.py y asgi.py. El cuerpo de la petición lleva los IDs y, para el cambio, solo los
+# campos que se modifican:
+#   {"ids": [4, 7, 9], "cambios": {"estado": "entregado"}}
+# La respuesta trae el resultado de cada ID: "actualizado" / "eliminado" o "no_encontrado".
+
+MAXIMO_IDS = 500
+
+# Campos que asigna el servidor y no se pueden cambiar en lote
+CAMPOS_PROTEGIDOS = ("_id", "id", "version", "timestamp")
+
+
+def leer_ids(datos):
+    if not isinstance(datos, dict):
+        raise ValueError("El cuerpo debe ser un objeto JSON")
+    ids = datos.get("ids")
+    if not isinstance(ids, list) or not ids:
+        raise ValueError("El campo ids debe ser una lista de IDs de pedido")
+    if any(isinstance(i, bool) or not isinstance(i, int) for i in ids):
+        raise ValueError("Los IDs de pedido deben ser números enteros")
+    if len(ids) > MAXIMO_IDS:
+        raise ValueError(f"Como máximo se pueden cambiar {MAXIMO_IDS} pedidos a la vez")
+    # Sin repetidos, en el orden recibido
+    return list(dict.fromkeys(ids))
+
+
+# "platos_por_nombre" convierte las líneas de productos antiguas en texto (por defecto, con el menú inicial)
+def leer_cambios(datos, platos_por_nombre=PLATOS_POR_NOMBRE):
+    cambios = datos.get("cambios")
+    if not isinstance(cambios, dict):
+        raise ValueError("El campo cambios debe ser un objeto con los campos a modificar")
+    cambios = {k: v for k, v in cambios.items() if k not in CAMPOS_PROTEGIDOS}
+    if not cambios:
+        raise ValueError("No hay campos que modificar")
+    if "productos" in cambios:
+        cambios["productos"] = normalizar_productos(cambios["productos"], platos_por_nombre)
+    return cambios
+
+
+# Una actualización por pedido, cada una con su propia versión: las len(ids) versiones que
+# terminan en "ultima_version", reservadas de una vez. Con bulk_write ordenado los pedidos
+# se escriben en el orden de sus versiones. Devuelve las operaciones y la versión de cada ID.
+# Se usa UpdateMany porque el ID es único (cada operación toca un solo pedido) y, a diferencia
+# de UpdateOne, también funciona en bulk_write con mongomock.
+def operaciones_actualizacion(ids, cambios, ultima_version, timestamp):
+    primera = ultima_version - len(ids) + 1
+    versiones = {id_pedido: primera + n for n, id_pedido in enumerate(ids)}
+    operaciones = [
+        UpdateMany({"id": id_pedido}, {"$set": dict(cambios, timestamp=timestamp, version=version)})
+        for id_pedido, version in versiones.items()
+    ]
+    return operaciones, versiones
+
+
+def operaciones_borrado(ids):
+    return [DeleteOne({"id": id_pedido}) for id_pedido in ids]
+
+
+# Marcas de borrado de los pedidos eliminados, con versiones consecutivas
+def marcas_borrado(ids, ultima_version, timestamp):
+    primera = ultima_version - len(ids) + 1
+    return [{"id": id_pedido, "version": primera + n, "timestamp": timestamp} for n, id_pedido in enumerate(ids)]
+
+
+def resultados(ids, hechos, resultado):
+    return [{"id": id_pedido, "resultado": resultado if id_pedido in hechos else "no_encontrado"}
+            for id_pedido in ids]
@@ -0,0 +1,241 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import InsertOne, ReturnDocument, UpdateMany
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+NUMERO_WHATSAPP = "whatsapp:+14155238886"
+
+
+# Envía mensajes por WhatsApp con un único cliente de Twilio compartido por todos los hilos
+class EnviadorTwilio:
+    def __init__(self, account_sid, auth_token):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+
+    def enviar(self, telefono, mensaje):
+        msg = self.client.messages.create(
+            from_=NUMERO_WHATSAPP,
+            to=f"whatsapp:{telefono}",
+            body=mensaje
+        )
+        return msg.sid
+
+
+# Enviador local para pruebas: guarda los mensajes en memoria en lugar de llamar a Twilio.
+# Con "fallos" se puede simular que los primeros envíos fallan.
+class EnviadorFalso:
+    def __init__(self, fallos=0):
+        self.enviados = []
+        self.fallos = fallos
+        self.lock = threading.Lock()
+
+    def enviar(self, telefono, mensaje):
+        with self.lock:
+            if self.fallos > 0:
+                self.fallos -= 1
+                raise Exception("Fallo simulado de Twilio")
+            self.enviados.append((telefono, mensaje))
+            return f"FALSO{len(self.enviados)}"
+
+
+# Bandeja de salida persistida en MongoDB. Los manejadores HTTP solo encolan el mensaje;
+# un grupo de hilos lo envía después, reintentando con espera exponencial.
+# Los mensajes con la misma "clave" que aún no se han enviado se fusionan: solo se envía
+# el último (p. ej. "en_preparacion" seguido de "preparado" a los pocos segundos).
+# Un hilo que reclama un mensaje lo tiene "plazo_envio" segundos; si el proceso se cae a
+# medias, pasado ese plazo cualquier proceso lo devuelve a la cola (recuperar).
+class BandejaSalida:
+    def __init__(self, coleccion, enviador, trabajadores=2, ventana_fusion=5,
+                 max_intentos=5, espera_base=2, espera_maxima=300, plazo_envio=300):
+        self.coleccion = coleccion
+        self.enviador = enviador
+        self.trabajadores = trabajadores
+        self.ventana_fusion = ventana_fusion
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.plazo_envio = plazo_envio
+        self.proxima_recuperacion = 0
+        self.aviso = threading.Event()
+        self.detenido = threading.Event()
+        self.hilos = []
+        self.crear_indices()
+
+    def crear_indices(self):
+        try:
+            self.coleccion.create_index([("estado", 1), ("enviar_despues", 1)])
+            # Como mucho un mensaje pendiente por clave
+            self.coleccion.create_index(
+                "clave", unique=True,
+                partialFilterExpression={"estado": "pendiente"}
+            )
+            # Los mensajes enviados se purgan solos al cabo de una semana
+            self.coleccion.create_index("enviado_en", expireAfterSeconds=7 * 24 * 3600)
+        except Exception as e:
+            print("Error al crear índices de la bandeja de salida:", e)
+
+    def datos_mensaje(self, telefono, mensaje, clave, ahora):
+        # Los mensajes con clave se retrasan unos segundos para poder fusionar cambios rápidos
+        espera = 0 if clave is None else self.ventana_fusion
+        return {
+            "telefono": telefono,
+            "mensaje": mensaje,
+            "estado": "pendiente",
+            "intentos": 0,
+            "creado": ahora,
+            "enviar_despues": ahora + timedelta(seconds=espera)
+        }
+
+    def encolar(self, telefono, mensaje, clave=None):
+        datos = self.datos_mensaje(telefono, mensaje, clave, datetime.now())
+        if clave is None:
+            self.coleccion.insert_one(datos)
+        else:
+            try:
+                self.coleccion.update_one(
+                    {"clave": clave, "estado": "pendiente"},
+                    {"$set": datos},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # Otro hilo insertó el pendiente a la vez; se actualiza el existente
+                self.coleccion.update_one({"clave": clave, "estado": "pendiente"}, {"$set": datos})
+        self.aviso.set()
+
+    # Encola varios mensajes (telefono, mensaje, clave) con una sola escritura en la base de
+    # datos, p. ej. los avisos de un cambio de estado de muchos pedidos a la vez
+    def encolar_varios(self, mensajes):
+        if not mensajes:
+            return
+        ahora = datetime.now()
+        operaciones = []
+        claves = []
+        for telefono, mensaje, clave in mensajes:
+            datos = self.datos_mensaje(telefono, mensaje, clave, ahora)
+            if clave is None:
+                operaciones.append(InsertOne(datos))
+            else:
+                # Hay como mucho un pendiente por clave (índice único parcial)
+                operaciones.append(UpdateMany({"clave": clave, "estado": "pendiente"}, {"$set": datos}, upsert=True))
+            claves.append((clave, datos))
+        try:
+            self.coleccion.bulk_write(operaciones, ordered=False)
+        except BulkWriteError as e:
+            # Igual que en encolar: si otro hilo insertó a la vez el pendiente de una clave,
+            # se actualiza el existente
+            for error in e.details.get("writeErrors", []):
+                clave, datos = claves[error["index"]]
+                if error.get("code") != 11000 or clave is None:
+                    print("Error al encolar mensaje:", error.get("errmsg"))
+                    continue
+                self.coleccion.update_one({"clave": clave, "estado": "pendiente"}, {"$set": datos})
+        self.aviso.set()
+
+    def iniciar(self):
+        for _ in range(self.trabajadores):
+            hilo = threading.Thread(target=self.trabajar, daemon=True)
+            hilo.start()
+            self.hilos.append(hilo)
+
+    def detener(self):
+        self.detenido.set()
+        self.aviso.set()
+
+    def reclamar(self):
+        return self.coleccion.find_one_and_update(
+            {"estado": "pendiente", "enviar_despues": {"$lte": datetime.now()}},
+            {"$set": {"estado": "enviando", "reclamado_en": datetime.now()}},
+            sort=[("enviar_despues", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    # Devuelve a la cola, de uno en uno, los mensajes reclamados hace más de "plazo_envio"
+    # segundos (quedaron a medio enviar en un proceso que se cayó). Los que están reclamados
+    # por un hilo vivo no se tocan, así que otro proceso que arranca no los envía dos veces.
+    # Si mientras tanto se encoló otro pendiente con la misma clave, el antiguo se descarta.
+    # Devuelve cuántos ha recuperado.
+    def recuperar(self):
+        limite = datetime.now() - timedelta(seconds=self.plazo_envio)
+        vencidos = {"estado": "enviando", "$or": [
+            {"reclamado_en": {"$lt": limite}},
+            {"reclamado_en": {"$exists": False}}
+        ]}
+        recuperados = 0
+        while not self.detenido.is_set():
+            doc = self.coleccion.find_one(vencidos, {"_id": 1})
+            if not doc:
+                break
+            try:
+                self.coleccion.update_one(dict(vencidos, _id=doc["_id"]), {"$set": {"estado": "pendiente"}})
+                recuperados += 1
+            except DuplicateKeyError:
+                self.coleccion.update_one(
+                    dict(vencidos, _id=doc["_id"]),
+                    {"$set": {"estado": "descartado", "error": "Sustituido por un mensaje más reciente"}}
+                )
+        return recuperados
+
+    # Procesa los mensajes pendientes que ya tocan; devuelve cuántos ha tratado
+    def procesar_pendientes(self):
+        procesados = 0
+        while not self.detenido.is_set():
+            doc = self.reclamar()
+            if not doc:
+                return procesados
+            self.enviar(doc)
+            procesados += 1
+        return procesados
+
+    def enviar(self, doc):
+        try:
+            sid = self.enviador.enviar(doc["telefono"], doc["mensaje"])
+            print("Mensaje enviado:", sid)
+            self.coleccion.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"estado": "enviado", "sid": sid, "enviado_en": datetime.now()}}
+            )
+        except Exception as e:
+            intentos = doc.get("intentos", 0) + 1
+            print(f"Error al enviar mensaje (intento {intentos}):", e)
+            if intentos >= self.max_intentos:
+                cambios = {"estado": "fallido", "intentos": intentos, "error": str(e)}
+            else:
+                espera = min(self.espera_base ** intentos, self.espera_maxima)
+                cambios = {
+                    "estado": "pendiente",
+                    "intentos": intentos,
+                    "error": str(e),
+                    "enviar_despues": datetime.now() + timedelta(seconds=espera)
+                }
+            try:
+                self.coleccion.update_one({"_id": doc["_id"]}, {"$set": cambios})
+            except DuplicateKeyError:
+                # Mientras tanto se encoló un mensaje más reciente con la misma clave
+                self.coleccion.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"estado": "descartado", "error": str(e)}}
+                )
+
+    def trabajar(self):
+        while not self.detenido.is_set():
+            try:
+                if time.monotonic() >= self.proxima_recuperacion:
+                    self.proxima_recuperacion = time.monotonic() + self.plazo_envio
+                    self.recuperar()
+                self.procesar_pendientes()
+            except Exception as e:
+                print("Error en la bandeja de salida:", e)
+                time.sleep(1)
+            self.aviso.wait(1)
+            self.aviso.clear()
+
+    # Espera a que no quede nada pendiente (útil en pruebas y al apagar el servidor)
+    def vaciar(self, timeout=10):
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            if not self.coleccion.count_documents({"estado": {"$in": ["pendiente", "enviando"]}}):
+                return True
+            time.sleep(0.05)
+        return False
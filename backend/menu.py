@@ -0,0 +1,44 @@
+import json
+
+# Lista de platos del menú. Es el menú inicial: el menú en uso está en MongoDB (catalogo.py)
+# y se puede cambiar con PUT /api/menu sin volver a desplegar.
+PLATOS = {
+    "1": "Spaghetti alla Carbonara",
+    "2": "Pasta al Pomodoro",
+    "3": "Fettuccine Alfredo",
+    "4": "Penne al Pesto con Pollo",
+    "5": "Pizza Margherita",
+    "6": "Pizza Prosciutto e Funghi",
+    "7": "Lasagna Tradicional",
+    "8": "Risotto ai Frutti di Mare",
+    "9": "Ensalada Caprese",
+    "10": "Saltimbocca alla Romana"
+}
+PLATOS_POR_NOMBRE = {nombre: n for n, nombre in PLATOS.items()}
+
+
+# Una versión del menú, que no cambia una vez creada. Todo lo que se deriva de los platos
+# (índice por nombre, listado para WhatsApp, cuerpo de GET /api/menu y las respuestas del bot
+# que incluyen el listado) se monta una sola vez por versión.
+class Menu:
+    def __init__(self, platos, version=0):
+        self.platos = dict(platos)
+        self.version = version
+        self.platos_por_nombre = {nombre: n for n, nombre in self.platos.items()}
+        self.listado = "\n".join(f"{n}. {nombre}" for n, nombre in self.platos.items())
+        self.json = json.dumps({
+            "version": version,
+            "platos": [{"id": n, "nombre": nombre} for n, nombre in self.platos.items()]
+        }, ensure_ascii=False)
+        self.etag = f"menu-{version}"
+        self.respuestas = {}
+
+    # Sustituye {listado} en una respuesta del bot; cada plantilla se monta una vez por versión
+    def rellenar(self, plantilla):
+        texto = self.respuestas.get(plantilla)
+        if texto is None:
+            texto = self.respuestas[plantilla] = plantilla.replace("{listado}", self.listado)
+        return texto
+
+
+MENU_INICIAL = Menu(PLATOS)
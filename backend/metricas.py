@@ -0,0 +1,203 @@
+import threading
+import time
+
+from pymongo import monitoring
+
+# Límites (en segundos) de los histogramas de latencia
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def formatear_etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{escapar(v)}"' for n, v in pares) + "}"
+
+
+# Contador con etiquetas en formato de Prometheus
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def incrementar(self, cantidad=1, **etiquetas):
+        clave = tuple(etiquetas.get(e, "") for e in self.etiquetas)
+        with self.lock:
+            self.valores[clave] = self.valores.get(clave, 0) + cantidad
+
+    def exportar(self):
+        with self.lock:
+            valores = dict(self.valores)
+        return [f"{self.nombre}{formatear_etiquetas(self.etiquetas, clave)} {valor}"
+                for clave, valor in sorted(valores.items())]
+
+
+# Histograma acumulado (buckets "le", suma y número de observaciones)
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(etiquetas.get(e, "") for e in self.etiquetas)
+        with self.lock:
+            serie = self.series.get(clave)
+            if serie is None:
+                serie = self.series[clave] = {"buckets": [0] * len(self.limites), "suma": 0.0, "total": 0}
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie["buckets"][i] += 1
+                    break
+            serie["suma"] += valor
+            serie["total"] += 1
+
+    # Mide la duración de un bloque "with"
+    def medir(self, **etiquetas):
+        return Cronometro(self, etiquetas)
+
+    def exportar(self):
+        with self.lock:
+            series = {clave: dict(serie, buckets=list(serie["buckets"])) for clave, serie in self.series.items()}
+        lineas = []
+        for clave, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites, serie["buckets"]):
+                acumulado += cantidad
+                lineas.append(f"{self.nombre}_bucket{formatear_etiquetas(self.etiquetas, clave, ('le', limite))} {acumulado}")
+            lineas.append(f"{self.nombre}_bucket{formatear_etiquetas(self.etiquetas, clave, ('le', '+Inf'))} {serie['total']}")
+            lineas.append(f"{self.nombre}_sum{formatear_etiquetas(self.etiquetas, clave)} {serie['suma']}")
+            lineas.append(f"{self.nombre}_count{formatear_etiquetas(self.etiquetas, clave)} {serie['total']}")
+        return lineas
+
+
+class Cronometro:
+    def __init__(self, histograma, etiquetas):
+        self.histograma = histograma
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histograma.observar(time.perf_counter() - self.inicio, **self.etiquetas)
+        return False
+
+
+# Conjunto de métricas del proceso, exportadas juntas en /metrics.
+# Cada proceso del backend lleva las suyas; Prometheus las agrega por instancia.
+class RegistroMetricas:
+    def __init__(self):
+        self.metricas = []
+
+    def registrar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self.registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self.registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def exportar(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas += metrica.exportar()
+        return "\n".join(lineas) + "\n"
+
+
+# Listener de pymongo que mide cada comando enviado a MongoDB (find, insert, update,
+# findAndModify, aggregate...) por colección. Los fallos se cuentan aparte.
+class EscuchaComandosMongo(monitoring.CommandListener):
+    def __init__(self, histograma, fallos):
+        self.histograma = histograma
+        self.fallos = fallos
+        self.colecciones = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        coleccion = event.command.get(event.command_name)
+        if not isinstance(coleccion, str):
+            coleccion = ""
+        with self.lock:
+            self.colecciones[(event.connection_id, event.request_id)] = coleccion
+
+    def coleccion(self, event):
+        with self.lock:
+            return self.colecciones.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        self.histograma.observar(event.duration_micros / 1e6, comando=event.command_name,
+                                 coleccion=self.coleccion(event))
+
+    def failed(self, event):
+        coleccion = self.coleccion(event)
+        self.histograma.observar(event.duration_micros / 1e6, comando=event.command_name, coleccion=coleccion)
+        self.fallos.incrementar(comando=event.command_name, coleccion=coleccion)
+
+
+# Envuelve un enviador de WhatsApp midiendo la duración de cada llamada y su resultado
+class EnviadorMedido:
+    def __init__(self, enviador, histograma):
+        self.enviador = enviador
+        self.histograma = histograma
+
+    def enviar(self, telefono, mensaje):
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            sid = self.enviador.enviar(telefono, mensaje)
+            resultado = "ok"
+            return sid
+        finally:
+            self.histograma.observar(time.perf_counter() - inicio, resultado=resultado)
+
+
+# Métricas del backend, compartidas por app.py y asgi.py (cada proceso lleva las suyas)
+registro_metricas = RegistroMetricas()
+duracion_peticiones = registro_metricas.histograma(
+    "http_peticion_duracion_segundos", "Duración de las peticiones HTTP por ruta", ("metodo", "ruta", "estado"))
+peticiones_lentas = registro_metricas.contador(
+    "http_peticiones_lentas_total", "Peticiones que superan el umbral de petición lenta", ("metodo", "ruta"))
+duracion_mongo = registro_metricas.histograma(
+    "mongo_comando_duracion_segundos", "Duración de los comandos enviados a MongoDB", ("comando", "coleccion"))
+fallos_mongo = registro_metricas.contador(
+    "mongo_comando_fallos_total", "Comandos de MongoDB que han fallado", ("comando", "coleccion"))
+duracion_generar_id = registro_metricas.histograma(
+    "pedidos_generar_id_duracion_segundos", "Duración de la asignación de IDs de pedido")
+duracion_whatsapp = registro_metricas.histograma(
+    "whatsapp_envio_duracion_segundos", "Duración de las llamadas a Twilio para enviar mensajes", ("resultado",))
+mensajes_bot = registro_metricas.contador(
+    "bot_mensajes_total", "Mensajes recibidos en /bot según la fase de la conversación", ("fase",))
+mensajes_bot_repetidos = registro_metricas.contador(
+    "bot_mensajes_repetidos_total", "Reintentos de Twilio en /bot respondidos sin volver a atender el mensaje")
+conversaciones_bot = registro_metricas.contador(
+    "bot_conversaciones_completadas_total", "Reservas y pedidos confirmados por el bot", ("tipo",))
+
+
+# Registra la duración de una petición HTTP y avisa en el log si supera el umbral (en segundos)
+def registrar_peticion(metodo, ruta, url, estado, duracion, umbral):
+    duracion_peticiones.observar(duracion, metodo=metodo, ruta=ruta, estado=estado)
+    if duracion >= umbral:
+        peticiones_lentas.incrementar(metodo=metodo, ruta=ruta)
+        print(f"Petición lenta: {metodo} {url} {estado} {duracion * 1000:.0f} ms")
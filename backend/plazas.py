@@ -0,0 +1,217 @@
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from archivo import dia_de_fecha
+
+# Plazas de las reservas por día y franja. El día se divide en franjas de MINUTOS_FRANJA
+# minutos dentro del horario de apertura, y en cada franja pueden llegar como mucho
+# "capacidad" personas (la reserva de las 14:10 cuenta en la franja de las 14:00).
+#
+# Las personas reservadas se guardan en una colección con un documento por franja:
+#   {"_id": "2025-06-01 14:00", "personas": 18}
+# y cada reserva suma sus personas con una actualización condicional ($inc solo si caben),
+# así que dos reservas a la vez no pueden pasarse de la capacidad, aunque lleguen a procesos
+# distintos. Cada proceso guarda además una copia en memoria de la ocupación a partir de hoy,
+# que se actualiza con cada reserva propia y se recarga cada "intervalo" segundos con las de
+# los demás procesos; el bot la usa para comprobar la hora pedida y proponer las franjas libres
+# más cercanas sin consultar la base de datos.
+
+MINUTOS_FRANJA = 30
+HORARIO = (("13:00", "16:00"), ("20:00", "23:00"))
+
+# Campos de un pedido que cambian las plazas que ocupa
+CAMPOS_PLAZAS = ("tipo", "fecha", "hora", "personas")
+
+
+def minutos(hora):
+    return int(hora[:2]) * 60 + int(hora[3:5])
+
+
+def texto_hora(total):
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+
+# Inicio de cada franja del día, en orden: "13:00", "13:30", ...
+FRANJAS = tuple(
+    texto_hora(inicio)
+    for apertura, cierre in HORARIO
+    for inicio in range(minutos(apertura), minutos(cierre), MINUTOS_FRANJA)
+)
+
+
+# Franja de una hora HH:MM (None si está fuera del horario)
+def franja_de(hora):
+    try:
+        total = minutos(hora)
+    except (TypeError, ValueError):
+        return None
+    franja = texto_hora(total - total % MINUTOS_FRANJA)
+    return franja if franja in FRANJAS else None
+
+
+# (clave de la franja, personas) que ocupa un pedido, o None si no es una reserva con
+# fecha, hora dentro del horario y número de personas válidos
+def plazas_de(pedido):
+    if not pedido or pedido.get("tipo") != "reserva":
+        return None
+    dia = dia_de_fecha(pedido.get("fecha"))
+    franja = franja_de(pedido.get("hora"))
+    personas = pedido.get("personas")
+    if not dia or not franja or isinstance(personas, bool) or not isinstance(personas, int) or personas <= 0:
+        return None
+    return f"{dia} {franja}", personas
+
+
+class OcupacionReservas:
+    def __init__(self, coleccion, pedidos, capacidad=40, intervalo=60):
+        self.coleccion = coleccion
+        self.pedidos = pedidos
+        self.capacidad = capacidad
+        self.intervalo = intervalo
+        self.ocupadas = {}
+        self.lock = threading.Lock()
+        self.detenido = threading.Event()
+        self.hilo = None
+
+    # Recarga la copia en memoria con las franjas de hoy en adelante
+    def cargar(self):
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        ocupadas = {d["_id"]: d["personas"] for d in self.coleccion.find({"_id": {"$gte": hoy}})}
+        with self.lock:
+            self.ocupadas = ocupadas
+
+    def anotar(self, documento):
+        if documento:
+            with self.lock:
+                self.ocupadas[documento["_id"]] = documento["personas"]
+
+    # Plazas libres en la franja de esa fecha (DD-MM-AAAA) y hora, según la copia en memoria
+    def libres(self, fecha, hora):
+        dia = dia_de_fecha(fecha)
+        franja = franja_de(hora)
+        if not dia or not franja:
+            return None
+        return self.capacidad - self.ocupadas.get(f"{dia} {franja}", 0)
+
+    # Hasta "cantidad" franjas de esa fecha con sitio para "personas", de la más cercana a
+    # "hora" a la más lejana (sin la propia franja de "hora" ni las que ya han pasado)
+    def sugerencias(self, fecha, personas, hora=None, ahora=None, cantidad=3):
+        dia = dia_de_fecha(fecha)
+        if not dia:
+            return []
+        ahora = ahora or datetime.now()
+        pedida = franja_de(hora) if hora else None
+        referencia = minutos(hora) if pedida else 0
+        limite = ahora.strftime("%H:%M") if dia == ahora.strftime("%Y-%m-%d") else None
+        libres = [
+            franja for franja in FRANJAS
+            if franja != pedida
+            and (limite is None or franja > limite)
+            and self.capacidad - self.ocupadas.get(f"{dia} {franja}", 0) >= personas
+        ]
+        libres.sort(key=lambda franja: (abs(minutos(franja) - referencia), franja))
+        return libres[:cantidad]
+
+    # Ocupa las plazas de la reserva si caben; devuelve False si la franja está llena.
+    # Con "forzar" se ocupan aunque no quepan (para deshacer un cambio ya aplicado).
+    def reservar(self, pedido, forzar=False):
+        plazas = plazas_de(pedido)
+        if plazas is None:
+            return True
+        clave, personas = plazas
+        if forzar:
+            self.sumar(clave, personas)
+            return True
+        if personas > self.capacidad:
+            return False
+        try:
+            documento = self.coleccion.find_one_and_update(
+                {"_id": clave, "personas": {"$lte": self.capacidad - personas}},
+                {"$inc": {"personas": personas}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # La franja existe pero no caben: se actualiza la copia en memoria con lo que hay
+            self.anotar(self.coleccion.find_one({"_id": clave}))
+            return False
+        self.anotar(documento)
+        return True
+
+    def liberar(self, pedido):
+        plazas = plazas_de(pedido)
+        if plazas is not None:
+            self.sumar(plazas[0], -plazas[1])
+
+    def sumar(self, clave, personas):
+        try:
+            self.anotar(self.coleccion.find_one_and_update(
+                {"_id": clave}, {"$inc": {"personas": personas}},
+                upsert=True, return_document=ReturnDocument.AFTER))
+        except Exception as e:
+            print("Error al actualizar las plazas ocupadas:", e)
+
+    # Pasa una reserva de "antes" a "despues" (p. ej. otra hora o más personas). Primero se
+    # ocupan las plazas nuevas y luego se liberan las antiguas; devuelve False si no caben.
+    def cambiar(self, antes, despues, forzar=False):
+        plazas_antes, plazas_despues = plazas_de(antes), plazas_de(despues)
+        if plazas_antes == plazas_despues:
+            return True
+        if plazas_antes and plazas_despues and plazas_antes[0] == plazas_despues[0]:
+            # Misma franja: solo cuenta la diferencia de personas
+            clave, diferencia = plazas_antes[0], plazas_despues[1] - plazas_antes[1]
+            if diferencia < 0 or forzar:
+                self.sumar(clave, diferencia)
+                return True
+            return self.reservar({"tipo": "reserva", "fecha": despues.get("fecha"), "hora": despues.get("hora"),
+                                  "personas": diferencia})
+        if not self.reservar(despues, forzar):
+            return False
+        self.liberar(antes)
+        return True
+
+    # Recalcula la ocupación de hoy en adelante a partir de las reservas guardadas. Las
+    # reservas que lleguen mientras se recalcula pueden no contarse; conviene hacerlo con poco
+    # tráfico. Devuelve el número de franjas ocupadas.
+    def reconstruir(self):
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        ocupadas = {}
+        for pedido in self.pedidos.find({"tipo": "reserva"}, {"_id": 0, "tipo": 1, "fecha": 1, "hora": 1, "personas": 1}):
+            plazas = plazas_de(pedido)
+            if plazas and plazas[0] >= hoy:
+                ocupadas[plazas[0]] = ocupadas.get(plazas[0], 0) + plazas[1]
+        for clave, personas in ocupadas.items():
+            self.coleccion.replace_one({"_id": clave}, {"personas": personas}, upsert=True)
+        self.coleccion.delete_many({"_id": {"$gte": hoy, "$nin": list(ocupadas)}})
+        self.cargar()
+        return len(ocupadas)
+
+    # Borra las franjas de días pasados, que ya no se consultan
+    def purgar(self):
+        ayer = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        self.coleccion.delete_many({"_id": {"$lt": ayer}})
+
+    def trabajar(self):
+        try:
+            # Primer arranque con reservas ya guardadas: se calcula la ocupación desde ellas
+            if self.coleccion.find_one() is None and self.pedidos.find_one({"tipo": "reserva"}) is not None:
+                print("Franjas con reservas:", self.reconstruir())
+        except Exception as e:
+            print("Error al calcular la ocupación de las reservas:", e)
+        while not self.detenido.is_set():
+            try:
+                self.cargar()
+                self.purgar()
+            except Exception as e:
+                print("Error al cargar la ocupación de las reservas:", e)
+            self.detenido.wait(self.intervalo)
+
+    def iniciar(self):
+        self.hilo = threading.Thread(target=self.trabajar, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.detenido.set()
@@ -0,0 +1,77 @@
+import threading
+
+
+# Los productos de un pedido se guardan como líneas {"plato_id": "5", "cantidad": 2}.
+# Los pedidos antiguos los guardaban como texto "Pizza Margherita (x2)"; estas funciones
+# convierten ese formato y generan el texto solo al mostrarlo.
+
+
+# Convierte una línea antigua ("Nombre (xN)") al formato estructurado. Si el plato ya no
+# está en el menú se conserva su nombre en la línea.
+def normalizar_linea(producto, platos_por_nombre):
+    if isinstance(producto, dict):
+        return {k: v for k, v in producto.items() if k in ("plato_id", "cantidad", "nombre")}
+    nombre, cantidad = str(producto), 1
+    if " (x" in nombre:
+        base, resto = nombre.rsplit(" (x", 1)
+        try:
+            nombre, cantidad = base, int(resto.rstrip(")"))
+        except ValueError:
+            pass
+    plato_id = platos_por_nombre.get(nombre)
+    linea = {"plato_id": plato_id, "cantidad": cantidad}
+    if plato_id is None:
+        linea["nombre"] = nombre
+    return linea
+
+
+def normalizar_productos(productos, platos_por_nombre):
+    return [normalizar_linea(p, platos_por_nombre) for p in productos or []]
+
+
+def formatear_linea(linea, platos):
+    if isinstance(linea, str):
+        return linea
+    nombre = platos.get(linea.get("plato_id")) or linea.get("nombre") or "Plato desconocido"
+    return f"{nombre} (x{linea.get('cantidad', 1)})"
+
+
+def formatear_productos(productos, platos):
+    return [formatear_linea(linea, platos) for linea in productos or []]
+
+
+# Migración en línea de los pedidos con productos en texto. Trabaja por lotes y cada
+# actualización es condicional (solo si los productos no han cambiado mientras tanto),
+# así que puede ejecutarse con el backend atendiendo peticiones. Cada pedido migrado
+# recibe una nueva versión para que los paneles sincronizados reciban el cambio.
+def migrar_productos(coleccion, platos_por_nombre, versiones, lote=200):
+    migrados = 0
+    while True:
+        docs = list(coleccion.find({"productos": {"$type": "string"}}, {"_id": 1, "productos": 1}).limit(lote))
+        modificados = 0
+        for doc in docs:
+            with versiones.escritura() as version:
+                resultado = coleccion.update_one(
+                    {"_id": doc["_id"], "productos": doc["productos"]},
+                    {"$set": {
+                        "productos": normalizar_productos(doc["productos"], platos_por_nombre),
+                        "version": version
+                    }}
+                )
+            modificados += resultado.modified_count
+        migrados += modificados
+        if len(docs) < lote or not modificados:
+            return migrados
+
+
+def iniciar_migracion_productos(coleccion, platos_por_nombre, versiones):
+    def migrar():
+        try:
+            migrados = migrar_productos(coleccion, platos_por_nombre, versiones)
+            if migrados:
+                print("Pedidos migrados a productos estructurados:", migrados)
+        except Exception as e:
+            print("Error al migrar productos:", e)
+    hilo = threading.Thread(target=migrar, daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from pymongo import MongoClient
+
+from catalogo import ID_CATALOGO, platos_de
+from menu import Menu, MENU_INICIAL
+from resumen import ResumenDiario
+
+# Recalcula el resumen diario de estadísticas (resumen.py) a partir de los pedidos vivos y
+# archivados, con el menú en uso (el de MongoDB, catalogo.py). Usa las mismas variables de
+# entorno que app.py.
+#
+# Uso: python reconstruir_resumen.py              (recalcula el resumen)
+#      python reconstruir_resumen.py --comprobar  (solo compara el resumen guardado con el
+#                                                  que se calcularía, día a día)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula el resumen diario de estadísticas")
+    parser.add_argument("--comprobar", action="store_true",
+                        help="compara el resumen con el calculado a partir de los pedidos, sin escribir")
+    args = parser.parse_args()
+
+    db = MongoClient(os.environ.get("MONGO_CLIENT"))[os.environ.get("MONGO_DB")]
+    pedidos = db[os.environ.get("MONGO_PEDIDOS_COLLECTION")]
+    archivo = db[os.environ.get("MONGO_ARCHIVO_COLLECTION", "pedidos_archivo")]
+    contador = db[os.environ.get("MONGO_CONTADOR_COLLECTION")]
+    documento = db[os.environ.get("MONGO_MENU_COLLECTION", "menu")].find_one({"_id": ID_CATALOGO})
+    menu = Menu(platos_de(documento), documento["version"]) if documento else MENU_INICIAL
+    resumen = ResumenDiario(db[os.environ.get("MONGO_RESUMEN_COLLECTION", "estadisticas_diarias")], lambda: menu)
+
+    if args.comprobar:
+        distintos = resumen.comprobar([pedidos, archivo])
+        if not distintos:
+            print("El resumen coincide con los pedidos")
+        else:
+            print("Días del resumen que no coinciden con los pedidos:", ", ".join(distintos))
+            print("Ejecuta el script sin --comprobar para recalcularlo")
+            raise SystemExit(1)
+        return
+
+    print("Días en el resumen:", resumen.reconstruir([pedidos, archivo]))
+    # Nueva versión para que la caché de estadísticas y los ETag dejen de servir el resumen anterior
+    contador.update_one({"_id": "contador_cambios"}, {"$inc": {"valor": 1}}, upsert=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import threading
+
+from pymongo import UpdateMany
+
+from archivo import dia_pedido
+from estadisticas import FRANJAS
+from productos import normalizar_linea
+
+# Resumen diario de estadísticas, mantenido al escribir. Hay un documento por día:
+#   {"_id": "2025-06-01",
+#    "tipos": {"reserva": 12, "pedido_para_llevar": 30},
+#    "franjas": {"13:00–16:00": {"reserva": 5, "pedido_para_llevar": 18}, ...},
+#    "productos": {"5": 21, "n:Tiramisú": 2}}
+# Los productos se guardan por plato_id y, si el plato ya no está en el menú, por su nombre
+# ("n:" + nombre). Cada alta, cambio o borrado de pedidos suma con $inc la diferencia entre
+# cómo contaba el pedido antes y después, así que las estadísticas de un mes se leen de unos
+# 30 documentos pequeños. Si el resumen se desajusta (p. ej. tras un fallo entre la escritura
+# del pedido y la del resumen), reconstruir_resumen.py lo recalcula a partir de los pedidos.
+
+CAMPOS_PEDIDO = {"_id": 0, "tipo": 1, "fecha": 1, "timestamp": 1, "hora": 1, "productos": 1}
+
+
+# Los nombres de campo de MongoDB no pueden llevar "." ni empezar por "$"
+def clave_segura(texto):
+    return str(texto).replace(".", "_").replace("$", "_")
+
+
+def clave_producto(linea):
+    if linea.get("plato_id"):
+        return clave_segura(linea["plato_id"])
+    if linea.get("nombre"):
+        return "n:" + clave_segura(linea["nombre"])
+    return None
+
+
+# Cómo cuenta un pedido en el resumen: su día y los contadores que suma
+def aportacion(pedido, platos_por_nombre):
+    campos = {}
+    tipo = pedido.get("tipo")
+    if tipo:
+        campos[f"tipos.{clave_segura(tipo)}"] = 1
+    hora = str(pedido.get("hora") or "")[:5]
+    if tipo in ("reserva", "pedido_para_llevar"):
+        for etiqueta, inicio, fin in FRANJAS:
+            if inicio <= hora < fin:
+                campos[f"franjas.{etiqueta}.{tipo}"] = 1
+    for linea in pedido.get("productos") or []:
+        # Las líneas antiguas en texto cuentan igual que ya migradas
+        linea = normalizar_linea(linea, platos_por_nombre)
+        clave = clave_producto(linea)
+        cantidad = linea.get("cantidad")
+        if clave and isinstance(cantidad, (int, float)) and not isinstance(cantidad, bool):
+            campos[f"productos.{clave}"] = campos.get(f"productos.{clave}", 0) + cantidad
+    return dia_pedido(pedido), campos
+
+
+# Diferencias por día para una lista de pares (antes, despues); None si el pedido no existía
+# antes (alta) o ya no existe después (borrado)
+def diferencia(pares, platos_por_nombre):
+    dias = {}
+    for antes, despues in pares:
+        for pedido, signo in ((antes, -1), (despues, 1)):
+            if pedido is None:
+                continue
+            dia, campos = aportacion(pedido, platos_por_nombre)
+            if not dia:
+                continue
+            incrementos = dias.setdefault(dia, {})
+            for campo, valor in campos.items():
+                incrementos[campo] = incrementos.get(campo, 0) + signo * valor
+    return {dia: {c: v for c, v in campos.items() if v} for dia, campos in dias.items()
+            if any(campos.values())}
+
+
+# Un $inc por día. UpdateMany sobre el _id (un solo documento) también funciona en
+# bulk_write con mongomock.
+def operaciones_resumen(diferencias):
+    return [UpdateMany({"_id": dia}, {"$inc": campos}, upsert=True) for dia, campos in diferencias.items()]
+
+
+def anidar(campos):
+    documento = {}
+    for campo, valor in campos.items():
+        *ruta, ultimo = campo.split(".")
+        destino = documento
+        for parte in ruta:
+            destino = destino.setdefault(parte, {})
+        destino[ultimo] = valor
+    return documento
+
+
+def sin_ceros(documento):
+    limpio = {}
+    for campo, valor in documento.items():
+        if isinstance(valor, dict):
+            valor = sin_ceros(valor)
+        if valor:
+            limpio[campo] = valor
+    return limpio
+
+
+# Suma los documentos diarios en el formato de /api/estadisticas:
+#   {"tipos": {...}, "productos": {nombre: unidades}, "franjas": {etiqueta: {tipo: total}}}
+def sumar_resumenes(documentos, platos):
+    tipos = {}
+    franjas = {etiqueta: {"reserva": 0, "pedido_para_llevar": 0} for etiqueta, _, _ in FRANJAS}
+    productos = {}
+    for documento in documentos:
+        for tipo, total in documento.get("tipos", {}).items():
+            tipos[tipo] = tipos.get(tipo, 0) + total
+        for etiqueta, por_tipo in documento.get("franjas", {}).items():
+            for tipo, total in por_tipo.items():
+                if etiqueta in franjas and tipo in franjas[etiqueta]:
+                    franjas[etiqueta][tipo] += total
+        for clave, unidades in documento.get("productos", {}).items():
+            nombre = clave[2:] if clave.startswith("n:") else platos.get(clave)
+            if nombre:
+                productos[nombre] = productos.get(nombre, 0) + unidades
+    return {
+        "tipos": {tipo: total for tipo, total in tipos.items() if total},
+        "productos": dict(sorted(((n, u) for n, u in productos.items() if u), key=lambda item: -item[1])),
+        "franjas": franjas
+    }
+
+
+# "menu" devuelve el menú en uso (p. ej. CatalogoMenu.actual): las líneas antiguas en texto
+# se cuentan con sus platos, igual que las migra productos.py
+class ResumenDiario:
+    def __init__(self, coleccion, menu):
+        self.coleccion = coleccion
+        self.menu = menu
+
+    # Registra el cambio de uno o varios pedidos. Un fallo aquí no deshace la escritura
+    # del pedido: se avisa en el log y el desajuste se corrige reconstruyendo el resumen.
+    def registrar(self, antes=None, despues=None):
+        self.registrar_varios([(antes, despues)])
+
+    def registrar_varios(self, pares):
+        operaciones = operaciones_resumen(diferencia(pares, self.menu().platos_por_nombre))
+        if not operaciones:
+            return
+        try:
+            self.coleccion.bulk_write(operaciones, ordered=False)
+        except Exception as e:
+            print("Error al actualizar el resumen diario:", e)
+
+    # Estadísticas entre los días "desde" y "hasta" (AAAA-MM-DD, incluidos). "platos" da el
+    # nombre de cada plato_id; por defecto, los del menú en uso.
+    def leer(self, desde=None, hasta=None, platos=None):
+        rango = {}
+        if desde:
+            rango["$gte"] = desde
+        if hasta:
+            rango["$lte"] = hasta
+        return sumar_resumenes(self.coleccion.find({"_id": rango} if rango else {}), platos or self.menu().platos)
+
+    # Documentos diarios calculados desde cero con los pedidos de "colecciones" (vivos y
+    # archivados): {dia: documento}, sin escribir nada
+    def calcular(self, colecciones):
+        platos_por_nombre = self.menu().platos_por_nombre
+        dias = {}
+        for coleccion in colecciones:
+            for pedido in coleccion.find({}, CAMPOS_PEDIDO):
+                dia, campos = aportacion(pedido, platos_por_nombre)
+                if not dia:
+                    continue
+                acumulado = dias.setdefault(dia, {})
+                for campo, valor in campos.items():
+                    acumulado[campo] = acumulado.get(campo, 0) + valor
+        return {dia: anidar(campos) for dia, campos in dias.items()}
+
+    # Días del resumen guardado que no coinciden con los calculados desde cero. Los contadores
+    # a 0 (lo que queda tras sumar y restar el mismo pedido) cuentan como si no estuvieran.
+    def comprobar(self, colecciones):
+        esperados = {dia: sin_ceros(documento) for dia, documento in self.calcular(colecciones).items()}
+        guardados = {d.pop("_id"): sin_ceros(d) for d in self.coleccion.find()}
+        return sorted(dia for dia in set(esperados) | set(guardados)
+                      if esperados.get(dia, {}) != guardados.get(dia, {}))
+
+    # Recalcula todo el resumen a partir de los pedidos de "colecciones" (vivos y archivados).
+    # Los cambios que lleguen mientras se recalcula un día pueden perderse; conviene
+    # ejecutarlo con poco tráfico. Devuelve el número de días.
+    def reconstruir(self, colecciones):
+        dias = self.calcular(colecciones)
+        for dia, documento in dias.items():
+            self.coleccion.replace_one({"_id": dia}, documento, upsert=True)
+        self.coleccion.delete_many({"_id": {"$nin": list(dias)}})
+        return len(dias)
+
+
+# Si el resumen está vacío y ya hay pedidos (primer arranque con esta versión) se construye
+# en segundo plano
+def iniciar_resumen(resumen, colecciones):
+    def construir():
+        try:
+            if resumen.coleccion.find_one() is None and any(c.find_one() is not None for c in colecciones):
+                print("Días en el resumen de estadísticas:", resumen.reconstruir(colecciones))
+        except Exception as e:
+            print("Error al construir el resumen de estadísticas:", e)
+    hilo = threading.Thread(target=construir, daemon=True)
+    hilo.start()
+    return hilo
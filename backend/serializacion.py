@@ -0,0 +1,78 @@
+import json
+
+from bson import json_util
+
+# orjson es bastante más rápido que json/bson.json_util; si no está instalado se usa json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Serialización de los listados de pedidos, compartida por app.py y asgi.py. Los listados se
+# escriben por partes mientras se lee el cursor de MongoDB, de TAMANO_LOTE en TAMANO_LOTE
+# pedidos: la memoria no crece con el número de pedidos y el primer byte sale en cuanto
+# llega el primer lote, sin esperar a leer la colección entera.
+#
+# Los tipos de BSON que no existen en JSON (ObjectId, fechas...) se escriben como
+# bson.json_util.dumps, así que el resultado es el mismo que antes para los clientes.
+
+TAMANO_LOTE = 500
+
+
+if orjson is not None:
+    def a_json(valor):
+        return orjson.dumps(valor, default=json_util.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+else:
+    def a_json(valor):
+        return json.dumps(valor, default=json_util.default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# Cada trozo de la respuesta lleva "lote" documentos ya serializados y separados por comas
+class Lote:
+    def __init__(self, lote):
+        self.lote = lote
+        self.partes = []
+        self.vacio = True
+
+    def anadir(self, documento):
+        self.partes.append(b"[" if self.vacio else b",")
+        self.partes.append(a_json(documento))
+        self.vacio = False
+        return len(self.partes) >= 2 * self.lote
+
+    def sacar(self):
+        trozo = b"".join(self.partes)
+        self.partes = []
+        return trozo
+
+    def cerrar(self):
+        return self.sacar() + (b"[]" if self.vacio else b"]")
+
+
+# Lista JSON de los documentos, en trozos
+def lista_por_partes(documentos, lote=TAMANO_LOTE):
+    trozos = Lote(lote)
+    for documento in documentos:
+        if trozos.anadir(documento):
+            yield trozos.sacar()
+    yield trozos.cerrar()
+
+
+# Igual, para los cursores del driver asíncrono (asgi.py)
+async def lista_por_partes_async(documentos, lote=TAMANO_LOTE):
+    trozos = Lote(lote)
+    async for documento in documentos:
+        if trozos.anadir(documento):
+            yield trozos.sacar()
+    yield trozos.cerrar()
+
+
+# Respuesta de la sincronización incremental, con los mismos campos que obtener_cambios:
+#   {"completo": ..., "pedidos": [...], "eliminados": [...], "cursor": ...}
+# El cursor va al final porque depende de las versiones de los pedidos ya escritos.
+def inicio_cambios(completo):
+    return b'{"completo":' + a_json(completo) + b',"pedidos":'
+
+
+def fin_cambios(eliminados, cursor):
+    return b',"eliminados":' + a_json(eliminados) + b',"cursor":' + a_json(cursor) + b"}"
@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# Las pruebas usan una base de datos en memoria (mongomock) y el enviador falso de WhatsApp.
+# app.py se conecta al importarse, así que las variables se fijan antes de importarlo.
+os.environ.update({
+    "MONGO_CLIENT": "mongomock://",
+    "MONGO_DB": "pruebas",
+    "MONGO_PEDIDOS_COLLECTION": "pedidos",
+    "MONGO_CONTADOR_COLLECTION": "contador",
+    "WHATSAPP_ENVIADOR": "falso",
+    "ARCHIVO_INTERVALO": "0",
+    "EVENTOS_INTERVALO_LATIDO": "1",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def servidor():
+    import app
+    return app
+
+
+@pytest.fixture
+def cliente(servidor):
+    return servidor.app.test_client()
+
+
+# Una escritura que tarda: reserva su versión, espera a "seguir" y guarda el pedido
+class EscrituraLenta(threading.Thread):
+    def __init__(self, servidor, nombre):
+        super().__init__(daemon=True)
+        self.servidor = servidor
+        self.nombre = nombre
+        self.version = None
+        self.empezada = threading.Event()
+        self.seguir = threading.Event()
+
+    def run(self):
+        with self.servidor.versiones.escritura() as version:
+            self.version = version
+            self.empezada.set()
+            self.seguir.wait(5)
+            self.servidor.pedidos_collection.insert_one(
+                {"id": 1000000 + version, "nombre": self.nombre, "version": version})
+
+    def empezar(self):
+        self.start()
+        self.empezada.wait(5)
+        return self
+
+    def terminar(self):
+        self.seguir.set()
+        self.join(5)
+
+
+# escritura_lenta("nombre").empezar() deja una escritura en curso hasta llamar a terminar()
+@pytest.fixture
+def escritura_lenta(servidor):
+    return lambda nombre: EscrituraLenta(servidor, nombre)
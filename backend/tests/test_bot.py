@@ -0,0 +1,164 @@
+from datetime import datetime
+
+from bot import CONFIRMAR, TEXTOS, Fase, MotorConversacion, Rechazo, procesar_mensaje
+from menu import MENU_INICIAL, Menu
+
+# Las pruebas llaman al motor directamente, sin Flask ni MongoDB, con la hora fijada
+AHORA = datetime(2025, 6, 2, 12, 0)
+
+
+# Ocupación de las reservas en memoria, con las plazas libres fijadas por franja
+class PlazasFijas:
+    def __init__(self, capacidad=10, libres=None, sugeridas=()):
+        self.capacidad = capacidad
+        self.plazas_libres = libres or {}
+        self.sugeridas = list(sugeridas)
+
+    def libres(self, fecha, hora):
+        return self.plazas_libres.get(hora, self.capacidad)
+
+    def sugerencias(self, fecha, personas, hora=None, ahora=None, cantidad=3):
+        return self.sugeridas[:cantidad]
+
+
+# Envía los mensajes en orden y devuelve la última respuesta y el estado guardado
+def conversar(*mensajes, usuario=None, plazas=None):
+    usuario = usuario if usuario is not None else {}
+    for mensaje in mensajes:
+        texto, accion, estado, pedido = procesar_mensaje(usuario, mensaje, "+34600000000", AHORA, plazas=plazas)
+        if accion == "guardar":
+            usuario = estado
+        elif accion == "eliminar":
+            usuario = {}
+    return texto, accion, usuario, pedido
+
+
+def test_reserva_recorre_sus_fases_y_se_confirma():
+    texto, accion, usuario, _ = conversar("reserva")
+    assert (texto, accion, usuario["fase"]) == (TEXTOS["pedir_nombre"], "guardar", "esperando_nombre")
+
+    texto, _, usuario, _ = conversar("juan pérez", usuario=usuario)
+    assert (texto, usuario["fase"]) == (TEXTOS["pedir_personas"], "esperando_personas")
+    assert usuario["nombre"] == "Juan Pérez"
+
+    texto, _, usuario, _ = conversar("4", usuario=usuario)
+    assert (texto, usuario["fase"]) == (TEXTOS["pedir_fecha"], "esperando_fecha")
+
+    texto, _, usuario, _ = conversar("10-06-2025", usuario=usuario)
+    assert (texto, usuario["fase"]) == (TEXTOS["pedir_hora_reserva"], "esperando_hora")
+
+    texto, accion, usuario, pedido = procesar_mensaje(usuario, "14:00", "+34600000000", AHORA)
+    assert accion == "eliminar" and usuario is None
+    assert texto.startswith("✅ ¡Reserva confirmada!")
+    assert pedido == {
+        "telefono": "+34600000000", "tipo": "reserva", "nombre": "Juan Pérez", "fecha": "10-06-2025",
+        "personas": 4, "hora": "14:00", "productos": [], "timestamp": AHORA.isoformat()
+    }
+
+
+def test_pedido_para_llevar_pide_hora_y_productos():
+    texto, _, usuario, _ = conversar("pedido para llevar", "ana")
+    assert usuario["fase"] == "esperando_hora"
+    assert texto == TEXTOS["pedir_hora_recogida"]
+
+    texto, _, usuario, _ = conversar("13:30", usuario=usuario)
+    assert usuario["fase"] == "esperando_productos"
+    assert texto == MENU_INICIAL.rellenar(TEXTOS["pedir_productos"])
+
+    texto, accion, _, pedido = conversar("1, 5, 5, 99", usuario=usuario)
+    assert accion == "eliminar"
+    assert pedido["fecha"] == "02-06-2025" and pedido["estado"] == "pendiente"
+    assert pedido["productos"] == [{"plato_id": "1", "cantidad": 1}, {"plato_id": "5", "cantidad": 2}]
+    assert "Pizza Margherita" in texto
+
+
+def test_comandos_se_atienden_en_cualquier_fase():
+    _, _, usuario, _ = conversar("reserva", "juan")
+    texto, accion, estado, _ = conversar("hola", usuario=dict(usuario))
+    assert (texto, accion, estado) == (TEXTOS["saludo"], "mantener", usuario)
+
+    texto, accion, _, _ = conversar("menú", usuario=dict(usuario))
+    assert accion == "mantener"
+    assert texto == MENU_INICIAL.rellenar(TEXTOS["menu"])
+    assert "1. Spaghetti alla Carbonara" in texto
+
+
+def test_el_menu_en_uso_cambia_los_platos_del_pedido():
+    menu = Menu({"1": "Tiramisú"}, version=3)
+    usuario = {"fase": "esperando_productos", "tipo": "pedido_para_llevar", "nombre": "Ana", "hora": "14:00"}
+    texto, _, _, pedido = procesar_mensaje(usuario, "1, 2", "+34600000000", AHORA, menu=menu)
+    assert pedido["productos"] == [{"plato_id": "1", "cantidad": 1}]
+    assert "Tiramisú" in texto
+
+
+def test_mensajes_invalidos_no_cambian_de_fase():
+    casos = [
+        ({}, "quiero algo", TEXTOS["pedir_tipo"], "mantener"),
+        ({"fase": "esperando_nombre", "tipo": "reserva"}, "juan 123", TEXTOS["nombre_invalido"], "mantener"),
+        ({"fase": "esperando_personas", "tipo": "reserva"}, "cuatro", TEXTOS["personas_invalidas"], "guardar"),
+        ({"fase": "esperando_fecha", "personas": 2}, "2025-06-10", TEXTOS["fecha_invalida"], "mantener"),
+        ({"fase": "esperando_fecha", "personas": 2}, "31-02-2025", TEXTOS["fecha_invalida"], "mantener"),
+        ({"fase": "esperando_fecha", "personas": 2}, "01-06-2025", TEXTOS["fecha_pasada"], "mantener"),
+        ({"fase": "esperando_hora", "tipo": "reserva"}, "2 de la tarde", TEXTOS["hora_invalida"], "mantener"),
+        ({"fase": "esperando_hora", "tipo": "reserva"}, "25:00", TEXTOS["hora_invalida"], "mantener"),
+        ({"fase": "esperando_hora", "tipo": "reserva"}, "17:00", TEXTOS["hora_fuera_de_horario"], "mantener"),
+        ({"fase": "esperando_hora", "tipo": "reserva", "fecha": "02-06-2025"}, "11:00", TEXTOS["hora_pasada"],
+         "mantener"),
+    ]
+    for usuario, mensaje, esperado, accion_esperada in casos:
+        fase = usuario.get("fase", "esperando_tipo")
+        texto, accion, estado, pedido = procesar_mensaje(dict(usuario), mensaje, "+34600000000", AHORA)
+        assert (texto, accion, pedido) == (esperado, accion_esperada, None), mensaje
+        assert estado["fase"] == fase, mensaje
+
+
+def test_fase_desconocida_termina_la_conversacion():
+    texto, accion, usuario, pedido = procesar_mensaje({"fase": "antigua"}, "1", "+34600000000", AHORA)
+    assert (texto, accion, usuario, pedido) == (TEXTOS["no_entendido"], "eliminar", None, None)
+
+
+def test_reserva_sin_plazas_propone_horas_o_vuelve_a_la_fecha():
+    en_hora = {"fase": "esperando_hora", "tipo": "reserva", "nombre": "Ana", "fecha": "10-06-2025", "personas": 4}
+
+    plazas = PlazasFijas(libres={"14:00": 2}, sugeridas=["13:30", "14:30"])
+    texto, accion, usuario, _ = conversar("14:00", usuario=dict(en_hora), plazas=plazas)
+    assert texto.endswith(TEXTOS["horas_libres"].format(horas="13:30, 14:30"))
+    assert (accion, usuario["fase"]) == ("mantener", "esperando_hora")
+
+    texto, accion, usuario, _ = conversar("14:00", usuario=dict(en_hora), plazas=PlazasFijas(libres={"14:00": 2}))
+    assert texto.endswith(TEXTOS["pedir_fecha"])
+    assert (accion, usuario["fase"]) == ("guardar", "esperando_fecha")
+
+    texto, _, usuario, _ = conversar("10-06-2025", usuario={"fase": "esperando_fecha", "personas": 4},
+                                     plazas=PlazasFijas())
+    assert texto == TEXTOS["fecha_completa"].format(personas=4, fecha="10-06-2025")
+    assert usuario["fase"] == "esperando_fecha"
+
+    texto, _, usuario, _ = conversar("12", usuario={"fase": "esperando_personas"}, plazas=PlazasFijas(capacidad=10))
+    assert texto == TEXTOS["demasiadas_personas"].format(capacidad=10)
+    assert usuario["fase"] == "esperando_personas"
+
+
+def test_motor_con_otra_tabla_de_fases():
+    def leer_motivo(mensaje, usuario, turno):
+        if not mensaje.strip():
+            raise Rechazo("¿Por qué?")
+        return mensaje
+
+    fases = {
+        "esperando_numero": Fase(lambda mensaje, usuario, turno: int(mensaje), "numero", "esperando_motivo"),
+        "esperando_motivo": Fase(leer_motivo, "motivo", CONFIRMAR, "¿Por qué?")
+    }
+    confirmaciones = {"cancelacion": lambda usuario, turno: (f"Cancelado el {usuario['numero']}", dict(usuario))}
+    motor = MotorConversacion(fases, confirmaciones, inicial="esperando_numero")
+
+    texto, accion, usuario, _ = motor.procesar({"tipo": "cancelacion"}, "7", "+34600000000", AHORA)
+    assert (texto, accion) == ("¿Por qué?", "guardar")
+    assert usuario == {"tipo": "cancelacion", "fase": "esperando_motivo", "numero": 7}
+
+    texto, accion, usuario, _ = motor.procesar(usuario, " ", "+34600000000", AHORA)
+    assert (texto, accion, usuario["fase"]) == ("¿Por qué?", "mantener", "esperando_motivo")
+
+    texto, accion, _, pedido = motor.procesar(usuario, "error", "+34600000000", AHORA)
+    assert (texto, accion) == ("Cancelado el 7", "eliminar")
+    assert pedido["motivo"] == "error"
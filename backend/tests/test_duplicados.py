@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from duplicados import DeduplicadorMensajes
+
+
+def test_entrega_repetida_recibe_la_misma_respuesta():
+    deduplicador = DeduplicadorMensajes()
+    assert deduplicador.reservar("SM1") is None
+    deduplicador.completar("SM1", "<Response>hola</Response>")
+    assert deduplicador.reservar("SM1") == "<Response>hola</Response>"
+    assert deduplicador.reservar("SM2") is None
+
+
+def test_entrega_liberada_se_vuelve_a_atender():
+    deduplicador = DeduplicadorMensajes()
+    assert deduplicador.reservar("SM1") is None
+    deduplicador.liberar("SM1")
+    assert deduplicador.reservar("SM1") is None
+
+
+def test_reintento_de_twilio_no_duplica_la_reserva(servidor, cliente):
+    telefono = "whatsapp:+34600000021"
+    fecha = (datetime.now() + timedelta(days=3)).strftime("%d-%m-%Y")
+
+    def bot(mensaje, sid):
+        return cliente.post("/bot", data={"From": telefono, "Body": mensaje, "MessageSid": sid})
+
+    for n, mensaje in enumerate(("reserva", "Ana Ruiz", "4", fecha)):
+        bot(mensaje, f"SMdup{n}")
+    primera = bot("14:00", "SMdup-final").get_data(as_text=True)
+    repetida = bot("14:00", "SMdup-final").get_data(as_text=True)
+
+    assert repetida == primera
+    assert servidor.pedidos_collection.count_documents({"telefono": telefono.replace("whatsapp:", "")}) == 1
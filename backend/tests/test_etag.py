@@ -0,0 +1,26 @@
+def crear(cliente, nombre):
+    respuesta = cliente.post("/api/pedidos", json={"tipo": "pedido_para_llevar", "nombre": nombre, "hora": "14:00"})
+    assert respuesta.status_code == 201
+
+
+def listar(cliente, etag=None):
+    respuesta = cliente.get("/api/pedidos", headers={"If-None-Match": etag} if etag else {})
+    respuesta.get_data()
+    return respuesta
+
+
+def test_sin_etag_con_escritura_en_curso(cliente, escritura_lenta):
+    crear(cliente, "etag")
+    etag = listar(cliente).headers["ETag"]
+    assert listar(cliente, etag).status_code == 304
+
+    # Con una escritura a medias el listado aún puede cambiar sin que cambie la versión
+    lenta = escritura_lenta("lenta-etag").empezar()
+    respuesta = listar(cliente, etag)
+    assert respuesta.status_code == 200
+    assert "ETag" not in respuesta.headers
+
+    lenta.terminar()
+    respuesta = listar(cliente, etag)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["ETag"] != etag
@@ -0,0 +1,110 @@
+import importlib.util
+import json
+import threading
+import time
+
+import mongomock
+import pytest
+
+from eventos import eventos_a_cambios
+from metricas import peticiones_lentas
+
+
+def crear(cliente, nombre):
+    respuesta = cliente.post("/api/pedidos", json={"tipo": "pedido_para_llevar", "nombre": nombre, "hora": "14:00"})
+    assert respuesta.status_code == 201
+    return respuesta.get_json()["pedido"]
+
+
+# Lee los eventos "cambios" de una respuesta de /api/pedidos/eventos, saltando los latidos
+class LectorEventos:
+    def __init__(self, respuesta):
+        self.respuesta = respuesta
+        self.trozos = iter(respuesta.response)
+
+    def siguiente(self):
+        while True:
+            trozo = next(self.trozos)
+            trozo = trozo.decode() if isinstance(trozo, bytes) else trozo
+            if trozo.startswith("id:"):
+                return json.loads(trozo.split("data: ", 1)[1])
+
+    def cerrar(self):
+        self.respuesta.close()
+
+
+# Otro worker del backend (otra instancia de app.py) sobre la misma base de datos en memoria
+@pytest.fixture(scope="module")
+def otro_worker(servidor):
+    especificacion = importlib.util.spec_from_file_location("app_otro_worker", servidor.__file__)
+    modulo = importlib.util.module_from_spec(especificacion)
+    with pytest.MonkeyPatch.context() as parche:
+        parche.setattr(mongomock, "MongoClient", lambda *args, **kwargs: servidor.client)
+        especificacion.loader.exec_module(modulo)
+    return modulo
+
+
+def evento(version):
+    return {"version": version, "pedido": {"id": version}, "eliminado": None}
+
+
+def test_eventos_a_cambios_solo_sin_huecos():
+    assert eventos_a_cambios([evento(5), evento(4)], 3)["cursor"] == 5
+    assert eventos_a_cambios([evento(2), evento(4)], 3)["cursor"] == 4
+    assert eventos_a_cambios([evento(5)], 3) is None
+
+
+def test_eventos_con_hueco_leen_la_base_de_datos(servidor, cliente, escritura_lenta):
+    crear(cliente, "inicial")
+    eventos = LectorEventos(cliente.get("/api/pedidos/eventos", query_string={"since": 0}))
+    try:
+        cursor = eventos.siguiente()["cursor"]
+
+        # El evento de la escritura rápida llega con un hueco (la lenta): no se usa
+        lenta = escritura_lenta("lenta-sse").empezar()
+        crear(cliente, "rapida-sse")
+        datos = eventos.siguiente()
+        assert datos["cursor"] < lenta.version
+        vistos = [p["nombre"] for p in datos["pedidos"]]
+
+        lenta.terminar()
+        while "lenta-sse" not in vistos or "rapida-sse" not in vistos:
+            vistos += [p["nombre"] for p in eventos.siguiente()["pedidos"]]
+
+        # Sin escrituras en curso, los eventos siguientes se entregan seguidos
+        crear(cliente, "contigua")
+        datos = eventos.siguiente()
+        assert [p["nombre"] for p in datos["pedidos"]] == ["contigua"]
+        assert datos["cursor"] == servidor.versiones.actual() > cursor
+    finally:
+        eventos.cerrar()
+
+
+def test_escrituras_de_otro_worker_llegan_sin_esperar_al_latido(servidor, cliente, otro_worker, monkeypatch):
+    monkeypatch.setattr(servidor, "INTERVALO_LATIDO", 60)
+    eventos = LectorEventos(cliente.get("/api/pedidos/eventos", query_string={"since": 0}))
+    try:
+        eventos.siguiente()
+        recibidos = []
+        lector = threading.Thread(target=lambda: recibidos.append(eventos.siguiente()), daemon=True)
+        lector.start()
+
+        crear(otro_worker.app.test_client(), "otro worker")
+        lector.join(5)
+        assert recibidos, "el cambio del otro worker no ha llegado antes del latido"
+        assert [p["nombre"] for p in recibidos[0]["pedidos"]] == ["otro worker"]
+    finally:
+        eventos.cerrar()
+
+
+def test_eventos_no_cuentan_como_peticion_lenta(servidor, cliente, monkeypatch):
+    monkeypatch.setattr(servidor, "UMBRAL_PETICION_LENTA", 0.05)
+    clave = ("GET", "/api/pedidos/eventos")
+    antes = peticiones_lentas.valores.get(clave, 0)
+    eventos = LectorEventos(cliente.get("/api/pedidos/eventos", query_string={"since": 0}))
+    try:
+        eventos.siguiente()
+        time.sleep(0.1)
+    finally:
+        eventos.cerrar()
+    assert peticiones_lentas.valores.get(clave, 0) == antes
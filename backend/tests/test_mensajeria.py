@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import mongomock
+from pymongo.errors import ServerSelectionTimeoutError
+
+from mensajeria import BandejaSalida, EnviadorFalso
+
+
+def bandeja(**opciones):
+    return BandejaSalida(mongomock.MongoClient().db.salida, EnviadorFalso(), **opciones)
+
+
+def mensaje(clave, estado, texto, **campos):
+    return dict({"clave": clave, "estado": estado, "telefono": "600", "mensaje": texto,
+                 "intentos": 0, "enviar_despues": datetime.now()}, **campos)
+
+
+def test_recuperar_solo_devuelve_los_reclamados_vencidos():
+    salida = bandeja()
+    hace_una_hora = datetime.now() - timedelta(hours=1)
+    salida.coleccion.insert_many([
+        mensaje("pedido:1", "enviando", "caido", reclamado_en=hace_una_hora),
+        mensaje("pedido:2", "enviando", "sin plazo"),
+        mensaje("pedido:3", "enviando", "en otro hilo", reclamado_en=datetime.now()),
+    ])
+
+    assert salida.recuperar() == 2
+    estados = {d["mensaje"]: d["estado"] for d in salida.coleccion.find()}
+    assert estados == {"caido": "pendiente", "sin plazo": "pendiente", "en otro hilo": "enviando"}
+
+
+def test_recuperar_descarta_el_vencido_si_hay_otro_pendiente_de_la_clave():
+    salida = bandeja()
+    salida.coleccion.insert_many([
+        mensaje("pedido:1", "enviando", "viejo", reclamado_en=datetime.now() - timedelta(hours=1)),
+        mensaje("pedido:1", "pendiente", "nuevo"),
+    ])
+
+    assert salida.recuperar() == 0
+    estados = {d["mensaje"]: d["estado"] for d in salida.coleccion.find()}
+    assert estados == {"viejo": "descartado", "nuevo": "pendiente"}
+
+
+def test_al_arrancar_envia_una_vez_lo_que_quedo_a_medias():
+    salida = bandeja(ventana_fusion=0)
+    salida.coleccion.insert_one(
+        mensaje("pedido:1", "enviando", "a medias", reclamado_en=datetime.now() - timedelta(hours=1)))
+    salida.encolar("601", "nuevo")
+
+    salida.iniciar()
+    try:
+        assert salida.vaciar(5)
+    finally:
+        salida.detener()
+    assert sorted(m for _, m in salida.enviador.enviados) == ["a medias", "nuevo"]
+
+
+def test_encolar_fusiona_los_pendientes_de_una_clave():
+    salida = bandeja()
+    salida.encolar("600", "en preparación", clave="pedido:1")
+    salida.encolar("600", "preparado", clave="pedido:1")
+    salida.encolar_varios([("600", "listo", "pedido:1"), ("601", "otro", "pedido:2")])
+
+    pendientes = {d["clave"]: d["mensaje"] for d in salida.coleccion.find({"estado": "pendiente"})}
+    assert pendientes == {"pedido:1": "listo", "pedido:2": "otro"}
+
+
+class ColeccionCaida:
+    def __getattr__(self, nombre):
+        def operacion(*args, **kwargs):
+            raise ServerSelectionTimeoutError("sin conexión")
+        return operacion
+
+
+def test_arrancar_sin_base_de_datos_no_falla():
+    salida = BandejaSalida(ColeccionCaida(), EnviadorFalso())
+    salida.iniciar()
+    salida.detener()
@@ -0,0 +1,66 @@
+import threading
+from datetime import datetime, timedelta
+
+import mongomock
+
+from plazas import OcupacionReservas
+
+
+def reserva(fecha, personas, hora="14:00", nombre="Ana"):
+    return {"tipo": "reserva", "nombre": nombre, "fecha": fecha, "hora": hora, "personas": personas}
+
+
+def dentro_de(dias):
+    return (datetime.now() + timedelta(days=dias)).strftime("%d-%m-%Y")
+
+
+def test_reservas_a_la_vez_no_pasan_de_la_capacidad():
+    base = mongomock.MongoClient().db
+    ocupacion = OcupacionReservas(base.ocupacion, base.pedidos, capacidad=10)
+    fecha = dentro_de(5)
+    aceptadas = []
+
+    def reservar():
+        if ocupacion.reservar(reserva(fecha, 2, hora="14:10")):
+            aceptadas.append(1)
+
+    hilos = [threading.Thread(target=reservar) for _ in range(12)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(aceptadas) == 5
+    assert ocupacion.libres(fecha, "14:00") == 0
+    dia = datetime.now() + timedelta(days=5)
+    assert base.ocupacion.find_one({"_id": dia.strftime("%Y-%m-%d") + " 14:00"})["personas"] == 10
+
+
+def test_cambiar_de_franja_libera_la_anterior():
+    base = mongomock.MongoClient().db
+    ocupacion = OcupacionReservas(base.ocupacion, base.pedidos, capacidad=10)
+    fecha = dentro_de(5)
+    antes = reserva(fecha, 6)
+    assert ocupacion.reservar(antes)
+    assert ocupacion.cambiar(antes, reserva(fecha, 6, hora="20:00"))
+    assert ocupacion.libres(fecha, "14:00") == 10
+    assert ocupacion.libres(fecha, "20:00") == 4
+    assert not ocupacion.reservar(reserva(fecha, 5, hora="20:10"))
+
+
+def test_api_rechaza_las_reservas_que_no_caben(servidor, cliente):
+    fecha = dentro_de(6)
+    capacidad = servidor.ocupacion.capacidad
+    ids = []
+    for n in range(capacidad // 10):
+        respuesta = cliente.post("/api/pedidos", json=reserva(fecha, 10, nombre=f"Mesa {n}"))
+        assert respuesta.status_code == 201
+        ids.append(respuesta.get_json()["pedido"]["id"])
+
+    respuesta = cliente.post("/api/pedidos", json=reserva(fecha, 2, nombre="Sin sitio"))
+    assert respuesta.status_code == 409
+    assert "14:00" not in respuesta.get_json()["sugerencias"]
+    assert respuesta.get_json()["sugerencias"]
+
+    assert cliente.delete(f"/api/pedidos/{ids[0]}").status_code == 200
+    assert cliente.post("/api/pedidos", json=reserva(fecha, 2, nombre="Con sitio")).status_code == 201
@@ -0,0 +1,62 @@
+import threading
+
+import mongomock
+
+from menu import MENU_INICIAL
+from resumen import ResumenDiario
+
+HOY = "01-03-2031"
+
+
+def estadisticas(cliente, etag=None):
+    respuesta = cliente.get("/api/estadisticas", query_string={"desde": HOY, "hasta": HOY},
+                            headers={"If-None-Match": etag} if etag else {})
+    return respuesta
+
+
+def test_estadisticas_leidas_durante_un_alta_no_se_quedan_en_cache(servidor, cliente, monkeypatch):
+    antes = estadisticas(cliente).get_json()
+    reservas = antes["tipos"].get("reserva", 0)
+
+    # El alta se queda parada justo antes de escribir el resumen diario
+    parado, seguir = threading.Event(), threading.Event()
+    registrar_varios = servidor.resumen_diario.registrar_varios
+
+    def registrar_despacio(pares):
+        parado.set()
+        seguir.wait(5)
+        registrar_varios(pares)
+
+    monkeypatch.setattr(servidor.resumen_diario, "registrar_varios", registrar_despacio)
+    alta = threading.Thread(target=lambda: servidor.app.test_client().post("/api/pedidos", json={
+        "tipo": "reserva", "nombre": "Resumen", "fecha": HOY, "hora": "14:00", "personas": 2}))
+    alta.start()
+    assert parado.wait(5)
+
+    durante = estadisticas(cliente)
+    assert durante.get_json()["tipos"].get("reserva", 0) == reservas
+
+    seguir.set()
+    alta.join(5)
+    despues = estadisticas(cliente, durante.headers["ETag"])
+    assert despues.status_code == 200
+    assert despues.get_json()["tipos"]["reserva"] == reservas + 1
+    assert despues.headers["ETag"] != durante.headers["ETag"]
+
+
+def test_comprobar_detecta_los_dias_desajustados():
+    base = mongomock.MongoClient().db
+    plato = next(iter(MENU_INICIAL.platos.values()))
+    base.pedidos.insert_many([
+        {"id": 1, "tipo": "pedido_para_llevar", "fecha": HOY, "hora": "14:00",
+         "productos": [{"plato_id": MENU_INICIAL.platos_por_nombre[plato], "cantidad": 2}]},
+        # Pedido antiguo: productos en texto y sin fecha (cuenta el día del timestamp)
+        {"id": 2, "tipo": "pedido_para_llevar", "timestamp": "2031-03-02T21:00:00", "hora": "21:00",
+         "productos": [f"{plato} (x3)"]},
+    ])
+    resumen = ResumenDiario(base.resumen, lambda: MENU_INICIAL)
+    assert resumen.reconstruir([base.pedidos]) == 2
+    assert resumen.comprobar([base.pedidos]) == []
+
+    base.resumen.update_one({"_id": "2031-03-02"}, {"$inc": {"tipos.pedido_para_llevar": 1}})
+    assert resumen.comprobar([base.pedidos]) == ["2031-03-02"]
@@ -0,0 +1,92 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+from archivo import PurgadorEliminados
+
+
+def crear(cliente, nombre):
+    respuesta = cliente.post("/api/pedidos", json={"tipo": "pedido_para_llevar", "nombre": nombre, "hora": "14:00"})
+    assert respuesta.status_code == 201
+    return respuesta.get_json()["pedido"]
+
+
+def cambios(cliente, cursor):
+    return json.loads(cliente.get("/api/pedidos", query_string={"since": cursor}).get_data())
+
+
+def test_cursor_no_pasa_de_una_escritura_en_curso(servidor, cliente, escritura_lenta):
+    crear(cliente, "antes")
+    cursor = cambios(cliente, 0)["cursor"]
+
+    lenta = escritura_lenta("lenta").empezar()
+    crear(cliente, "rapida")
+
+    # La escritura rápida terminó después de que empezara la lenta: aún no se entrega el cursor
+    # de la rápida, o el panel se saltaría la lenta para siempre
+    durante = cambios(cliente, cursor)
+    assert durante["cursor"] < lenta.version
+
+    lenta.terminar()
+    despues = cambios(cliente, durante["cursor"])
+    nombres = [p["nombre"] for p in durante["pedidos"] + despues["pedidos"]]
+    assert "lenta" in nombres and "rapida" in nombres
+    assert despues["cursor"] == servidor.versiones.actual()
+
+
+def test_escrituras_concurrentes_no_se_pierden(servidor, cliente):
+    cursor = cambios(cliente, 0)["cursor"]
+    creados = []
+    vistos = set()
+
+    def escribir(n):
+        cliente_hilo = servidor.app.test_client()
+        for i in range(5):
+            creados.append(crear(cliente_hilo, f"h{n}-{i}")["id"])
+
+    hilos = [threading.Thread(target=escribir, args=(n,)) for n in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    while any(hilo.is_alive() for hilo in hilos):
+        respuesta = cambios(cliente, cursor)
+        vistos.update(p["id"] for p in respuesta["pedidos"])
+        cursor = respuesta["cursor"]
+    for hilo in hilos:
+        hilo.join()
+    vistos.update(p["id"] for p in cambios(cliente, cursor)["pedidos"])
+
+    assert len(creados) == 20
+    assert set(creados) <= vistos
+
+
+def test_cursor_anterior_al_horizonte_recibe_la_lista_completa(servidor, cliente):
+    viejo = crear(cliente, "borrado hace tiempo")
+    cursor_viejo = cambios(cliente, 0)["cursor"]
+    assert cliente.delete(f"/api/pedidos/{viejo['id']}").status_code == 200
+    cursor_medio = cambios(cliente, cursor_viejo)["cursor"]
+    reciente = crear(cliente, "borrado hoy")
+    assert cliente.delete(f"/api/pedidos/{reciente['id']}").status_code == 200
+
+    # Un día después, con un día de retención, solo queda la marca del borrado reciente
+    purgador = PurgadorEliminados(servidor.eliminados_collection, servidor.versiones, retencion=24 * 3600)
+    servidor.eliminados_collection.update_one({"id": viejo["id"]}, {"$set": {
+        "timestamp": (datetime.now() - timedelta(days=2)).isoformat()}})
+    assert purgador.purgar() >= 1
+    assert servidor.eliminados_collection.count_documents({"id": viejo["id"]}) == 0
+
+    # El panel que no vio el borrado antiguo recibe la lista completa, sin el pedido borrado
+    respuesta = cambios(cliente, cursor_viejo)
+    assert respuesta["completo"]
+    assert viejo["id"] not in [p["id"] for p in respuesta["pedidos"]]
+
+    # El que ya lo vio sigue recibiendo solo los cambios, con la baja reciente
+    respuesta = cambios(cliente, cursor_medio)
+    assert not respuesta["completo"]
+    assert respuesta["eliminados"] == [reciente["id"]]
+
+
+def test_sin_marcas_antiguas_no_se_purga_nada(servidor):
+    purgador = PurgadorEliminados(servidor.eliminados_collection, servidor.versiones, retencion=24 * 3600)
+    horizonte = servidor.versiones.leer()[1]
+    assert purgador.purgar() == 0
+    assert servidor.versiones.leer()[1] == horizonte
@@ -0,0 +1,49 @@
+import re
+from datetime import date, time
+
+# Patrones compilados una sola vez (el bot y los filtros los usan en cada petición)
+PATRON_NOMBRE = re.compile(r"^[A-Za-zÁÉÍÓÚáéíóúÑñ\s]+$")
+PATRON_HORA = re.compile(r"^(\d{2}):(\d{2})$")
+PATRON_FECHA = re.compile(r"^(\d{2})-(\d{2})-(\d{4})$")
+
+
+# Valida que el nombre introducido contenga solo letras y espacios
+def es_nombre_valido(nombre):
+    return bool(PATRON_NOMBRE.match(nombre))
+
+
+# Valida que la hora introducida esté en el formato HH:MM
+def es_hora_valida(hora):
+    return bool(PATRON_HORA.match(hora))
+
+
+# Valida que la fecha introducida esté en el formato DD-MM-AAAA
+def es_fecha_valida(fecha):
+    return bool(PATRON_FECHA.match(fecha))
+
+
+# Hora HH:MM como time, o None si no tiene ese formato o no existe (p. ej. 25:00)
+def leer_hora(hora):
+    partes = PATRON_HORA.match(hora)
+    if not partes:
+        return None
+    try:
+        return time(int(partes[1]), int(partes[2]))
+    except ValueError:
+        return None
+
+
+# Fecha DD-MM-AAAA como date, o None si no tiene ese formato o no existe (p. ej. 31-02-2025)
+def leer_fecha(fecha):
+    partes = PATRON_FECHA.match(fecha)
+    if not partes:
+        return None
+    try:
+        return date(int(partes[3]), int(partes[2]), int(partes[1]))
+    except ValueError:
+        return None
+
+
+#Valida que la hora (un time) esté dentro del rango de apertura del restaurante
+def hora_en_rango(hora):
+    return (time(13, 0) <= hora < time(16, 0)) or (time(20, 0) <= hora < time(23, 0))
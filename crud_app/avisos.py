@@ -0,0 +1,103 @@
+import os
+import time
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, QTimer, QUrl, Signal
+
+# QtMultimedia necesita las librerías de audio del sistema; si no se puede cargar se
+# recurre a playsound
+try:
+    from PySide6.QtMultimedia import QSoundEffect
+except ImportError:
+    QSoundEffect = None
+
+
+# Avisos de pedidos nuevos del panel:
+# - el sonido se carga una sola vez y una ráfaga de pedidos (la carga inicial, una
+#   reconexión) produce un único aviso con el número de pedidos, emitido por "aviso";
+# - el resaltado de cada pedido caduca tras "duracion_resaltado" ms con un único
+#   temporizador, y nunca hay más de "max_resaltados" a la vez; al caducar se emite
+#   "resaltado_expirado" con el ID;
+# - los IDs ya avisados se recuerdan (como mucho "max_conocidos") para no repetir aviso.
+class AvisosPedidos(QObject):
+    aviso = Signal(int)
+    resaltado_expirado = Signal(object)
+
+    def __init__(self, ruta_sonido, ventana_fusion=400, duracion_resaltado=1500,
+                 max_resaltados=200, max_conocidos=5000, parent=None):
+        super().__init__(parent)
+        self.ruta_sonido = os.path.abspath(ruta_sonido)
+        self.duracion_resaltado = duracion_resaltado / 1000
+        self.max_resaltados = max_resaltados
+        self.max_conocidos = max_conocidos
+        self.conocidos = OrderedDict()
+        self.resaltados = OrderedDict()   # ID -> instante en que caduca
+        self.pendientes = 0
+
+        self.sonido = None
+        if QSoundEffect is not None:
+            self.sonido = QSoundEffect(self)
+            self.sonido.setSource(QUrl.fromLocalFile(self.ruta_sonido))
+
+        self.timer_fusion = QTimer(self)
+        self.timer_fusion.setSingleShot(True)
+        self.timer_fusion.setInterval(ventana_fusion)
+        self.timer_fusion.timeout.connect(self.emitir_aviso)
+
+        self.timer_resaltado = QTimer(self)
+        self.timer_resaltado.setInterval(250)
+        self.timer_resaltado.timeout.connect(self.caducar_resaltados)
+
+    # Registra los IDs recibidos y devuelve los que no se habían visto antes
+    def nuevos(self, ids):
+        nuevos = []
+        caduca = time.monotonic() + self.duracion_resaltado
+        for id_pedido in ids:
+            if id_pedido in self.conocidos:
+                continue
+            self.conocidos[id_pedido] = True
+            if len(self.conocidos) > self.max_conocidos:
+                self.conocidos.popitem(last=False)
+            self.resaltados[id_pedido] = caduca
+            if len(self.resaltados) > self.max_resaltados:
+                self.resaltado_expirado.emit(self.resaltados.popitem(last=False)[0])
+            nuevos.append(id_pedido)
+        if nuevos:
+            self.pendientes += len(nuevos)
+            if not self.timer_fusion.isActive():
+                self.timer_fusion.start()
+            if not self.timer_resaltado.isActive():
+                self.timer_resaltado.start()
+        return nuevos
+
+    # Quita el resaltado antes de tiempo (p. ej. al seleccionar el pedido)
+    def quitar_resaltado(self, id_pedido):
+        self.resaltados.pop(id_pedido, None)
+
+    def emitir_aviso(self):
+        cantidad, self.pendientes = self.pendientes, 0
+        if cantidad:
+            self.sonar()
+            self.aviso.emit(cantidad)
+
+    def sonar(self):
+        try:
+            if self.sonido is not None:
+                self.sonido.play()
+            else:
+                from playsound import playsound
+                playsound(self.ruta_sonido, block=False)
+        except Exception as e:
+            print("Error al reproducir el aviso:", e)
+
+    def caducar_resaltados(self):
+        ahora = time.monotonic()
+        # Los resaltados están ordenados por caducidad
+        while self.resaltados:
+            id_pedido, caduca = next(iter(self.resaltados.items()))
+            if caduca > ahora:
+                break
+            del self.resaltados[id_pedido]
+            self.resaltado_expirado.emit(id_pedido)
+        if not self.resaltados:
+            self.timer_resaltado.stop()
@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+# Copia local de los pedidos del panel en SQLite. Al arrancar, la lista se pinta con los
+# pedidos guardados y el cursor de su última sincronización, sin esperar al servidor (en el
+# plan gratuito de Render puede tardar casi un minuto en despertar); después la sincronización
+# normal pide solo los cambios desde ese cursor. La copia es de una vista (los filtros de la
+# lista): si al arrancar la vista es otra (p. ej. ha cambiado el día), se empieza de cero.
+#
+# Los cambios hechos sin conexión con el servidor se guardan en una cola, en orden, y el
+# panel los vuelve a enviar cuando el servidor responde. Si el servidor rechaza alguno, la
+# copia se marca para recargarla entera: tiene cambios que el servidor no ha aceptado.
+
+RUTA_ESPEJO = os.path.join(os.path.expanduser("~"), ".panel_pedidos", "pedidos.sqlite3")
+
+
+class EspejoPedidos:
+    def __init__(self, ruta=RUTA_ESPEJO):
+        self.ruta = ruta
+        self.conexion = None
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            self.conexion = sqlite3.connect(ruta)
+            with self.conexion:
+                self.conexion.execute("CREATE TABLE IF NOT EXISTS pedidos (id INTEGER PRIMARY KEY, datos TEXT NOT NULL)")
+                self.conexion.execute("CREATE TABLE IF NOT EXISTS estado (clave TEXT PRIMARY KEY, valor TEXT)")
+                self.conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS pendientes (n INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "metodo TEXT NOT NULL, url TEXT NOT NULL, cuerpo TEXT, creado TEXT)")
+        except Exception as e:
+            # Sin copia local el panel funciona igual que antes, solo contra el servidor
+            print("No se pudo abrir la copia local de los pedidos:", e)
+            self.conexion = None
+
+    def valor(self, clave):
+        fila = self.conexion.execute("SELECT valor FROM estado WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    # (pedidos, cursor) guardados de esa vista; ([], 0) si la copia es de otra vista
+    def leer(self, vista):
+        if self.conexion is None:
+            return [], 0
+        try:
+            if self.valor("vista") != json.dumps(vista, sort_keys=True):
+                return [], 0
+            pedidos = [json.loads(datos) for (datos,) in self.conexion.execute("SELECT datos FROM pedidos")]
+            return pedidos, int(self.valor("cursor") or 0)
+        except Exception as e:
+            print("No se pudo leer la copia local de los pedidos:", e)
+            return [], 0
+
+    # Guarda los pedidos y las bajas de una sincronización en una sola transacción. Con
+    # "completo" los pedidos sustituyen a toda la copia; con "cursor" None no se cambia el
+    # cursor (cambios hechos en el panel que el servidor aún no ha confirmado).
+    def guardar(self, vista, cursor=None, pedidos=(), eliminados=(), completo=False):
+        if self.conexion is None:
+            return
+        try:
+            with self.conexion:
+                if completo:
+                    self.conexion.execute("DELETE FROM pedidos")
+                    self.conexion.execute("DELETE FROM estado WHERE clave = 'recargar'")
+                self.conexion.executemany(
+                    "INSERT OR REPLACE INTO pedidos (id, datos) VALUES (?, ?)",
+                    [(p["id"], json.dumps(p, ensure_ascii=False)) for p in pedidos if p.get("id") is not None])
+                self.conexion.executemany("DELETE FROM pedidos WHERE id = ?", [(i,) for i in eliminados])
+                self.conexion.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('vista', ?)",
+                                      (json.dumps(vista, sort_keys=True),))
+                if cursor is not None:
+                    self.conexion.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('cursor', ?)",
+                                          (str(cursor),))
+        except Exception as e:
+            print("No se pudo guardar la copia local de los pedidos:", e)
+
+    # Tras un cambio pendiente rechazado por el servidor; se quita al guardar una copia completa
+    def pedir_recarga(self):
+        if self.conexion is None:
+            return
+        with self.conexion:
+            self.conexion.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('recargar', '1')")
+
+    def recarga_pedida(self):
+        if self.conexion is None:
+            return False
+        return self.valor("recargar") == "1"
+
+    # Al cambiar de vista la copia anterior ya no sirve
+    def vaciar(self, vista):
+        self.guardar(vista, 0, completo=True)
+
+    def encolar(self, metodo, url, cuerpo):
+        if self.conexion is None:
+            return False
+        try:
+            with self.conexion:
+                self.conexion.execute(
+                    "INSERT INTO pendientes (metodo, url, cuerpo, creado) VALUES (?, ?, ?, ?)",
+                    (metodo, url, json.dumps(cuerpo, ensure_ascii=False), datetime.now().isoformat()))
+            return True
+        except Exception as e:
+            print("No se pudo guardar el cambio pendiente:", e)
+            return False
+
+    # El cambio pendiente más antiguo: (n, metodo, url, cuerpo) o None si no hay ninguno
+    def primero(self):
+        if self.conexion is None:
+            return None
+        fila = self.conexion.execute("SELECT n, metodo, url, cuerpo FROM pendientes ORDER BY n LIMIT 1").fetchone()
+        if fila is None:
+            return None
+        n, metodo, url, cuerpo = fila
+        return n, metodo, url, json.loads(cuerpo)
+
+    def quitar(self, n):
+        if self.conexion is None:
+            return
+        with self.conexion:
+            self.conexion.execute("DELETE FROM pendientes WHERE n = ?", (n,))
+
+    def pendientes(self):
+        if self.conexion is None:
+            return 0
+        return self.conexion.execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
+
+    def cerrar(self):
+        if self.conexion is not None:
+            self.conexion.close()
+            self.conexion = None
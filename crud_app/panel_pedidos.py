@@ -1,33 +1,273 @@
 import sys
+import json
+import threading
+from bisect import bisect_left
 from datetime import datetime, time
 
 import requests
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QTabWidget, QPushButton, QListWidget, QListWidgetItem, QLineEdit,
-    QInputDialog, QMessageBox, QDialog, QComboBox
+    QTabWidget, QPushButton, QListWidget, QListWidgetItem, QListView, QLineEdit,
+    QInputDialog, QMessageBox, QDialog, QComboBox, QCheckBox, QAbstractItemView
 )
-from PySide6.QtCore import Qt, QTimer
+from PySide6.QtCore import Qt, QTimer, QObject, Signal, QAbstractListModel, QModelIndex
 from PySide6.QtGui import QColor, QIcon
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
-from collections import Counter
-from playsound import playsound
+from red import ClienteApi
+from avisos import AvisosPedidos
+from platos import CatalogoPanel
+from espejo import EspejoPedidos
 import numpy as np
 
-#Diccionario con los platos disponibles
-PLATOS = {
-    "1": "Spaghetti alla Carbonara",
-    "2": "Pasta al Pomodoro",
-    "3": "Fettuccine Alfredo",
-    "4": "Penne al Pesto con Pollo",
-    "5": "Pizza Margherita",
-    "6": "Pizza Prosciutto e Funghi",
-    "7": "Lasagna Tradicional",
-    "8": "Risotto ai Frutti di Mare",
-    "9": "Ensalada Caprese",
-    "10": "Saltimbocca alla Romana"
-}
+#Platos disponibles: el menú del servidor, guardado en disco y revalidado en segundo plano
+catalogo = CatalogoPanel()
+
+TIPOS_PEDIDO = ("reserva", "pedido_para_llevar")
+
+
+# Los productos llegan como líneas {"plato_id", "cantidad"}; el texto solo se genera al mostrarlos
+def texto_producto(linea):
+    if isinstance(linea, str):
+        return linea
+    nombre = catalogo.platos.get(linea.get("plato_id")) or linea.get("nombre") or "Plato desconocido"
+    return f"{nombre} (x{linea.get('cantidad', 1)})"
+
+
+def texto_pedido(pedido):
+    tipo = pedido.get("tipo", "").replace("_", " ").title()
+    nombre = pedido.get("nombre", "")
+    hora = pedido.get("hora", "")
+    telefono = pedido.get("telefono", "")
+
+    item_text = (
+        f"ID {pedido.get('id')}\n"
+        f"📌 {tipo} | {nombre} | {hora}\n"
+        f"📱 {telefono}\n"
+    )
+
+    if pedido.get("tipo") == "reserva":
+        fecha = pedido.get("fecha")
+        if fecha:
+            item_text += f"📅 Fecha: {fecha}\n"
+        personas = pedido.get("personas")
+        if personas:
+            item_text += f"👥 Personas: {personas}\n"
+
+    productos = pedido.get("productos", [])
+    if productos:
+        item_text += "🍽️ Productos:\n"
+        for producto in productos:
+            item_text += f"   - {texto_producto(producto)}\n"
+
+    if pedido.get("tipo") == "pedido_para_llevar":
+        estado = pedido.get("estado", "")
+        if estado:
+            item_text += f"📦 Estado: {estado}\n"
+    return item_text
+
+
+# Modelo de la lista de pedidos indexado por ID. Los cambios se aplican fila a fila
+# (insertar, actualizar, quitar), así la vista conserva la selección y el scroll y
+# cada refresco solo cuesta lo que ha cambiado.
+class ModeloPedidos(QAbstractListModel):
+    ROL_ID = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.ids = []          # IDs ordenados, uno por fila
+        self.pedidos = {}      # ID -> pedido
+        self.textos = {}       # ID -> texto ya formateado
+        self.resaltados = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.ids):
+            return None
+        id_pedido = self.ids[index.row()]
+        if role == Qt.DisplayRole:
+            return self.textos[id_pedido]
+        if role == Qt.BackgroundRole and id_pedido in self.resaltados:
+            return QColor("#DDE6ED")
+        if role == self.ROL_ID:
+            return id_pedido
+        return None
+
+    def pedido(self, id_pedido):
+        return self.pedidos.get(id_pedido)
+
+    def fila(self, id_pedido):
+        fila = bisect_left(self.ids, id_pedido)
+        if fila < len(self.ids) and self.ids[fila] == id_pedido:
+            return fila
+        return -1
+
+    # Inserta o actualiza un pedido; devuelve True si es nuevo en la lista
+    def actualizar(self, pedido):
+        id_pedido = pedido.get("id")
+        if id_pedido is None:
+            return False
+        if id_pedido in self.pedidos:
+            self.pedidos[id_pedido] = pedido
+            texto = texto_pedido(pedido)
+            if texto != self.textos[id_pedido]:
+                self.textos[id_pedido] = texto
+                indice = self.index(self.fila(id_pedido))
+                self.dataChanged.emit(indice, indice)
+            return False
+        fila = bisect_left(self.ids, id_pedido)
+        self.beginInsertRows(QModelIndex(), fila, fila)
+        self.ids.insert(fila, id_pedido)
+        self.pedidos[id_pedido] = pedido
+        self.textos[id_pedido] = texto_pedido(pedido)
+        self.endInsertRows()
+        return True
+
+    def eliminar(self, id_pedido):
+        fila = self.fila(id_pedido)
+        if fila < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), fila, fila)
+        del self.ids[fila]
+        del self.pedidos[id_pedido]
+        del self.textos[id_pedido]
+        self.resaltados.discard(id_pedido)
+        self.endRemoveRows()
+
+    # Sustituye el contenido por la lista completa recibida, aplicando solo las diferencias
+    def sincronizar(self, pedidos):
+        recibidos = {p.get("id") for p in pedidos}
+        for id_pedido in [i for i in self.ids if i not in recibidos]:
+            self.eliminar(id_pedido)
+        return [p.get("id") for p in pedidos if self.actualizar(p)]
+
+    # Carga de una vez una lista completa en el modelo vacío (la copia local al arrancar)
+    def cargar(self, pedidos):
+        self.beginResetModel()
+        self.pedidos = {p["id"]: p for p in pedidos if p.get("id") is not None}
+        self.ids = sorted(self.pedidos)
+        self.textos = {id_pedido: texto_pedido(p) for id_pedido, p in self.pedidos.items()}
+        self.resaltados = set()
+        self.endResetModel()
+
+    # Vuelve a formatear todos los pedidos (al cambiar los nombres de los platos del menú)
+    def refrescar_textos(self):
+        for id_pedido, pedido in self.pedidos.items():
+            self.textos[id_pedido] = texto_pedido(pedido)
+        if self.ids:
+            self.dataChanged.emit(self.index(0), self.index(len(self.ids) - 1))
+
+    def vaciar(self):
+        self.beginResetModel()
+        self.ids = []
+        self.pedidos = {}
+        self.textos = {}
+        self.resaltados = set()
+        self.endResetModel()
+
+    def resaltar(self, id_pedido, activo=True):
+        if activo:
+            self.resaltados.add(id_pedido)
+        elif id_pedido in self.resaltados:
+            self.resaltados.discard(id_pedido)
+        else:
+            return
+        fila = self.fila(id_pedido)
+        if fila >= 0:
+            indice = self.index(fila)
+            self.dataChanged.emit(indice, indice, [Qt.BackgroundRole])
+
+
+# Escucha el flujo /api/pedidos/eventos (Server-Sent Events) en un hilo aparte y emite
+# los cambios recibidos. Si la conexión se cae, reintenta con espera exponencial
+# reanudando desde el último cursor conocido.
+# El hilo no toca el panel (los widgets solo se leen en el hilo de la interfaz): el panel le
+# pasa el cursor y los filtros de la vista al iniciar y al reconectar, y cada cursor nuevo
+# con anotar_cursor.
+class SuscriptorEventos(QObject):
+    cambios_recibidos = Signal(dict)
+    estado_conexion = Signal(bool)
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self.cursor = 0
+        self.filtros = {}
+        self.lock = threading.Lock()
+        self.conectado = False
+        self.detenido = threading.Event()
+        self.generacion = 0
+        self.respuesta = None
+        # Sesión propia: la conexión del flujo queda ocupada mientras dura la suscripción
+        self.sesion = requests.Session()
+
+    def iniciar(self, cursor, filtros):
+        self.anotar_cursor(cursor, filtros)
+        threading.Thread(target=self.escuchar, daemon=True).start()
+
+    # Cursor (y filtros) desde los que se reanuda la próxima conexión
+    def anotar_cursor(self, cursor, filtros=None):
+        with self.lock:
+            self.cursor = cursor
+            if filtros is not None:
+                self.filtros = dict(filtros)
+
+    def detener(self):
+        self.detenido.set()
+
+    # Cierra la conexión actual para volver a suscribirse con ese cursor y esos filtros.
+    # Los eventos que aún lleguen por la conexión anterior se descartan.
+    def reconectar(self, cursor, filtros):
+        self.anotar_cursor(cursor, filtros)
+        self.generacion += 1
+        respuesta = self.respuesta
+        if respuesta is not None:
+            try:
+                respuesta.close()
+            except Exception:
+                pass
+
+    def cambiar_estado(self, conectado):
+        if conectado != self.conectado:
+            self.conectado = conectado
+            self.estado_conexion.emit(conectado)
+
+    def escuchar(self):
+        espera = 1
+        while not self.detenido.is_set():
+            generacion = self.generacion
+            try:
+                with self.lock:
+                    cursor, filtros = self.cursor, self.filtros
+                with self.sesion.get(self.url, params=filtros,
+                                     headers={"Last-Event-ID": str(cursor)},
+                                     stream=True, timeout=(5, 60)) as response:
+                    self.respuesta = response
+                    if response.status_code != 200:
+                        raise Exception(f"Respuesta {response.status_code}")
+                    self.cambiar_estado(True)
+                    espera = 1
+                    datos = []
+                    for linea in response.iter_lines(decode_unicode=True):
+                        if self.detenido.is_set() or generacion != self.generacion:
+                            break
+                        if linea.startswith("data:"):
+                            datos.append(linea[5:].strip())
+                        elif not linea and datos:
+                            self.cambios_recibidos.emit(json.loads("\n".join(datos)))
+                            datos = []
+            except Exception as e:
+                if generacion == self.generacion:
+                    print("Error en el flujo de eventos:", e)
+            self.respuesta = None
+            if generacion != self.generacion:
+                # Reconexión pedida por el panel: se vuelve a suscribir sin esperar
+                continue
+            self.cambiar_estado(False)
+            self.detenido.wait(espera)
+            espera = min(espera * 2, 30)
 
 
 class EstadoDialog(QDialog):
@@ -55,6 +295,7 @@ class DialogoEditarProductos(QDialog):
         super().__init__(parent)
         self.setWindowTitle("Editar productos del pedido")
         self.setMinimumSize(450, 300)
+        # Cantidades por plato_id (o por nombre si el plato ya no está en el menú)
         self.productos = {}
 
         layout = QVBoxLayout(self)
@@ -66,7 +307,8 @@ class DialogoEditarProductos(QDialog):
 
         # Combo para seleccionar producto
         self.combo_producto = QComboBox()
-        self.combo_producto.addItems(PLATOS.values())
+        for plato_id, nombre in catalogo.platos.items():
+            self.combo_producto.addItem(nombre, plato_id)
 
         # Campo para cantidad
         self.input_cantidad = QLineEdit()
@@ -87,19 +329,20 @@ class DialogoEditarProductos(QDialog):
 
         # Cargar productos existentes si hay
         if productos_existentes:
-            for prod in productos_existentes:
-                if " (x" in prod:
-                    nombre = prod.split(" (x")[0]
-                    cantidad = int(prod.split(" (x")[1].replace(")", ""))
-                else:
-                    nombre = prod
-                    cantidad = 1
-                self.productos[nombre] = cantidad
+            for linea in productos_existentes:
+                if isinstance(linea, str):
+                    # Pedido aún sin migrar en el servidor: "Nombre (xN)"
+                    nombre, _, resto = linea.rpartition(" (x")
+                    linea = {"plato_id": catalogo.platos_por_nombre.get(nombre), "nombre": nombre,
+                             "cantidad": int(resto.rstrip(")") or 1)} if nombre else {"nombre": linea}
+                clave = linea.get("plato_id") or linea.get("nombre")
+                self.productos[clave] = self.productos.get(clave, 0) + linea.get("cantidad", 1)
             self.actualizar_lista()
 
     def actualizar_lista(self):
         self.lista_productos.clear()
-        for nombre, cantidad in self.productos.items():
+        for clave, cantidad in self.productos.items():
+            nombre = catalogo.platos.get(clave, clave)
             item = QListWidgetItem(f"{nombre} (x{cantidad})")
             widget = QWidget()
             layout = QHBoxLayout(widget)
@@ -108,8 +351,8 @@ class DialogoEditarProductos(QDialog):
             label.setEnabled(False)
             btn_sumar = QPushButton("+")
             btn_restar = QPushButton("-")
-            btn_sumar.clicked.connect(lambda _, n=nombre: self.modificar_cantidad(n, 1))
-            btn_restar.clicked.connect(lambda _, n=nombre: self.modificar_cantidad(n, -1))
+            btn_sumar.clicked.connect(lambda _, c=clave: self.modificar_cantidad(c, 1))
+            btn_restar.clicked.connect(lambda _, c=clave: self.modificar_cantidad(c, -1))
             layout.addWidget(label)
             layout.addWidget(btn_sumar)
             layout.addWidget(btn_restar)
@@ -117,31 +360,37 @@ class DialogoEditarProductos(QDialog):
             self.lista_productos.addItem(item)
             self.lista_productos.setItemWidget(item, widget)
 
-    def modificar_cantidad(self, nombre, cambio):
-        if nombre in self.productos:
-            self.productos[nombre] += cambio
-            if self.productos[nombre] <= 0:
-                del self.productos[nombre]
+    def modificar_cantidad(self, clave, cambio):
+        if clave in self.productos:
+            self.productos[clave] += cambio
+            if self.productos[clave] <= 0:
+                del self.productos[clave]
         self.actualizar_lista()
 
     def anadir_producto(self):
-        nombre = self.combo_producto.currentText()
+        plato_id = self.combo_producto.currentData()
         try:
             cantidad = int(self.input_cantidad.text().strip())
         except ValueError:
             QMessageBox.warning(self, "Error", "Cantidad inválida")
             return
 
-        if not nombre or cantidad <= 0:
+        if not plato_id or cantidad <= 0:
             QMessageBox.warning(self, "Error", "Nombre y cantidad deben ser válidos.")
             return
 
-        self.productos[nombre] = self.productos.get(nombre, 0) + cantidad
+        self.productos[plato_id] = self.productos.get(plato_id, 0) + cantidad
         self.input_cantidad.clear()
         self.actualizar_lista()
 
     def obtener_productos(self):
-        return [f"{n} (x{c})" for n, c in self.productos.items()]
+        lineas = []
+        for clave, cantidad in self.productos.items():
+            if clave in catalogo.platos:
+                lineas.append({"plato_id": clave, "cantidad": cantidad})
+            else:
+                lineas.append({"plato_id": None, "nombre": clave, "cantidad": cantidad})
+        return lineas
 
 
 class PanelPedidosCRUD(QMainWindow):
@@ -156,6 +405,11 @@ class PanelPedidosCRUD(QMainWindow):
         if not self.api_url:
             QMessageBox.critical(self, "Error", "No se ha definido la variable de entorno API_PEDIDOS_URL.")
             sys.exit(1)
+        self.url_estadisticas = self.api_url.replace("/api/pedidos", "/api/estadisticas")
+        self.url_menu = self.api_url.replace("/api/pedidos", "/api/menu")
+
+        # Todas las peticiones HTTP se hacen en segundo plano para no congelar la ventana
+        self.api = ClienteApi()
 
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
@@ -168,25 +422,59 @@ class PanelPedidosCRUD(QMainWindow):
         self.init_pedidos()
         self.init_estadisticas()
 
-        self.ids_anteriores = set()
-        self.resaltados = {}
-        self.lista_pedidos.itemSelectionChanged.connect(self.quitar_resaltado_seleccionado)
+        # Sonido y resaltado de los pedidos nuevos, agrupados en un solo aviso por ráfaga
+        self.avisos = AvisosPedidos("Notificacion.wav", parent=self)
+        self.avisos.aviso.connect(self.mostrar_aviso)
+        self.avisos.resaltado_expirado.connect(lambda i: self.modelo_pedidos.resaltar(i, False))
+
+        # La lista se pinta ya con la copia local (SQLite) de la última sesión; la sincronización
+        # pide después al servidor solo los cambios desde su cursor
+        self.fecha_vista = datetime.now().strftime("%d-%m-%Y")
+        self.espejo = EspejoPedidos()
+        pedidos, self.cursor = self.espejo.leer(self.filtros_vista())
+        self.modelo_pedidos.cargar(pedidos)
+
+        self.lista_pedidos.selectionModel().currentChanged.connect(self.quitar_resaltado_seleccionado)
+        self.tabs.currentChanged.connect(self.cambiar_pestana)
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.actualizar_automatica)
         self.timer.start(6500)
 
+        # El menú guardado en disco ya está cargado; se revalida al arrancar y cada 10 minutos
+        self.revalidar_menu()
+        self.timer_menu = QTimer(self)
+        self.timer_menu.timeout.connect(self.revalidar_menu)
+        self.timer_menu.start(10 * 60 * 1000)
+
+        # Los cambios llegan por el flujo de eventos; el temporizador solo sondea si está caído
+        self.suscriptor = SuscriptorEventos(self.api_url + "/eventos")
+        self.suscriptor.cambios_recibidos.connect(self.recibir_cambios)
+        self.suscriptor.estado_conexion.connect(self.cambiar_conexion)
+        self.suscriptor.iniciar(self.cursor, self.filtros_vista())
+
     def init_pedidos(self):
         layout = QVBoxLayout(self.widget_pedidos)
 
-        self.lista_pedidos = QListWidget()
+        # Vista por defecto: solo reservas de hoy y pedidos de hoy aún no entregados
+        self.check_activos_hoy = QCheckBox("Solo pedidos activos de hoy")
+        self.check_activos_hoy.setChecked(True)
+        self.check_activos_hoy.toggled.connect(self.cambiar_vista)
+        layout.addWidget(self.check_activos_hoy)
+
+        self.modelo_pedidos = ModeloPedidos(self)
+        self.lista_pedidos = QListView()
+        self.lista_pedidos.setModel(self.modelo_pedidos)
+        self.lista_pedidos.setAlternatingRowColors(False)
+        # Con Ctrl/Mayús se pueden seleccionar varios pedidos para cambiarlos o borrarlos a la vez
+        self.lista_pedidos.setSelectionMode(QAbstractItemView.ExtendedSelection)
         layout.addWidget(self.lista_pedidos)
 
         botones = QHBoxLayout()
         self.boton_cargar = QPushButton("🔄 Cargar")
         self.boton_editar = QPushButton("✏️ Editar seleccionado")
         self.boton_estado = QPushButton("🔁 Cambiar estado")
-        self.boton_borrar = QPushButton("🗑️ Eliminar seleccionado")
+        self.boton_borrar = QPushButton("🗑️ Eliminar seleccionados")
 
         self.boton_cargar.clicked.connect(self.cargar_pedidos)
         self.boton_editar.clicked.connect(self.editar_pedido)
@@ -205,95 +493,116 @@ class PanelPedidosCRUD(QMainWindow):
         layout.addWidget(self.canvas)
         self.ax, self.ax2, self.ax3 = self.canvas.figure.subplots(1, 3)
 
+        # Las barras se crean una vez y después solo se actualizan sus alturas
+        self.barras_tipos = self.ax.bar(TIPOS_PEDIDO, [0] * len(TIPOS_PEDIDO), color=["skyblue", "lightgreen"])
+        self.ax.set_title("Reservas vs Pedidos")
+        self.ax.set_ylabel("Cantidad")
+        self.barras_productos = None
+        self.nombres_productos = []
+        self.barras_reservas = None
+        self.barras_pedidos = None
+        self.franjas_dibujadas = []
+        self.estadisticas_dibujadas = None
+
         self.boton_actualizar = QPushButton("🔁 Actualizar estadísticas")
-        self.boton_actualizar.clicked.connect(self.mostrar_estadisticas)
+        self.boton_actualizar.clicked.connect(lambda: self.mostrar_estadisticas(avisar_errores=True))
         layout.addWidget(self.boton_actualizar)
 
-    def quitar_resaltado_seleccionado(self):
-        item = self.lista_pedidos.currentItem()
-        if item and item.background() == QColor("#DDE6ED"):
-            item.setBackground(Qt.white)
+    def quitar_resaltado_seleccionado(self, actual, _anterior=None):
+        if actual.isValid():
+            id_pedido = actual.data(ModeloPedidos.ROL_ID)
+            self.avisos.quitar_resaltado(id_pedido)
+            self.modelo_pedidos.resaltar(id_pedido, False)
+
+    # Pedido seleccionado en la lista (o None)
+    def pedido_seleccionado(self):
+        indice = self.lista_pedidos.currentIndex()
+        if not indice.isValid():
+            return None
+        return self.modelo_pedidos.pedido(indice.data(ModeloPedidos.ROL_ID))
+
+    # Pedidos seleccionados, en el orden de la lista
+    def pedidos_seleccionados(self):
+        filas = sorted(self.lista_pedidos.selectionModel().selectedRows(), key=lambda i: i.row())
+        return [self.modelo_pedidos.pedido(i.data(ModeloPedidos.ROL_ID)) for i in filas]
+
+    # Resumen de la respuesta de una operación en lote (los pedidos que ya no existían)
+    def resumen_lote(self, response, hecho):
+        resultados = response.json().get("resultados", [])
+        no_encontrados = [r["id"] for r in resultados if r.get("resultado") == "no_encontrado"]
+        mensaje = f"{len(resultados) - len(no_encontrados)} pedidos {hecho}."
+        if no_encontrados:
+            mensaje += "\nYa no existían: " + ", ".join(str(i) for i in no_encontrados)
+        return mensaje
+
+    # Parámetros de consulta de la vista actual; el filtrado se hace en el servidor
+    def filtros_vista(self):
+        if not self.check_activos_hoy.isChecked():
+            return {}
+        return {"fecha": self.fecha_vista, "excluir_estado": "entregado"}
+
+    # Al cambiar de vista (o de día) se descarta la copia local y se sincroniza desde cero
+    def cambiar_vista(self):
+        self.fecha_vista = datetime.now().strftime("%d-%m-%Y")
+        self.modelo_pedidos.vaciar()
+        self.cursor = 0
+        self.espejo.vaciar(self.filtros_vista())
+        self.suscriptor.reconectar(self.cursor, self.filtros_vista())
+        self.cargar_pedidos()
+
+    def aplicar_cambios(self, cambios):
+        if cambios.get("completo"):
+            nuevos = self.modelo_pedidos.sincronizar(cambios.get("pedidos", []))
+            self.cursor = cambios.get("cursor", 0)
+        else:
+            nuevos = [p.get("id") for p in cambios.get("pedidos", []) if self.modelo_pedidos.actualizar(p)]
+            for id_pedido in cambios.get("eliminados", []):
+                self.modelo_pedidos.eliminar(id_pedido)
+            # Puede llegar una respuesta más antigua que el último evento recibido
+            self.cursor = max(self.cursor, cambios.get("cursor", 0))
+        self.suscriptor.anotar_cursor(self.cursor)
+        self.espejo.guardar(self.filtros_vista(), self.cursor, cambios.get("pedidos", []),
+                            cambios.get("eliminados", []), completo=bool(cambios.get("completo")))
+        self.avisar_nuevos(nuevos)
+        # Los cambios de pedidos afectan a las estadísticas: se refrescan si se están viendo
+        if (cambios.get("pedidos") or cambios.get("eliminados")) and self.estadisticas_visibles():
+            self.mostrar_estadisticas()
 
     def cargar_pedidos(self):
-        self.lista_pedidos.clear()
         url = self.api_url
         if not url:
             return
-        try:
-            response = requests.get(url)
+
+        # Un 304 significa que no hay cambios desde la última consulta con este cursor
+        def al_terminar(response):
             if response.status_code == 200:
-                nuevos_ids = set()
-                self.pedidos_actuales = response.json()
-                for pedido in self.pedidos_actuales:
-                    nuevos_ids.add(str(pedido.get("id")))
-                    tipo = pedido.get("tipo", "").replace("_", " ").title()
-                    nombre = pedido.get("nombre", "")
-                    hora = pedido.get("hora", "")
-                    telefono = pedido.get("telefono", "")
-
-                    item_text = (
-                        f"ID {pedido.get('id')}\n"
-                        f"📌 {tipo} | {nombre} | {hora}\n"
-                        f"📱 {telefono}\n"
-                    )
-
-                    if pedido.get("tipo") == "reserva":
-                        fecha = pedido.get("fecha")
-                        if fecha:
-                            item_text += f"📅 Fecha: {fecha}\n"
-                        personas = pedido.get("personas")
-                        if personas:
-                            item_text += f"👥 Personas: {personas}\n"
-
-                    productos = pedido.get("productos", [])
-                    if productos:
-                        item_text += "🍽️ Productos:\n"
-                        for producto in productos:
-                            item_text += f"   - {producto}\n"
-
-                    if pedido.get("tipo") == "pedido_para_llevar":
-                        estado = pedido.get("estado", "")
-                        if estado:
-                            item_text += f"📦 Estado: {estado}\n"
-
-                    item = QListWidgetItem(item_text)
-
-                    if str(pedido.get("id")) not in self.ids_anteriores:
-                        item.setBackground(QColor("#DDE6ED"))
-                        texto_clave = item.text()
-                        self.resaltados[texto_clave] = item
-                        playsound("Notificacion.wav", block=False)
-                        QTimer.singleShot(1500, lambda txt=texto_clave: self.restaurar_color_por_texto(txt))
-
-                    self.lista_pedidos.addItem(item)
-
-                self.ids_anteriores = nuevos_ids
-        except Exception as e:
-            print("Error:", e)
-
-    def restaurar_color_por_texto(self, texto):
-        item = self.resaltados.get(texto)
-        if item:
-            item.setBackground(Qt.white)
+                self.aplicar_cambios(response.json())
+
+        self.api.get("pedidos", url, al_terminar, params=dict(self.filtros_vista(), since=self.cursor))
+
+    def recibir_cambios(self, cambios):
+        self.aplicar_cambios(cambios)
+
+    # Resalta los pedidos que no se habían visto antes; el servicio de avisos los quita
+    # al caducar y hace sonar un único aviso por ráfaga
+    def avisar_nuevos(self, ids):
+        for id_pedido in self.avisos.nuevos(ids):
+            self.modelo_pedidos.resaltar(id_pedido)
+
+    def mostrar_aviso(self, cantidad):
+        texto = "🔔 1 pedido nuevo" if cantidad == 1 else f"🔔 {cantidad} pedidos nuevos"
+        self.statusBar().showMessage(texto, 5000)
 
     def editar_pedido(self):
-        item = self.lista_pedidos.currentItem()
-        if not item:
+        if not self.lista_pedidos.currentIndex().isValid():
             QMessageBox.warning(self, "Atención", "Selecciona un pedido primero.")
             return
 
-        texto = item.text()
-        id_linea = texto.split("\n")[0]
-        try:
-            id_pedido = int(id_linea.replace("ID ", "").strip())
-        except:
-            QMessageBox.critical(self, "Error", "No se pudo obtener el ID del pedido.")
-            return
-
-        pedido = next((p for p in self.pedidos_actuales if p.get("id") == id_pedido), None)
+        pedido = self.pedido_seleccionado()
         if not pedido:
             QMessageBox.critical(self, "Error", "Pedido no encontrado.")
             return
+        id_pedido = pedido.get("id")
 
         nuevo_nombre, ok = QInputDialog.getText(self, "Editar nombre", "Nuevo nombre:", text=pedido.get("nombre", ""))
         if not ok or not nuevo_nombre.strip():
@@ -359,8 +668,8 @@ class PanelPedidosCRUD(QMainWindow):
             del nuevos_datos["_id"]
 
         url = self.api_url.rstrip("/") + f"/{id_pedido}"
-        try:
-            response = requests.put(url, json=nuevos_datos)
+
+        def al_terminar(response):
             if response.status_code == 200:
                 # Comparar cambios y mostrar resumen
                 cambios = []
@@ -384,149 +693,252 @@ class PanelPedidosCRUD(QMainWindow):
 
                 QMessageBox.information(self, "Pedido actualizado", mensaje)
                 self.cargar_pedidos()
+            elif response.status_code == 409:
+                # La reserva no cabe en esa franja: el servidor propone las horas libres más cercanas
+                datos = response.json()
+                mensaje = datos.get("error", "No quedan plazas para esa reserva.")
+                if datos.get("sugerencias"):
+                    mensaje += "\n\nHoras con sitio ese día: " + ", ".join(datos["sugerencias"])
+                QMessageBox.warning(self, "Sin plazas", mensaje)
             else:
                 QMessageBox.critical(self, "Error", f"No se pudo actualizar: {response.text}")
-        except Exception as e:
-            QMessageBox.critical(self, "Error de conexión", str(e))
 
-    def cambiar_estado_pedido(self):
-        item = self.lista_pedidos.currentItem()
-        if not item:
-            QMessageBox.warning(self, "Atención", "Selecciona un pedido primero.")
+        self.enviar_cambio(f"editar:{id_pedido}", "PUT", url, nuevos_datos, al_terminar, pedidos=[nuevos_datos])
+
+    # Envía un cambio al servidor. Si no hay conexión (o ya hay cambios esperando, para no
+    # adelantarlos) se guarda en la cola de la copia local y se aplica ya en la lista: los
+    # "pedidos" como quedarían y los "eliminados" fuera. La cola se envía al volver el servidor.
+    def enviar_cambio(self, clave, metodo, url, cuerpo, al_terminar, pedidos=(), eliminados=()):
+        def al_fallar(error):
+            print("Sin conexión, el cambio queda pendiente:", error)
+            self.encolar_cambio(metodo, url, cuerpo, pedidos, eliminados)
+
+        if self.espejo.pendientes():
+            self.encolar_cambio(metodo, url, cuerpo, pedidos, eliminados)
+            self.enviar_pendientes()
             return
+        self.api.enviar(clave, metodo, url, al_terminar, al_fallar, json=cuerpo)
 
-        texto = item.text()
-        id_linea = texto.split("\n")[0]
-        try:
-            id_pedido = int(id_linea.replace("ID ", "").strip())
-        except:
-            QMessageBox.critical(self, "Error", "No se pudo obtener el ID del pedido.")
+    def encolar_cambio(self, metodo, url, cuerpo, pedidos=(), eliminados=()):
+        if not self.espejo.encolar(metodo, url, cuerpo):
+            QMessageBox.critical(self, "Error de conexión", "No se pudo contactar con el servidor.")
             return
+        for pedido in pedidos:
+            self.modelo_pedidos.actualizar(pedido)
+        for id_pedido in eliminados:
+            self.modelo_pedidos.eliminar(id_pedido)
+        self.espejo.guardar(self.filtros_vista(), None, pedidos, eliminados)
+        self.statusBar().showMessage(
+            f"📴 Sin conexión: {self.espejo.pendientes()} cambios se enviarán cuando vuelva el servidor", 8000)
+
+    # Envía los cambios pendientes de uno en uno y en orden. Un error del servidor (5xx) o de
+    # conexión deja la cola como está para el siguiente intento; si el servidor rechaza un
+    # cambio (p. ej. una reserva que ya no cabe) se avisa y se pasa al siguiente. El cambio
+    # rechazado ya se había aplicado en la lista y en la copia local, así que al vaciar la cola
+    # se recargan los pedidos desde cero.
+    def enviar_pendientes(self):
+        if self.api.en_marcha("pendientes"):
+            return
+        pendiente = self.espejo.primero()
+        if pendiente is None:
+            return
+        n, metodo, url, cuerpo = pendiente
+
+        def al_terminar(response):
+            if response.status_code >= 500:
+                return
+            self.espejo.quitar(n)
+            if response.status_code >= 400:
+                self.espejo.pedir_recarga()
+                QMessageBox.warning(self, "Cambio no aplicado",
+                                    f"El servidor ha rechazado un cambio hecho sin conexión: {response.text}")
+            if self.espejo.pendientes():
+                self.enviar_pendientes()
+            else:
+                self.statusBar().showMessage("✅ Cambios pendientes enviados", 5000)
+                if self.espejo.recarga_pedida():
+                    self.cursor = 0
+                self.cargar_pedidos()
+
+        self.api.enviar("pendientes", metodo, url, al_terminar,
+                        lambda e: print("Cambios pendientes sin enviar:", e), json=cuerpo)
+
+    def cambiar_conexion(self, conectado):
+        if conectado:
+            self.enviar_pendientes()
 
-        pedido = next((p for p in self.pedidos_actuales if p.get("id") == id_pedido), None)
-        if not pedido or pedido.get("tipo") != "pedido_para_llevar":
+    # Cambia el estado de todos los pedidos para llevar seleccionados con una sola petición;
+    # el servidor avisa por WhatsApp a cada cliente y la lista se refresca una vez
+    def cambiar_estado_pedido(self):
+        seleccionados = self.pedidos_seleccionados()
+        if not seleccionados:
+            QMessageBox.warning(self, "Atención", "Selecciona un pedido primero.")
+            return
+
+        pedidos = [p for p in seleccionados if p.get("tipo") == "pedido_para_llevar"]
+        if not pedidos:
             QMessageBox.warning(self, "Atención", "Solo se puede cambiar el estado de pedidos para llevar.")
             return
 
-        dlg = EstadoDialog(estado_actual=pedido.get("estado"))
+        estados = {p.get("estado") for p in pedidos}
+        dlg = EstadoDialog(estado_actual=estados.pop() if len(estados) == 1 else None)
         if dlg.exec():
-            nuevo_estado = dlg.obtener_estado()
-            nuevos_datos = pedido.copy()
-            nuevos_datos["estado"] = nuevo_estado
-            url = self.api_url + f"/{id_pedido}"
-            try:
-                response = requests.put(url, json=nuevos_datos)
+            ids = [p.get("id") for p in pedidos]
+            estado = dlg.obtener_estado()
+            datos = {"ids": ids, "cambios": {"estado": estado}}
+            url = self.api_url + "/bulk"
+
+            def al_terminar(response):
                 if response.status_code == 200:
-                    QMessageBox.information(self, "Éxito", "Estado actualizado correctamente.")
+                    mensaje = self.resumen_lote(response, "actualizados")
+                    if len(pedidos) < len(seleccionados):
+                        mensaje += "\nLas reservas seleccionadas no tienen estado y no se han cambiado."
+                    QMessageBox.information(self, "Éxito", mensaje)
                     self.cargar_pedidos()
                 else:
                     QMessageBox.critical(self, "Error", f"No se pudo actualizar estado: {response.text}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error de conexión", str(e))
+
+            self.enviar_cambio("estado:" + ",".join(map(str, ids)), "PATCH", url, datos, al_terminar,
+                               pedidos=[dict(p, estado=estado) for p in pedidos])
 
     def eliminar_pedido(self):
-        item = self.lista_pedidos.currentItem()
-        if not item:
+        pedidos = self.pedidos_seleccionados()
+        if not pedidos:
             return
-        confirmar = QMessageBox.question(self, "Confirmar eliminación", "¿Seguro que quieres eliminar este pedido?", QMessageBox.Yes | QMessageBox.No)
+        pregunta = ("¿Seguro que quieres eliminar este pedido?" if len(pedidos) == 1
+                    else f"¿Seguro que quieres eliminar estos {len(pedidos)} pedidos?")
+        confirmar = QMessageBox.question(self, "Confirmar eliminación", pregunta, QMessageBox.Yes | QMessageBox.No)
         if confirmar != QMessageBox.Yes:
             return
 
-        texto = item.text()
-        id_linea = texto.split("\n")[0]
-        try:
-            id_pedido = int(id_linea.replace("ID ", "").strip())
-        except:
-            QMessageBox.critical(self, "Error", "No se pudo obtener el ID del pedido.")
-            return
+        ids = [p.get("id") for p in pedidos]
+        url = self.api_url.strip().rstrip("/") + "/bulk"
 
-        url = self.api_url.strip().rstrip("/") + f"/{id_pedido}"
-        try:
-            response = requests.delete(url)
+        def al_terminar(response):
             if response.status_code == 200:
+                if len(ids) > 1:
+                    self.statusBar().showMessage(self.resumen_lote(response, "eliminados"), 5000)
                 self.cargar_pedidos()
             else:
                 QMessageBox.critical(self, "Error", f"No se pudo eliminar: {response.text}")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
 
-    def mostrar_estadisticas(self):
-        url = self.api_url
+        self.enviar_cambio("eliminar:" + ",".join(map(str, ids)), "DELETE", url, {"ids": ids}, al_terminar,
+                           eliminados=ids)
+
+    # La gráfica solo se actualiza si la pestaña de estadísticas está a la vista
+    def estadisticas_visibles(self):
+        return (self.isVisible() and not self.isMinimized()
+                and self.tabs.currentWidget() is self.widget_estadisticas)
+
+    def cambiar_pestana(self, _indice):
+        if self.estadisticas_visibles():
+            self.mostrar_estadisticas()
+
+    # Solo se muestran errores en ventana si se pidió con el botón; en la actualización
+    # automática un backend caído no debe abrir un aviso cada pocos segundos
+    def mostrar_estadisticas(self, avisar_errores=False):
+        url = self.url_estadisticas
         if not url:
             QMessageBox.warning(self, "Error", "Introduce la URL de la API.")
             return
-        try:
-            response = requests.get(url)
+
+        def al_fallar(e):
+            if avisar_errores:
+                QMessageBox.critical(self, "Error", f"No se pudo cargar estadísticas: {e}")
+            else:
+                print("Error al cargar estadísticas:", e)
+
+        def al_terminar(response):
+            # 304: los datos no han cambiado desde la última consulta
+            if response.status_code == 304:
+                return
             if response.status_code != 200:
-                raise Exception("Error de respuesta")
-
-            pedidos = response.json()
-            tipos = Counter(p["tipo"] for p in pedidos)
-            productos = Counter()
-            for p in pedidos:
-                for prod in p.get("productos", []):
-                    nombre = prod.split(" (x")[0]
-                    cantidad = int(prod.split(" (x")[1].replace(")", ""))
-                    productos[nombre] += cantidad
-
-            self.ax.clear()
+                al_fallar("Error de respuesta")
+                return
+            try:
+                self.dibujar_estadisticas(response.json())
+            except Exception as e:
+                al_fallar(e)
+
+        # El servidor devuelve ya los totales agregados, no la lista de pedidos
+        self.api.get("estadisticas", url, al_terminar, al_fallar)
+
+    # Actualiza las barras existentes en lugar de borrar y volver a dibujar los ejes.
+    # Si los totales son los mismos que ya se muestran no se repinta nada.
+    def dibujar_estadisticas(self, estadisticas):
+        tipos = estadisticas.get("tipos", {})
+        productos = estadisticas.get("productos", {})
+        franjas = estadisticas.get("franjas", {})
+        datos = (tipos, productos, franjas)
+        if datos == self.estadisticas_dibujadas:
+            return
+        self.estadisticas_dibujadas = datos
+
+        for barra, tipo in zip(self.barras_tipos, TIPOS_PEDIDO):
+            barra.set_height(tipos.get(tipo, 0))
+
+        nombres = list(productos.keys())
+        cantidades = list(productos.values())
+        if nombres != self.nombres_productos:
+            # Solo cambian las barras de productos cuando cambia la lista o su orden
             self.ax2.clear()
+            self.barras_productos = self.ax2.barh(nombres, cantidades, color="salmon") if nombres else None
+            self.ax2.set_title("Productos más vendidos")
+            self.ax2.set_xlabel("Unidades")
+            self.nombres_productos = nombres
+        elif self.barras_productos is not None:
+            for barra, cantidad in zip(self.barras_productos, cantidades):
+                barra.set_width(cantidad)
+
+        etiquetas = list(franjas.keys())
+        reservas = [franjas[f].get("reserva", 0) for f in etiquetas]
+        pedidos_por_franja = [franjas[f].get("pedido_para_llevar", 0) for f in etiquetas]
+        if etiquetas != self.franjas_dibujadas:
             self.ax3.clear()
-
-            self.ax.bar(tipos.keys(), tipos.values(), color=["skyblue", "lightgreen"])
-            self.ax.set_title("Reservas vs Pedidos")
-            self.ax.set_ylabel("Cantidad")
-
-            if productos:
-                nombres = list(productos.keys())
-                cantidades = list(productos.values())
-                self.ax2.barh(nombres, cantidades, color="salmon")
-                self.ax2.set_title("Productos más vendidos")
-                self.ax2.set_xlabel("Unidades")
-
-            franjas = ["13:00–16:00", "20:00–23:00"]
-            reservas = dict.fromkeys(franjas, 0)
-            pedidos_por_franja = dict.fromkeys(franjas, 0)
-
-            for p in pedidos:
-                hora = p.get("hora", "")[:5]
-                tipo = p.get("tipo")
-                try:
-                    h = int(hora.split(":")[0])
-                    if 13 <= h < 16:
-                        clave = "13:00–16:00"
-                    elif 20 <= h < 23:
-                        clave = "20:00–23:00"
-                    else:
-                        continue
-
-                    if tipo == "reserva":
-                        reservas[clave] += 1
-                    elif tipo == "pedido_para_llevar":
-                        pedidos_por_franja[clave] += 1
-                except:
-                    pass
-
-            x = np.arange(len(franjas))
-            self.ax3.bar(x, list(reservas.values()), width=0.4, label="Reservas", color="steelblue")
-            self.ax3.bar(x, list(pedidos_por_franja.values()), bottom=list(reservas.values()), width=0.4,
-                        label="Pedidos", color="mediumseagreen")
+            x = np.arange(len(etiquetas))
+            self.barras_reservas = self.ax3.bar(x, reservas, width=0.4, label="Reservas", color="steelblue")
+            self.barras_pedidos = self.ax3.bar(x, pedidos_por_franja, bottom=reservas, width=0.4,
+                                               label="Pedidos", color="mediumseagreen")
             self.ax3.set_xticks(x)
-            self.ax3.set_xticklabels(franjas, rotation=45)
+            self.ax3.set_xticklabels(etiquetas, rotation=45)
             self.ax3.set_title("Reservas vs Pedidos por Franja Horaria")
             self.ax3.set_ylabel("Cantidad")
             self.ax3.legend()
-
-            self.canvas.draw()
-
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo cargar estadísticas: {e}")
+            self.franjas_dibujadas = etiquetas
+        else:
+            for barra_r, barra_p, r, p in zip(self.barras_reservas, self.barras_pedidos, reservas, pedidos_por_franja):
+                barra_r.set_height(r)
+                barra_p.set_y(r)
+                barra_p.set_height(p)
+
+        for eje in (self.ax, self.ax2, self.ax3):
+            eje.relim()
+            eje.autoscale_view()
+        self.canvas.draw_idle()
 
     def actualizar_automatica(self):
         if not self.api_url:
             return
-        self.cargar_pedidos()
-        self.mostrar_estadisticas()
+        if self.check_activos_hoy.isChecked() and self.fecha_vista != datetime.now().strftime("%d-%m-%Y"):
+            self.cambiar_vista()
+        # Sondeo de respaldo: solo si el flujo de eventos no está conectado
+        if not self.suscriptor.conectado:
+            self.cargar_pedidos()
+        if self.espejo.pendientes():
+            self.enviar_pendientes()
+        # Con la pestaña oculta no se piden estadísticas; a la vista la consulta es
+        # condicional y si nada ha cambiado el servidor responde 304 sin datos
+        if self.estadisticas_visibles():
+            self.mostrar_estadisticas()
+
+    def revalidar_menu(self):
+        catalogo.revalidar(self.api, self.url_menu, self.modelo_pedidos.refrescar_textos)
+
+    def closeEvent(self, event):
+        self.suscriptor.detener()
+        self.api.cancelar_pendientes()
+        self.espejo.cerrar()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,80 @@
+import json
+import os
+
+# Menú de platos del panel. La última versión recibida de GET /api/menu se guarda en disco,
+# así que el panel arranca (y el diálogo de productos se abre) con el menú sin esperar a la
+# red. Al arrancar y de vez en cuando se revalida con If-None-Match: si el menú no ha
+# cambiado el servidor contesta 304 sin cuerpo.
+
+# Menú que se usa si aún no hay ninguno guardado en disco
+PLATOS_INICIALES = {
+    "1": "Spaghetti alla Carbonara",
+    "2": "Pasta al Pomodoro",
+    "3": "Fettuccine Alfredo",
+    "4": "Penne al Pesto con Pollo",
+    "5": "Pizza Margherita",
+    "6": "Pizza Prosciutto e Funghi",
+    "7": "Lasagna Tradicional",
+    "8": "Risotto ai Frutti di Mare",
+    "9": "Ensalada Caprese",
+    "10": "Saltimbocca alla Romana"
+}
+
+RUTA_CATALOGO = os.path.join(os.path.expanduser("~"), ".panel_pedidos", "menu.json")
+
+
+class CatalogoPanel:
+    def __init__(self, ruta=RUTA_CATALOGO):
+        self.ruta = ruta
+        self.version = 0
+        self.etag = None
+        self.aplicar(PLATOS_INICIALES, 0)
+        self.leer_disco()
+
+    def aplicar(self, platos, version):
+        self.platos = dict(platos)
+        self.platos_por_nombre = {nombre: n for n, nombre in self.platos.items()}
+        self.version = version
+
+    def leer_disco(self):
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                guardado = json.load(f)
+            self.aplicar({p["id"]: p["nombre"] for p in guardado["platos"]}, guardado.get("version", 0))
+            self.etag = guardado.get("etag")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("No se pudo leer el menú guardado:", e)
+
+    # Se escribe en un fichero temporal y se renombra, para no dejar nunca un fichero a medias
+    def guardar_disco(self):
+        try:
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            temporal = self.ruta + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": self.version,
+                    "etag": self.etag,
+                    "platos": [{"id": n, "nombre": nombre} for n, nombre in self.platos.items()]
+                }, f, ensure_ascii=False)
+            os.replace(temporal, self.ruta)
+        except Exception as e:
+            print("No se pudo guardar el menú:", e)
+
+    # Revalida el menú en segundo plano con el ClienteApi del panel. "al_cambiar" se llama
+    # (en el hilo de la interfaz) solo si ha llegado una versión nueva.
+    def revalidar(self, api, url, al_cambiar=None):
+        cabeceras = {"If-None-Match": self.etag} if self.etag else {}
+
+        def al_terminar(response):
+            if response.status_code != 200:
+                return
+            datos = response.json()
+            self.aplicar({p["id"]: p["nombre"] for p in datos.get("platos", [])}, datos.get("version", 0))
+            self.etag = response.headers.get("ETag")
+            self.guardar_disco()
+            if al_cambiar:
+                al_cambiar()
+
+        api.get("menu", url, al_terminar, lambda e: print("No se pudo revalidar el menú:", e), headers=cabeceras)
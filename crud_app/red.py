@@ -0,0 +1,115 @@
+import requests
+from requests.adapters import HTTPAdapter
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+TIMEOUT_PETICIONES = (5, 20)
+
+
+class SenalesTarea(QObject):
+    terminado = Signal(object, object)
+
+
+# Petición HTTP ejecutada en un hilo del QThreadPool. El resultado (respuesta o excepción)
+# se emite por señal y Qt lo entrega en el hilo de la interfaz.
+class TareaHttp(QRunnable):
+    def __init__(self, sesion, metodo, url, kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.sesion = sesion
+        self.metodo = metodo
+        self.url = url
+        self.kwargs = kwargs
+        self.senales = SenalesTarea()
+
+    def run(self):
+        try:
+            respuesta = self.sesion.request(self.metodo, self.url, timeout=TIMEOUT_PETICIONES, **self.kwargs)
+            self.senales.terminado.emit(respuesta, None)
+        except Exception as e:
+            self.senales.terminado.emit(None, e)
+
+
+# Capa de peticiones en segundo plano para el panel. Cada petición lleva una clave
+# (p. ej. "pedidos" o "estadisticas"):
+# - si ya hay en curso una petición idéntica con la misma clave, no se lanza otra;
+# - si se lanza una distinta, la anterior queda sustituida: se cancela si aún no había
+#   empezado y, si ya estaba en marcha, su resultado se descarta al llegar.
+# Todas las peticiones comparten una sesión con conexiones persistentes, y los GET repetidos
+# envían el ETag de la última respuesta (If-None-Match): si nada ha cambiado el servidor
+# contesta 304 sin cuerpo y el callback recibe esa respuesta.
+class ClienteApi(QObject):
+    def __init__(self, max_hilos=4):
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_hilos)
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_maxsize=max_hilos)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+        self.generaciones = {}
+        self.en_curso = {}
+        self.tareas = set()
+        # Clave -> (firma de la petición, ETag de su última respuesta)
+        self.validadores = {}
+
+    def enviar(self, clave, metodo, url, al_terminar, al_fallar=None, **kwargs):
+        firma = (metodo, url, repr(sorted(kwargs.items())))
+        actual = self.en_curso.get(clave)
+        if actual is not None:
+            if actual[0] == firma:
+                return
+            if self.pool.tryTake(actual[1]):
+                self.tareas.discard(actual[1])
+
+        validador = self.validadores.get(clave)
+        if metodo == "GET" and validador and validador[0] == firma:
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"If-None-Match": validador[1]})
+
+        generacion = self.generaciones.get(clave, 0) + 1
+        self.generaciones[clave] = generacion
+        tarea = TareaHttp(self.sesion, metodo, url, kwargs)
+        tarea.senales.terminado.connect(
+            lambda respuesta, error: self.finalizar(clave, firma, generacion, tarea, respuesta, error,
+                                                    al_terminar, al_fallar)
+        )
+        self.en_curso[clave] = (firma, tarea)
+        self.tareas.add(tarea)
+        self.pool.start(tarea)
+
+    def get(self, clave, url, al_terminar, al_fallar=None, **kwargs):
+        self.enviar(clave, "GET", url, al_terminar, al_fallar, **kwargs)
+
+    def put(self, clave, url, al_terminar, al_fallar=None, **kwargs):
+        self.enviar(clave, "PUT", url, al_terminar, al_fallar, **kwargs)
+
+    def patch(self, clave, url, al_terminar, al_fallar=None, **kwargs):
+        self.enviar(clave, "PATCH", url, al_terminar, al_fallar, **kwargs)
+
+    def delete(self, clave, url, al_terminar, al_fallar=None, **kwargs):
+        self.enviar(clave, "DELETE", url, al_terminar, al_fallar, **kwargs)
+
+    def finalizar(self, clave, firma, generacion, tarea, respuesta, error, al_terminar, al_fallar):
+        self.tareas.discard(tarea)
+        if self.en_curso.get(clave, (None, None))[1] is tarea:
+            del self.en_curso[clave]
+        if generacion != self.generaciones.get(clave):
+            return
+        if respuesta is not None and firma[0] == "GET" and respuesta.status_code == 200:
+            if respuesta.headers.get("ETag"):
+                self.validadores[clave] = (firma, respuesta.headers["ETag"])
+            else:
+                self.validadores.pop(clave, None)
+        if error is not None:
+            if al_fallar:
+                al_fallar(error)
+            else:
+                print("Error:", error)
+        else:
+            al_terminar(respuesta)
+
+    def en_marcha(self, clave):
+        return clave in self.en_curso
+
+    # Descarta las peticiones que aún no han empezado (al cerrar el panel)
+    def cancelar_pendientes(self):
+        self.pool.clear()